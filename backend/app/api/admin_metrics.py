@@ -0,0 +1,46 @@
+"""
+Endpoints administrativos para métricas de integrações (por processo).
+"""
+
+from fastapi import APIRouter, HTTPException, Depends
+from app.core.uazapi_client import uazapi_client
+from app.core.jwt_auth import require_admin
+from app.services.buffer_service import BufferService
+
+router = APIRouter()
+
+@router.get("/admin/metrics/uazapi")
+def get_uazapi_metrics(user: dict = Depends(require_admin)):
+    """
+    Retorna latência, erros e retries das chamadas à Uazapi por endpoint.
+    Os contadores são do processo que atendeu a requisição.
+    
+    **Autenticação obrigatória:** Envie header `Authorization: Bearer {token}`
+    """
+    try:
+        return {
+            "success": True,
+            "stats": uazapi_client.get_stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/admin/metrics/webhook")
+def get_webhook_metrics(user: dict = Depends(require_admin)):
+    """
+    Retorna quantos webhooks duplicados (reentregas da Uazapi) foram descartados.
+    O contador fica no Redis e soma todos os processos.
+    
+    **Autenticação obrigatória:** Envie header `Authorization: Bearer {token}`
+    """
+    try:
+        duplicados = BufferService().client.get("metrics:webhook:duplicates")
+        return {
+            "success": True,
+            "stats": {
+                "duplicates_dropped": int(duplicados or 0)
+            }
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
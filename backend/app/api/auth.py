@@ -12,6 +12,7 @@ from google_auth_oauthlib.flow import Flow
 from dotenv import load_dotenv
 from app.core.security import encrypt_token 
 from app.core.database import get_supabase
+from app.services.calendar_list_cache_service import calendar_list_cache
 
 load_dotenv()  # Carrega variáveis do .env
 
@@ -102,6 +103,9 @@ def callback_google(request: Request):
             'calendar_refresh_token': encrypted_refresh_token 
         }).eq('id', clinic_id).execute()
 
+        # Conta nova/reconectada: a lista de calendários pode ter mudado
+        calendar_list_cache.invalidate(clinic_id)
+
         # Redirecionar de volta para o Frontend (Dashboard)
         return RedirectResponse("https://agendaiasync.com.br/dashboard")
 
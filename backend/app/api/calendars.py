@@ -2,12 +2,20 @@
 Endpoint para listar calendários disponíveis na conta conectada.
 """
 
+import os
 from fastapi import APIRouter, HTTPException
 from app.services.factory import get_calendar_service
-from app.core.database import get_supabase
+from app.services.availability_cache_service import availability_cache
+from app.services.calendar_mirror_service import calendar_mirror
+from app.services.calendar_list_cache_service import calendar_list_cache
+from app.core.executor import run_parallel_parcial
+from app.core.database import get_supabase, TIMEZONE_BR
 
 router = APIRouter()
 
+# Tempo máximo de espera pelos eventos dos calendários (o que não chegar fica de fora)
+CALENDAR_FETCH_TIMEOUT = float(os.getenv("CALENDAR_FETCH_TIMEOUT", "8"))
+
 @router.get("/calendars/list/{clinic_id}")
 def list_calendars(clinic_id: str):
     """
@@ -20,6 +28,9 @@ def list_calendars(clinic_id: str):
         # 2. Chama o método de listar (que já implementamos no GoogleCalendarService)
         # O GoogleCalendarService.listar_calendarios() retorna uma lista de dicts {'id': ..., 'summary': ...}
         calendars = calendar_service.listar_calendarios()
+
+        # Lista sempre atualizada aqui (onboarding); aproveita para renovar o cache da agenda
+        calendar_list_cache.set(clinic_id, calendars)
         
         return {"calendars": calendars}
         
@@ -56,13 +67,17 @@ def list_events(clinic_id: str, start: str, end: str, calendar_id: str = None):
             raise HTTPException(status_code=400, detail="Data final deve ser maior que inicial")
 
         all_events = []
+        incompletos = []
 
         # LÓGICA DE BUSCA
         supabase = get_supabase()
         
         if calendar_id:
             # Busca única (Comportamento antigo/específico)
-            events = calendar_service.listar_eventos_periodo(dt_start, dt_end, calendar_id)
+            espelho = calendar_mirror.ler_periodo(clinic_id, [calendar_id], dt_start, dt_end)
+            events = espelho.get(calendar_id)
+            if events is None:
+                events = calendar_service.listar_eventos_periodo(dt_start, dt_end, calendar_id)
             all_events.extend(events)
         else:
             # Busca Múltipla (Itera sobre todos os calendários)
@@ -79,8 +94,8 @@ def list_events(clinic_id: str, start: str, end: str, calendar_id: str = None):
                     if p.get('external_calendar_id'):
                         mapa_profissionais[p['external_calendar_id']] = p
 
-            # B. Pega a lista de calendários disponíveis no Google
-            available_calendars = calendar_service.listar_calendarios()
+            # B. Pega a lista de calendários disponíveis no Google (em cache por clínica)
+            available_calendars = calendar_list_cache.get(clinic_id, calendar_service)
             
             # Identifica qual é REALMENTE o calendário principal
             primary_cal_id = next((c['id'] for c in available_calendars if c.get('primary')), None)
@@ -93,6 +108,11 @@ def list_events(clinic_id: str, start: str, end: str, calendar_id: str = None):
             if not primary_cal_id and available_calendars:
                 primary_cal_id = available_calendars[0]['id']
 
+            # Calendários dos profissionais com espelho em dia não vão à API
+            # (o espelho usa o ID cadastrado no profissional, que pode ser 'primary')
+            espelho = calendar_mirror.ler_periodo(clinic_id, list(mapa_profissionais), dt_start, dt_end)
+
+            selecionados = []
             for cal in available_calendars:
                 cal_id = cal['id']
                 is_main_cal = (cal_id == primary_cal_id)
@@ -110,37 +130,55 @@ def list_events(clinic_id: str, start: str, end: str, calendar_id: str = None):
                 if not is_main_cal and not is_professional:
                     continue
 
-                try:
-                    # 2. Busca eventos deste calendário específico
-                    events = calendar_service.listar_eventos_periodo(dt_start, dt_end, cal_id)
+                selecionados.append((cal, is_main_cal))
+
+            # 2. Busca os eventos dos calendários fora do espelho em paralelo.
+            # Calendário lento ou com erro fica de fora (resposta parcial).
+            eventos_por_calendario = {}
+            tarefas = {}
+            for cal, is_main_cal in selecionados:
+                id_espelho = 'primary' if is_main_cal and cal['id'] not in espelho else cal['id']
+                if id_espelho in espelho:
+                    eventos_por_calendario[cal['id']] = espelho[id_espelho]
+                else:
+                    tarefas[cal['id']] = (calendar_service.listar_eventos_periodo, dt_start, dt_end, cal['id'])
+
+            if tarefas:
+                eventos_por_calendario.update(
+                    run_parallel_parcial(tarefas, timeout=CALENDAR_FETCH_TIMEOUT, etapa="Eventos")
+                )
+
+            for cal, is_main_cal in selecionados:
+                cal_id = cal['id']
+                events = eventos_por_calendario.get(cal_id)
+                if events is None:
+                    incompletos.append(cal_id)
+                    continue
+
+                # 3. Enriquece evento com metadados
+                for event in events:
+                    event['calendarId'] = cal_id
+                    event['calendarSummary'] = cal.get('summary', 'Agenda')
                     
-                    # 3. Enriquece evento com metadados
-                    for event in events:
-                        event['calendarId'] = cal_id
-                        event['calendarSummary'] = cal.get('summary', 'Agenda')
+                    # Se for calendário de um médico, sobrescreve nome com o do médico
+                    prof = None
+                    if cal_id in mapa_profissionais:
+                        prof = mapa_profissionais.get(cal_id)
+                    elif is_main_cal and 'primary' in mapa_profissionais:
+                        prof = mapa_profissionais.get('primary')
                         
-                        # Se for calendário de um médico, sobrescreve nome com o do médico
-                        prof = None
-                        if cal_id in mapa_profissionais:
-                            prof = mapa_profissionais.get(cal_id)
-                        elif is_main_cal and 'primary' in mapa_profissionais:
-                            prof = mapa_profissionais.get('primary')
-                            
-                        if prof:
-                            event['profissional_nome'] = prof['nome']
-                            event['profissional_id'] = prof['id']
-                            event['calendarSummary'] = prof['nome'] # Mostra nome do médico no front
-                        
-                        if 'backgroundColor' in cal:
-                            event['color'] = cal['backgroundColor'] 
-                    
-                    all_events.extend(events)
+                    if prof:
+                        event['profissional_nome'] = prof['nome']
+                        event['profissional_id'] = prof['id']
+                        event['calendarSummary'] = prof['nome'] # Mostra nome do médico no front
                     
-                except Exception as e_cal:
-                    print(f"⚠️ Erro ao ler eventos do calendário {cal_id}: {e_cal}")
-                    continue
+                    if 'backgroundColor' in cal:
+                        event['color'] = cal['backgroundColor'] 
+                
+                all_events.extend(events)
 
-        return {"events": all_events}
+        # calendarios_incompletos: calendários que não responderam a tempo (resultado parcial)
+        return {"events": all_events, "calendarios_incompletos": incompletos}
 
     except HTTPException:
         raise
@@ -158,6 +196,8 @@ def delete_event(clinic_id: str, event_id: str, calendar_id: str = "primary"):
         success = service.cancelar_evento(calendar_id, event_id)
         if not success:
              raise HTTPException(status_code=500, detail="Falha ao cancelar evento no Google")
+        # A data do evento não é conhecida aqui: invalida o calendário inteiro
+        availability_cache.invalidate_calendar(clinic_id, calendar_id)
         return {"status": "deleted", "id": event_id}
     except Exception as e:
         print(f"❌ Erro ao deletar evento: {e}")
@@ -177,6 +217,8 @@ def update_event(clinic_id: str, event_id: str, body: dict, calendar_id: str = "
         # O Frontend deve mandar { summary: "...", description: "..." } ou { start: { dateTime: ... } }
         
         updated_event = service.atualizar_evento(calendar_id, event_id, body)
+        # A data antiga do evento não é conhecida aqui: invalida o calendário inteiro
+        availability_cache.invalidate_calendar(clinic_id, calendar_id)
         return updated_event
     except Exception as e:
         print(f"❌ Erro ao atualizar evento: {e}")
@@ -236,6 +278,10 @@ def create_event(clinic_id: str, body: dict, calendar_id: str = "primary"):
             descricao=body.get("description", ""),
             duracao_minutos=duracao_minutos
         )
+
+        # Datas no fuso da clínica (o front pode mandar em UTC)
+        datas_evento = {d.astimezone(TIMEZONE_BR).date() if d.tzinfo else d.date() for d in (start_dt, end_dt)}
+        availability_cache.invalidate(clinic_id, calendar_id, sorted(datas_evento))
         
         return new_event
         
@@ -0,0 +1,23 @@
+"""
+    Rotas auxiliares de clínicas usadas pelo painel.
+"""
+
+from fastapi import APIRouter, HTTPException
+from app.services.clinic_cache_service import clinic_cache
+from app.services.clinic_context_service import clinic_context
+
+router = APIRouter()
+
+@router.post("/clinics/{clinic_id}/context/invalidate")
+def invalidate_clinic_context(clinic_id: str):
+    """
+    Descarta o cache da clínica (roteamento e contexto do agente).
+    O painel chama após salvar dados da clínica, dias fechados ou profissionais,
+    já que essas escritas vão direto para o Supabase.
+    """
+    try:
+        clinic_cache.invalidate(clinic_id)
+        clinic_context.invalidate(clinic_id)
+        return {"status": "invalidated"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
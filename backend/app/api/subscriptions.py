@@ -5,6 +5,7 @@ from app.core.database import get_supabase
 from dateutil.relativedelta import relativedelta
 from app.services.payment_service import atualizar_vencimento_assinatura_asaas
 from app.services.plan_limit_service import enforce_professional_limit
+from app.services.clinic_cache_service import clinic_cache
 
 router = APIRouter()
 supabase = get_supabase()
@@ -172,6 +173,7 @@ def sync_subscription(clinic_id: str):
                 if plano_novo_query and plano_novo_query.data:
                     tokens_novo = plano_novo_query.data['max_tokens']
                     supabase.table('clinicas').update({'saldo_tokens': tokens_novo}).eq('id', clinic_id).execute()
+                    clinic_cache.invalidate(clinic_id)
                 
                 return {"status": "switched", "new_plan": sessao['plan_id']}
             
@@ -252,6 +254,7 @@ def check_expiration(clinic_id: str):
                 .update({'ia_ativa': False})\
                 .eq('id', clinic_id)\
                 .execute()
+            clinic_cache.invalidate(clinic_id)
                 
             return {"status": "expired"}
             
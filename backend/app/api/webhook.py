@@ -7,7 +7,6 @@
 import json
 import asyncio
 import os
-import requests
 from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter, Request, BackgroundTasks, HTTPException, Depends
@@ -15,13 +14,16 @@ from fastapi.responses import StreamingResponse
 from app.core.security import verify_global_password
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from app.services.tasks import processar_mensagem_ia
 from app.services.history_service import HistoryService
 from app.services.buffer_service import BufferService
-from app.services.audio_service import AudioService
-from app.services.image_service import ImageService
 from app.core.database import get_supabase
 from app.core.rate_limiter import rate_limiter
+from app.core.executor import run_blocking
+from app.core.uazapi_client import uazapi_client
+from app.services.clinic_cache_service import clinic_cache
+from app.services.token_ledger_service import token_ledger
+from app.services.sse_service import sse_manager
+from app.core.celery_app import celery_app
 
 load_dotenv()
 
@@ -39,31 +41,11 @@ UAZAPI_WEBHOOK_EVENTS = os.getenv("UAZAPI_WEBHOOK_EVENTS", "messages")
 UAZAPI_WEBHOOK_EXCLUDES = os.getenv("UAZAPI_WEBHOOK_EXCLUDES", "wasSentByApi,isGroupYes")
 
 buffer_service = BufferService()
-BUFFER_DELAY = 10  # Segundos de espera
 
-class SseManager:
-    def __init__(self):
-        self._subscribers = {}
+# Janela de deduplicação de webhooks reenviados pela Uazapi
+WEBHOOK_DEDUP_TTL = int(os.getenv("WEBHOOK_DEDUP_TTL", "86400"))
+WEBHOOK_DUPLICATES_KEY = "metrics:webhook:duplicates"
 
-    def subscribe(self, clinic_id: str) -> asyncio.Queue:
-        queue: asyncio.Queue = asyncio.Queue()
-        self._subscribers.setdefault(clinic_id, set()).add(queue)
-        return queue
-
-    def unsubscribe(self, clinic_id: str, queue: asyncio.Queue):
-        if clinic_id in self._subscribers:
-            self._subscribers[clinic_id].discard(queue)
-            if not self._subscribers[clinic_id]:
-                del self._subscribers[clinic_id]
-
-    async def broadcast(self, clinic_id: str, message: dict):
-        for queue in list(self._subscribers.get(clinic_id, set())):
-            try:
-                queue.put_nowait(message)
-            except Exception:
-                self.unsubscribe(clinic_id, queue)
-
-sse_manager = SseManager()
 
 def _pick_first(*values):
     for value in values:
@@ -148,24 +130,11 @@ def _infer_media_type_from_string(value: Optional[str]):
         return "file"
     return None
 
-def get_uazapi_headers(token: str):
-    return {
-        "Content-Type": "application/json",
-        "token": token.strip() if token else token
-    }
-
-def get_uazapi_admin_headers(token: str):
-    return {
-        "Content-Type": "application/json",
-        "admintoken": token.strip() if token else token
-    }
-
 def configure_uazapi_webhook(token: str):
     if not UAZAPI_WEBHOOK_URL:
         print("⚠️ UAZAPI_WEBHOOK_URL não configurado; webhook não será definido.")
         return False
     try:
-        webhook_url = f"{UAZAPI_URL}/webhook"
         events = [e.strip() for e in UAZAPI_WEBHOOK_EVENTS.split(",") if e.strip()]
         excludes = [e.strip() for e in UAZAPI_WEBHOOK_EXCLUDES.split(",") if e.strip()]
         webhook_payload = {
@@ -174,10 +143,11 @@ def configure_uazapi_webhook(token: str):
             "events": events,
             "excludeMessages": excludes,
         }
-        webhook_resp = requests.post(
-            webhook_url,
+        webhook_resp = uazapi_client.post(
+            "/webhook",
             json=webhook_payload,
-            headers=get_uazapi_headers(token),
+            token=token,
+            idempotent=True,
         )
         if webhook_resp.status_code in [200, 201]:
             print("✅ Webhook Uazapi configurado com sucesso.")
@@ -200,16 +170,51 @@ def configure_uazapi_webhook(token: str):
         print(f"⚠️ Erro ao configurar webhook: {e}")
     return False
 
+def _format_sse(event_id: int, message: dict, event: Optional[str] = None) -> str:
+    frame = f"id: {event_id}\n"
+    if event:
+        frame += f"event: {event}\n"
+    return frame + f"data: {json.dumps(message)}\n\n"
+
 @router.get("/sse/clinics/{clinic_id}", dependencies=[Depends(verify_global_password)])
-async def clinic_sse(clinic_id: str):
+async def clinic_sse(clinic_id: str, request: Request, last_event_id: Optional[str] = None):
+    """
+    Stream SSE da clínica. Na reconexão o navegador envia o header Last-Event-ID
+    (ou o front pode mandar ?last_event_id=) e reenviamos só os eventos perdidos.
+    """
+    # Assina antes do replay para não perder eventos publicados no meio do caminho
     queue = sse_manager.subscribe(clinic_id)
 
+    raw_last_id = request.headers.get("last-event-id") or last_event_id
+    try:
+        last_id = int(raw_last_id) if raw_last_id else None
+    except ValueError:
+        last_id = None
+
     async def event_stream():
+        ultimo_enviado = last_id or 0
         try:
+            if last_id is not None:
+                try:
+                    eventos, completo, seq_atual = await sse_manager.replay(clinic_id, last_id)
+                    if not completo:
+                        # Backlog não cobre o intervalo: o front precisa recarregar o histórico
+                        base_id = eventos[0][0] - 1 if eventos else seq_atual
+                        yield _format_sse(base_id, {"type": "resync"}, event="resync")
+                        ultimo_enviado = base_id
+                    for event_id, message in eventos:
+                        yield _format_sse(event_id, message)
+                        ultimo_enviado = event_id
+                except Exception as e:
+                    print(f"⚠️ [SSE] Erro no replay: {e}")
+
             while True:
                 try:
-                    message = await asyncio.wait_for(queue.get(), timeout=15)
-                    yield f"data: {json.dumps(message)}\n\n"
+                    event_id, message = await asyncio.wait_for(queue.get(), timeout=15)
+                    if event_id <= ultimo_enviado:
+                        continue  # Já enviado no replay
+                    yield _format_sse(event_id, message)
+                    ultimo_enviado = event_id
                 except asyncio.TimeoutError:
                     yield ": ping\n\n"
         finally:
@@ -219,12 +224,8 @@ async def clinic_sse(clinic_id: str):
 
 def get_clinic_uazapi_token(clinic_id: str):
     try:
-        resp = supabase.table('clinicas')\
-            .select('uazapi_token')\
-            .eq('id', clinic_id)\
-            .single()\
-            .execute()
-        return resp.data.get('uazapi_token') if resp.data else None
+        clinica = clinic_cache.get_by_id(clinic_id)
+        return clinica.get('uazapi_token') if clinica else None
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar clínica: {e}")
 
@@ -259,14 +260,12 @@ def create_uazapi_instance(clinic_id: str):
         webhook_ok = configure_uazapi_webhook(existing_token)
         return {"status": "already_created", "token": existing_token, "webhook_configured": webhook_ok}
 
-    url = f"{UAZAPI_URL}/instance/init"
     body = {
         "name": clinic_id,
         "systemName": UAZAPI_SYSTEM_NAME,
     }
 
-    headers = get_uazapi_admin_headers(admin_token)
-    response = requests.post(url, json=body, headers=headers)
+    response = uazapi_client.post("/instance/init", json=body, admin_token=admin_token)
     if response.status_code not in [200, 201]:
         error_text = response.text
         # print(
@@ -311,6 +310,8 @@ def create_uazapi_instance(clinic_id: str):
     if getattr(update_resp, "error", None):
         raise HTTPException(status_code=500, detail=str(update_resp.error))
 
+    clinic_cache.invalidate(clinic_id, token)
+
     # Configurar webhook da instância automaticamente
     configure_uazapi_webhook(token)
 
@@ -325,12 +326,11 @@ def connect_uazapi_instance(clinic_id: str, body: ConnectInstanceBody):
     if not token:
         return {"status": "not_configured"}
 
-    url = f"{UAZAPI_URL}/instance/connect"
     payload = {}
     if body.phone:
         payload["phone"] = body.phone
 
-    response = requests.post(url, json=payload, headers=get_uazapi_headers(token))
+    response = uazapi_client.post("/instance/connect", json=payload, token=token)
     if response.status_code not in [200, 201]:
         raise HTTPException(status_code=500, detail=response.text)
 
@@ -348,10 +348,9 @@ def find_uazapi_messages(clinic_id: str, body: MessageFindBody):
     if not token:
         return {"status": "not_configured"}
 
-    url = f"{UAZAPI_URL}/message/find"
     payload = body.dict(exclude_none=True)
 
-    response = requests.post(url, json=payload, headers=get_uazapi_headers(token))
+    response = uazapi_client.post("/message/find", json=payload, token=token, idempotent=True)
     if response.status_code not in [200, 201]:
         raise HTTPException(status_code=500, detail=response.text)
 
@@ -364,7 +363,7 @@ async def send_uazapi_message(clinic_id: str, body: SendMessageBody):
     if not UAZAPI_URL:
         raise HTTPException(status_code=500, detail="UAZAPI_URL não configurado")
 
-    token = get_clinic_uazapi_token(clinic_id)
+    token = await run_blocking(get_clinic_uazapi_token, clinic_id)
     if not token:
         return {"status": "not_configured"}
 
@@ -378,7 +377,6 @@ async def send_uazapi_message(clinic_id: str, body: SendMessageBody):
         text = (body.text or "").strip()
         if not text:
             raise HTTPException(status_code=400, detail="Texto vazio")
-        url = f"{UAZAPI_URL}/send/text"
         payload = {
             "number": number,
             "text": text,
@@ -387,15 +385,13 @@ async def send_uazapi_message(clinic_id: str, body: SendMessageBody):
             "presence": "composing",
             "linkPreview": False,
         }
-        response = requests.post(url, json=payload, headers=get_uazapi_headers(token))
+        response = await uazapi_client.apost("/send/text", json=payload, token=token)
         if response.status_code not in [200, 201]:
             raise HTTPException(status_code=500, detail=response.text)
-        supabase.table('chat_messages').insert({
-            'clinic_id': clinic_id,
-            'session_id': number,
-            'quem_enviou': 'ai',
-            'conteudo': text
-        }).execute()
+        await run_blocking(
+            HistoryService(clinic_id=clinic_id, session_id=number).add_ai_message,
+            text
+        )
         await sse_manager.broadcast(clinic_id, {
             "type": "message",
             "message": {
@@ -418,7 +414,6 @@ async def send_uazapi_message(clinic_id: str, body: SendMessageBody):
     file_base64 = body.media_base64 or ""
     if "," in file_base64:
         file_base64 = file_base64.split(",", 1)[1]
-    url = f"{UAZAPI_URL}/send/media"
     payload = {
         "number": number,
         "type": media_type,
@@ -430,7 +425,7 @@ async def send_uazapi_message(clinic_id: str, body: SendMessageBody):
         "delay": 1500,
     }
     payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.post(url, json=payload, headers=get_uazapi_headers(token))
+    response = await uazapi_client.apost("/send/media", json=payload, token=token, timeout=60)
     if response.status_code not in [200, 201]:
         raise HTTPException(status_code=500, detail=response.text)
 
@@ -460,12 +455,10 @@ async def send_uazapi_message(clinic_id: str, body: SendMessageBody):
         "caption": body.caption,
         "dataUrl": media_data_url,
     })
-    supabase.table('chat_messages').insert({
-        'clinic_id': clinic_id,
-        'session_id': number,
-        'quem_enviou': 'ai',
-        'conteudo': conteudo_historico
-    }).execute()
+    await run_blocking(
+        HistoryService(clinic_id=clinic_id, session_id=number).add_ai_message,
+        conteudo_historico
+    )
     await sse_manager.broadcast(clinic_id, {
         "type": "message",
         "message": {
@@ -495,8 +488,7 @@ def status_uazapi_instance(clinic_id: str):
     if not token:
         return {"status": "not_configured"}
 
-    url = f"{UAZAPI_URL}/instance/status"
-    response = requests.get(url, headers=get_uazapi_headers(token))
+    response = uazapi_client.get("/instance/status", token=token)
     if response.status_code in [401, 404]:
         # Evita limpar o token em falhas transitórias e mantém a instância no painel.
         return {"status": "disconnected"}
@@ -519,17 +511,12 @@ def download_uazapi_message(clinic_id: str, message_id: str):
     if not message_id:
         raise HTTPException(status_code=400, detail="message_id é obrigatório")
 
-    url = f"{UAZAPI_URL}/message/download"
-    headers = {
-        "Content-Type": "application/json",
-        "token": token,
-    }
     payload = {
         "id": message_id,
         "return_base64": True,
         "generate_mp3": False,
     }
-    response = requests.post(url, json=payload, headers=headers, timeout=15)
+    response = uazapi_client.post("/message/download", json=payload, token=token, idempotent=True)
     if response.status_code != 200:
         raise HTTPException(status_code=response.status_code, detail=response.text)
 
@@ -556,8 +543,7 @@ def delete_uazapi_instance(clinic_id: str):
     if not token:
         return {"status": "not_configured"}
 
-    url = f"{UAZAPI_URL}/instance"
-    response = requests.delete(url, headers=get_uazapi_headers(token))
+    response = uazapi_client.delete("/instance", token=token)
     if response.status_code not in [200, 201]:
         raise HTTPException(status_code=500, detail=response.text)
 
@@ -569,82 +555,123 @@ def delete_uazapi_instance(clinic_id: str):
     if getattr(update_resp, "error", None):
         raise HTTPException(status_code=500, detail=str(update_resp.error))
 
+    clinic_cache.invalidate(clinic_id, token)
+
     return {"status": "deleted"}
 
-def enviar_mensagem_whatsapp(token: str, number: str, text: str):
-    """Função auxiliar para enviar mensagem de texto via Uazapi"""
+def _buscar_lead(clinic_id: str, telefone_cliente: str):
+    """
+    Retorna (status_ia, precisa_criar) do lead.
+    """
+    lead_resp = supabase.table('leads')\
+        .select('id, status_ia')\
+        .eq('clinic_id', clinic_id)\
+        .eq('telefone', telefone_cliente)\
+        .limit(1)\
+        .execute()
+    if not lead_resp.data:
+        return True, True
+    return lead_resp.data[0].get('status_ia', True), False
+
+def _saldo_disponivel(clinic_id: str, saldo_tokens: int, tokens_comprados: int) -> int:
+    """
+    Saldo do banco (via cache) menos o consumo que o ledger ainda não aplicou.
+    Se o Redis falhar, vale o saldo do banco.
+    """
+    saldo = max(saldo_tokens or 0, 0) + max(tokens_comprados or 0, 0)
     try:
-        url = f"{UAZAPI_URL}/send/text"
-        payload = {
-            "number": number,
-            "text": text,
-            "readmessages": True,
-            "delay": 0,
-            "presence": "composing",
-            "linkPreview": False,
+        return saldo - token_ledger.tokens_pendentes(clinic_id)
+    except Exception as e:
+        print(f"⚠️ Erro ao ler consumo pendente do ledger: {e}")
+        return saldo
+
+def _verificar_rate_limit(clinic_id: str):
+    """
+    Aplica as 4 camadas do rate limiter (todas fazem INCR no Redis).
+    Retorna None se liberado ou o dict de resposta do webhook se bloqueado.
+    """
+    is_blocked, ttl = rate_limiter.is_clinic_blocked(clinic_id)
+    
+    if is_blocked:
+        print(f"🚫 [RateLimit] Requisição bloqueada - Clínica {clinic_id} (TTL: {ttl}s)")
+        return {
+            "status": "rate_limit_blocked",
+            "message": f"Clínica temporariamente bloqueada. Aguarde {ttl} segundos.",
+            "retry_after": ttl
+        }
+    
+    global_allowed, global_msg = rate_limiter.check_global_rate_limit()
+    
+    if not global_allowed:
+        print(f"🚨 [RateLimit] GLOBAL LIMIT - Requisição negada")
+        return {
+            "status": "rate_limit_global",
+            "message": global_msg
+        }
+    
+    allowed, msg = rate_limiter.check_rate_limit_per_clinic(clinic_id)
+    
+    if not allowed:
+        print(f"⚠️ [RateLimit] Rate limit excedido - Clínica {clinic_id}")
+        return {
+            "status": "rate_limit_exceeded",
+            "message": msg
         }
-        response = requests.post(url, json=payload, headers=get_uazapi_headers(token))
-        return response.status_code in [200, 201]
+    
+    burst_allowed, burst_msg = rate_limiter.check_burst_protection(clinic_id)
+    
+    if not burst_allowed:
+        print(f"⚠️ [RateLimit] Burst detectado - Clínica {clinic_id}")
+        return {
+            "status": "rate_limit_burst",
+            "message": burst_msg
+        }
+
+    return None
+
+def _registrar_entrega(uazapi_token: str, message_id: str) -> bool:
+    """
+    SET NX da mensagem no Redis. Retorna False se ela já foi recebida
+    (reentrega da Uazapi) e conta o descarte na métrica de duplicados.
+    """
+    try:
+        novo = buffer_service.client.set(
+            f"webhook:dedup:{uazapi_token}:{message_id}", 1, nx=True, ex=WEBHOOK_DEDUP_TTL
+        )
+        if not novo:
+            buffer_service.client.incr(WEBHOOK_DUPLICATES_KEY)
+        return bool(novo)
     except Exception as e:
-        print(f"❌ Erro ao enviar mensagem WhatsApp: {e}")
-        return False
+        # Sem Redis, melhor processar em dobro do que perder a mensagem
+        print(f"⚠️ [Dedup] Erro ao registrar mensagem: {e}")
+        return True
 
-async def esperar_e_processar(clinic_id: str, telefone_cliente: str, token_instancia: str, lid: str):
+def _liberar_entrega(uazapi_token: str, message_id: str):
     """
-    Função assíncrona que aguarda o tempo do buffer e depois dispara o processamento.
+    Remove a marca de deduplicação para que a reentrega seja processada
+    (usado quando o processamento falhou antes de concluir).
     """
     try:
-        print(f"⏳ [Buffer] Iniciando timer de {BUFFER_DELAY}s para {telefone_cliente}...")
-        await asyncio.sleep(BUFFER_DELAY)
-        
-        # Acordou! Vamos pegar tudo que acumulou no Redis
-        texto_completo = buffer_service.get_and_clear_messages(clinic_id, telefone_cliente)
-        
-        if texto_completo:
-            # Verifica se IA global/lead continuam ativas antes de processar
-            try:
-                clinica_resp = supabase.table('clinicas')\
-                    .select('ia_ativa')\
-                    .eq('id', clinic_id)\
-                    .single()\
-                    .execute()
-                if clinica_resp.data and clinica_resp.data.get('ia_ativa') is False:
-                    print("🛑 [Buffer] IA global desativada. Abortando processamento.")
-                    return
-
-                lead_resp = supabase.table('leads')\
-                    .select('status_ia')\
-                    .eq('clinic_id', clinic_id)\
-                    .eq('telefone', telefone_cliente)\
-                    .limit(1)\
-                    .execute()
-                if lead_resp.data and lead_resp.data[0].get('status_ia') is False:
-                    print("🛑 [Buffer] IA desativada para o lead. Abortando processamento.")
-                    return
-            except Exception as status_err:
-                print(f"⚠️ [Buffer] Erro ao checar status da IA: {status_err}")
-
-            print(f"🚀 [Buffer] Disparando IA com bloco: {texto_completo}")
-                            
-            # Envia para a fila do Celery (Background Worker)
-            processar_mensagem_ia.delay(
-                clinic_id, 
-                telefone_cliente, 
-                texto_completo, 
-                token_instancia,
-                lid
-            )
-        else:
-            print(f"⚠️ [Buffer] Timer acabou mas não havia mensagens (já processado?).")
-            
+        buffer_service.client.delete(f"webhook:dedup:{uazapi_token}:{message_id}")
     except Exception as e:
-        print(f"❌ Erro no processamento do buffer: {e}")
+        print(f"⚠️ [Dedup] Erro ao liberar mensagem: {e}")
+
+def _adicionar_ao_buffer(clinic_id: str, telefone_cliente: str, texto_ia: str, token_instancia: str, lid: str) -> bool:
+    """
+    Empilha a mensagem no buffer e empurra o deadline da conversa no Redis.
+    O disparo para a IA é feito pelo poller do scheduler (debounce_service).
+    Retorna True se esta mensagem abriu uma nova rajada.
+    """
+    buffer_service.add_message(clinic_id, telefone_cliente, texto_ia)
+    return buffer_service.schedule_flush(clinic_id, telefone_cliente, token_instancia, lid)
 
 @router.post("/webhook/uazapi")
 async def uazapi_webhook(request: Request, background_tasks: BackgroundTasks):
     """
     Recebe eventos da Uazapi.
     """
+    uazapi_token = None
+    message_id = None
     try:       
         payload = await request.json()
         print("📥 Webhook Uazapi recebido:")
@@ -667,17 +694,23 @@ async def uazapi_webhook(request: Request, background_tasks: BackgroundTasks):
         )
         if from_me:
             return {"status": "ignored_from_me"}
+
+        message_id = _pick_first(
+            message.get("messageid"),
+            message.get("messageId"),
+            message.get("id"),
+            (message.get("key") or {}).get("id"),
+        )
+
+        # 1.5. Deduplicação (antes de qualquer acesso ao banco)
+        if message_id and not await run_blocking(_registrar_entrega, uazapi_token, message_id):
+            print(f"♻️ Webhook duplicado ignorado: {message_id}")
+            return {"status": "duplicate"}
         
         # 2. Identificação da Clínica (BUSCA NO BANCO)
         # Precisamos converter o ID da Uazapi para o UUID da sua Clínica
         try:
-            resp = supabase.table('clinicas')\
-                .select('id, ia_ativa, saldo_tokens, tokens_comprados')\
-                .eq('uazapi_token', uazapi_token)\
-                .single()\
-                .execute()
-            
-            clinica_data = resp.data
+            clinica_data = await run_blocking(clinic_cache.get_by_token, uazapi_token)
             
             if not clinica_data:
                 print(f"⚠️ Instância Uazapi não reconhecida no banco: {uazapi_token}")
@@ -691,6 +724,8 @@ async def uazapi_webhook(request: Request, background_tasks: BackgroundTasks):
         
         except Exception as e:
             print(f"❌ Erro ao buscar clínica no banco: {e}")
+            if message_id:
+                await run_blocking(_liberar_entrega, uazapi_token, message_id)
             return {"status": "db_error"}
         
         # 3. Identificação do Cliente
@@ -706,12 +741,6 @@ async def uazapi_webhook(request: Request, background_tasks: BackgroundTasks):
         )
         raw_phone = _pick_first(raw_chatid, message.get("sender_pn"), message.get("sender"), message.get("from"))
         telefone_cliente = str(raw_phone).replace("@s.whatsapp.net", "").replace("+", "")
-        message_id = _pick_first(
-            message.get("messageid"),
-            message.get("messageId"),
-            message.get("id"),
-            (message.get("key") or {}).get("id"),
-        )
         lid = _pick_first(message.get("sender"), message.get("from"), raw_chatid)
 
         print(f"📩 Webhook Uazapi: Clínica {clinic_id} | Cliente: {telefone_cliente}")
@@ -871,33 +900,8 @@ async def uazapi_webhook(request: Request, background_tasks: BackgroundTasks):
                     print("⚠️ Message ID não encontrado para transcrição de áudio")
                     return {"status": "audio_no_message_id"}
                 
-                # Transcrever o áudio
-                try:
-                    audio_service = AudioService()
-                    texto_transcrito = audio_service.transcrever_audio_uazapi(
-                        uazapi_token,  # Token da Instância
-                        message_id     # ID da Mensagem
-                    )
-                    
-                    if not texto_transcrito:
-                        # Se não conseguiu transcrever, envia mensagem de erro e para por aqui
-                        enviar_mensagem_whatsapp(
-                            uazapi_token, 
-                            telefone_cliente, 
-                            "Não consegui entender o áudio. Pode escrever, por favor?"
-                        )
-                        return {"status": "audio_error"}
-                    else:
-                        # Se transcreveu, usa o texto para processamento da IA
-                        texto_usuario = texto_transcrito
-                        texto_ia = texto_transcrito
-                        
-                        media_type = None
-                        print(f"🎯 Áudio transcrito com sucesso: {texto_transcrito} - Convertendo para processamento de texto")
-                        
-                except Exception as audio_err:
-                    print(f"❌ Erro na transcrição de áudio: {audio_err}")
-                    return {"status": "audio_transcription_error"}
+                # A transcrição roda no worker (task transcrever_audio), que grava o
+                # transcript no histórico e alimenta o buffer quando terminar.
             elif media_type == "image":
                 print("🖼️ Imagem detectada (Uazapi)...")
                 
@@ -906,29 +910,7 @@ async def uazapi_webhook(request: Request, background_tasks: BackgroundTasks):
                     print("⚠️ Message ID não encontrado para análise de imagem")
                     return {"status": "image_no_message_id"}
                 
-                # Analisar a imagem
-                try:
-                    image_service = ImageService()
-                    analise_imagem = image_service.analisar_imagem_uazapi(
-                        uazapi_token,  # Token da Instância
-                        message_id     # ID da Mensagem
-                    )
-                    
-                    if not analise_imagem:
-                        # Se a imagem não for relacionada ao contexto de clínicas, ignora
-                        print("🚫 Imagem fora do contexto de clínicas - ignorando")
-                        return {"status": "image_ignored"}
-                    else:
-                        # Se a imagem for relevante, usa a análise para processamento da IA
-                        texto_usuario = f"[Imagem enviada] {analise_imagem}"
-                        texto_ia = f"Análise da imagem: {analise_imagem}"
-  
-                        media_type = None
-                        print(f"🎯 Imagem analisada com sucesso: {analise_imagem} - Convertendo para processamento de texto")
-                        
-                except Exception as image_err:
-                    print(f"❌ Erro na análise da imagem: {image_err}")
-                    return {"status": "image_analysis_error"}
+                # A análise roda no worker (task analisar_imagem), com cache por hash.
             else:
                 # Outras mídias (vídeo, arquivo) apenas logar
                 texto_usuario = ""
@@ -943,6 +925,7 @@ async def uazapi_webhook(request: Request, background_tasks: BackgroundTasks):
         print(f"💬 Processando: {texto_usuario or media_type}")
 
         # 6. Salvar mensagem no histórico e emitir para o painel
+        chat_message_id = None
         if media_type:
             conteudo_historico = json.dumps({
                 "type": media_type,
@@ -953,7 +936,10 @@ async def uazapi_webhook(request: Request, background_tasks: BackgroundTasks):
                 "caption": media_caption,
             })
             try:
-                HistoryService(clinic_id=clinic_id, session_id=telefone_cliente).add_user_message(conteudo_historico)
+                chat_message_id = await run_blocking(
+                    HistoryService(clinic_id=clinic_id, session_id=telefone_cliente).add_user_message,
+                    conteudo_historico
+                )
             except Exception as e:
                 print(f"⚠️ Erro ao salvar histórico (media): {e}")
                 
@@ -979,10 +965,14 @@ async def uazapi_webhook(request: Request, background_tasks: BackgroundTasks):
                     },
                 }
             })
-            return {"status": "media_logged"}
+            if media_type not in ("audio", "image"):
+                return {"status": "media_logged"}
         else:
             try:
-                HistoryService(clinic_id=clinic_id, session_id=telefone_cliente).add_user_message(texto_usuario)
+                await run_blocking(
+                    HistoryService(clinic_id=clinic_id, session_id=telefone_cliente).add_user_message,
+                    texto_usuario
+                )
             except Exception as e:
                 print(f"⚠️ Erro ao salvar histórico (texto): {e}")
                 
@@ -1002,16 +992,7 @@ async def uazapi_webhook(request: Request, background_tasks: BackgroundTasks):
         lead_needs_create = False
         
         try:
-            lead_resp = supabase.table('leads')\
-                .select('id, status_ia')\
-                .eq('clinic_id', clinic_id)\
-                .eq('telefone', telefone_cliente)\
-                .limit(1)\
-                .execute()
-            if not lead_resp.data:
-                lead_needs_create = True
-            else:
-                lead_status_ia = lead_resp.data[0].get('status_ia', True)
+            lead_status_ia, lead_needs_create = await run_blocking(_buscar_lead, clinic_id, telefone_cliente)
         except Exception as e:
             print(f"⚠️ Erro ao buscar lead: {e}")
 
@@ -1078,66 +1059,68 @@ async def uazapi_webhook(request: Request, background_tasks: BackgroundTasks):
             background_tasks.add_task(criar_lead_e_tags)
 
         # 7. Buffer & Agente (só se IA ativa)
+        bloqueio_ia = None
         if not ia_ativa:
-            return {"status": "ia_disabled_logged"}
-        if not lead_status_ia:
-            return {"status": "lead_ia_disabled"}
-
-        if saldo_tokens <= 0 and tokens_comprados <= 0:
+            bloqueio_ia = {"status": "ia_disabled_logged"}
+        elif not lead_status_ia:
+            bloqueio_ia = {"status": "lead_ia_disabled"}
+        elif await run_blocking(_saldo_disponivel, clinic_id, saldo_tokens, tokens_comprados) <= 0:
             print(f"⚠️ Saldo de tokens insuficiente para a clínica {clinic_id}")
-            return {"status": "insufficient_balance"}
+            bloqueio_ia = {"status": "insufficient_balance"}
+        else:
+            # 7.5. RATE LIMITING (após salvar mensagem, só para IA)
+            bloqueio_ia = await run_blocking(_verificar_rate_limit, clinic_id)
 
-        # 7.5. RATE LIMITING (após salvar mensagem, só para IA)
-        is_blocked, ttl = rate_limiter.is_clinic_blocked(clinic_id)
-        
-        if is_blocked:
-            print(f"🚫 [RateLimit] Requisição bloqueada - Clínica {clinic_id} (TTL: {ttl}s)")
-            return {
-                "status": "rate_limit_blocked",
-                "message": f"Clínica temporariamente bloqueada. Aguarde {ttl} segundos.",
-                "retry_after": ttl
-            }
-        
-        global_allowed, global_msg = rate_limiter.check_global_rate_limit()
-        
-        if not global_allowed:
-            print(f"🚨 [RateLimit] GLOBAL LIMIT - Requisição negada")
-            return {
-                "status": "rate_limit_global",
-                "message": global_msg
-            }
-        
-        allowed, msg = rate_limiter.check_rate_limit_per_clinic(clinic_id)
-        
-        if not allowed:
-            print(f"⚠️ [RateLimit] Rate limit excedido - Clínica {clinic_id}")
-            return {
-                "status": "rate_limit_exceeded",
-                "message": msg
-            }
-        
-        burst_allowed, burst_msg = rate_limiter.check_burst_protection(clinic_id)
-        
-        if not burst_allowed:
-            print(f"⚠️ [RateLimit] Burst detectado - Clínica {clinic_id}")
-            return {
-                "status": "rate_limit_burst",
-                "message": burst_msg
-            }
+        # Áudio: a transcrição sempre roda (o painel mostra o texto),
+        # mas só alimenta o buffer da IA se nada bloqueou acima.
+        if media_type == "audio":
+            # Enfileira por nome para não carregar o agente no processo da API
+            await run_blocking(
+                celery_app.send_task,
+                "transcrever_audio",
+                args=[
+                    clinic_id,
+                    telefone_cliente,
+                    uazapi_token,
+                    message_id,
+                    chat_message_id,
+                    lid,
+                    bloqueio_ia is None,
+                ],
+            )
+            return bloqueio_ia or {"status": "audio_queued"}
 
-        # Texto vai direto para o buffer (rápido)
-        if texto_ia:
-            buffer_service.add_message(clinic_id, telefone_cliente, texto_ia)
-            devo_iniciar_timer = buffer_service.should_start_timer(clinic_id, telefone_cliente)
-            
-            if devo_iniciar_timer:
-                background_tasks.add_task(
-                    esperar_e_processar,
+        if bloqueio_ia:
+            return bloqueio_ia
+
+        # Imagem: só vale a chamada de visão se a IA for responder
+        if media_type == "image":
+            await run_blocking(
+                celery_app.send_task,
+                "analisar_imagem",
+                args=[
                     clinic_id,
                     telefone_cliente,
                     uazapi_token,
+                    message_id,
+                    chat_message_id,
                     lid,
-                )
+                ],
+            )
+            return {"status": "image_queued"}
+
+        # Texto vai direto para o buffer (rápido)
+        if texto_ia:
+            nova_rajada = await run_blocking(
+                _adicionar_ao_buffer,
+                clinic_id,
+                telefone_cliente,
+                texto_ia,
+                uazapi_token,
+                lid,
+            )
+            
+            if nova_rajada:
                 return {"status": "timer_started"}
             
             return {"status": "accumulated"}
@@ -1149,6 +1132,8 @@ async def uazapi_webhook(request: Request, background_tasks: BackgroundTasks):
 
     except Exception as e:
         print(f"❌ Erro Webhook Uazapi: {e}")
+        if uazapi_token and message_id:
+            await run_blocking(_liberar_entrega, uazapi_token, message_id)
         return {"status": "error", "detail": str(e)}
     
     
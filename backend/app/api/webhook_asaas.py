@@ -5,6 +5,9 @@ from fastapi import APIRouter, Request, Header, HTTPException, Body
 from dotenv import load_dotenv
 from app.core.database import get_supabase
 from app.services.payment_service import cancelar_assinatura_asaas
+from app.services.clinic_cache_service import clinic_cache
+from app.services.token_ledger_service import token_ledger
+from app.services.clinic_context_service import clinic_context
 
 load_dotenv()
 
@@ -71,28 +74,21 @@ def asaas_webhook(payload: dict = Body(...), asaas_access_token: str = Header(No
                 purchase = token_purchase.data
                 print(f"🪙 Pagamento de Tokens Recebido: {purchase['id']} - {purchase['quantidade_tokens']} tokens")
                 
-                # 1. Marcar como pago
-                supabase.table('compra_tokens').update({
+                # 1. Marcar como pago (só se ainda estiver pendente: reentregas do Asaas não creditam duas vezes)
+                marcada = supabase.table('compra_tokens').update({
                     'status': 'pago', 
                     'pagamento_at': dt.datetime.now().isoformat()
-                }).eq('id', purchase['id']).execute()
+                }).eq('id', purchase['id']).eq('status', 'pendente').execute()
+
+                if not marcada.data:
+                    print(f"ℹ️ Compra de tokens {purchase['id']} já processada.")
+                    return {"status": "processed_token_purchase"}
                 
-                # 2. Adicionar saldo à clínica (Incremento)
-                # Precisamos ler o saldo atual primeiro para incrementar com segurança (concorrência é rara aqui)
-                # Ou usar uma RPC se tivesse, mas vamos de read-modify-write
+                # 2. Adicionar saldo à clínica (incremento atômico via RPC, reativa a IA)
+                novo_saldo = token_ledger.creditar_tokens_comprados(purchase['clinic_id'], purchase['quantidade_tokens'])
+                clinic_context.invalidate(purchase['clinic_id'])
                 
-                clinic_res = supabase.table('clinicas').select('tokens_comprados').eq('id', purchase['clinic_id']).single().execute()
-
-                if clinic_res and clinic_res.data:
-                    current_balance = clinic_res.data.get('tokens_comprados', 0) or 0
-                    new_balance = current_balance + purchase['quantidade_tokens']
-                    
-                    supabase.table('clinicas').update({
-                        'tokens_comprados': new_balance,
-                        'ia_ativa': True # Reativar IA se estava pausada
-                    }).eq('id', purchase['clinic_id']).execute()
-                    
-                    print(f"✅ Saldo de tokens atualizado para {new_balance}")
+                print(f"✅ Saldo de tokens atualizado: {novo_saldo}")
                 
                 return {"status": "processed_token_purchase"}
 
@@ -190,6 +186,8 @@ def asaas_webhook(payload: dict = Body(...), asaas_access_token: str = Header(No
                         .update({'ia_ativa': True, 'saldo_tokens': tokens_liberados})\
                         .eq('id', sessao['clinic_id'])\
                         .execute()
+                    clinic_cache.invalidate(sessao['clinic_id'])
+                    clinic_context.invalidate(sessao['clinic_id'])
 
                     # Marcar a sessão como PAGO
                     supabase.table('checkout_sessions').update({'status': 'pago'}).eq('id', sessao['id']).execute()
@@ -229,6 +227,8 @@ def asaas_webhook(payload: dict = Body(...), asaas_access_token: str = Header(No
                             .update({'ia_ativa': True, 'saldo_tokens': tokens_liberados})\
                             .eq('id', clinic_id)\
                             .execute()
+                        clinic_cache.invalidate(clinic_id)
+                        clinic_context.invalidate(clinic_id)
                     
                     print(f"📅 Assinatura renovada até {nova_data_fim}")
 
@@ -273,6 +273,8 @@ def asaas_webhook(payload: dict = Body(...), asaas_access_token: str = Header(No
                     .update({'ia_ativa': False})\
                     .eq('id', clinic_id)\
                     .execute()
+                clinic_cache.invalidate(clinic_id)
+                clinic_context.invalidate(clinic_id)
                 print(f"🔒 Assinatura ativa inadimplente - IA desativada para clínica {clinic_id}")
                 return {"status": "processed_active_subscription_overdue"}
 
@@ -317,6 +319,8 @@ def asaas_webhook(payload: dict = Body(...), asaas_access_token: str = Header(No
                     .update({'ia_ativa': False})\
                     .eq('id', clinic_id)\
                     .execute()
+                clinic_cache.invalidate(clinic_id)
+                clinic_context.invalidate(clinic_id)
                 print(f"🔒 IA desativada para clínica {clinic_id}")
 
         return {"status": "processed"}
@@ -0,0 +1,48 @@
+import os
+import hmac
+from fastapi import APIRouter, Header, HTTPException, BackgroundTasks
+from dotenv import load_dotenv
+from app.services.calendar_mirror_service import calendar_mirror
+from app.services.calendar_sync import sincronizar_calendario
+
+load_dotenv()
+
+router = APIRouter()
+
+# Token enviado pelo Google em cada notificação (definido ao registrar o canal).
+# Obrigatório: sem ele o webhook recusa tudo (e nenhum canal é registrado).
+GOOGLE_CALENDAR_WEBHOOK_TOKEN = os.getenv("GOOGLE_CALENDAR_WEBHOOK_TOKEN")
+
+@router.post("/webhook/google-calendar")
+def google_calendar_webhook(
+    background_tasks: BackgroundTasks,
+    x_goog_channel_id: str = Header(None),
+    x_goog_channel_token: str = Header(None),
+    x_goog_resource_id: str = Header(None),
+    x_goog_resource_state: str = Header(None),
+):
+    """
+    Notificação de push do Google Calendar (events.watch).
+    O corpo vem vazio: a notificação só avisa que o calendário mudou, e o
+    espelho busca as mudanças com o sync token em segundo plano.
+    """
+    if not GOOGLE_CALENDAR_WEBHOOK_TOKEN:
+        print(f"⛔ Webhook Google Calendar bloqueado: GOOGLE_CALENDAR_WEBHOOK_TOKEN não definido")
+        raise HTTPException(status_code=401, detail="Webhook token not configured")
+
+    if not hmac.compare_digest(x_goog_channel_token or "", GOOGLE_CALENDAR_WEBHOOK_TOKEN):
+        print(f"⛔ Webhook Google Calendar bloqueado: token inválido")
+        raise HTTPException(status_code=401, detail="Invalid Channel Token")
+
+    # 'sync' é a confirmação de criação do canal, não uma mudança
+    if x_goog_resource_state == 'sync':
+        return {"status": "ok"}
+
+    # O canal precisa existir e o resourceId bater com o devolvido pelo events.watch
+    canal = calendar_mirror.localizar_canal(x_goog_channel_id, x_goog_resource_id) if x_goog_channel_id else None
+    if not canal:
+        return {"status": "ignored_unknown_channel"}
+
+    clinic_id, calendar_id = canal
+    background_tasks.add_task(sincronizar_calendario, clinic_id, calendar_id)
+    return {"status": "ok"}
@@ -0,0 +1,120 @@
+"""
+Pool de threads limitado para chamadas bloqueantes (Supabase, Redis, requests).
+Usado pelas rotas async para não travar o event loop do uvicorn e pelo worker
+para disparar consultas independentes em paralelo (com --pool=gevent as
+threads do pool viram greenlets).
+"""
+
+import os
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tamanho máximo do pool (limita a pressão no Supabase/Redis em picos de webhook)
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "32"))
+
+# Pool separado das buscas com resposta parcial (painel de calendários): as
+# que estouram o timeout seguem rodando e não podem ocupar o pool do webhook
+CALENDAR_FETCH_POOL_SIZE = int(os.getenv("CALENDAR_FETCH_POOL_SIZE", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking-io")
+_executor_parcial = ThreadPoolExecutor(max_workers=CALENDAR_FETCH_POOL_SIZE, thread_name_prefix="partial-fetch")
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Executa uma função síncrona no pool limitado e aguarda o resultado
+    sem bloquear o event loop.
+
+    Usage:
+        resp = await run_blocking(buscar_clinica, token)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+def run_parallel(tarefas: dict, etapa: str = "Paralelo") -> dict:
+    """
+    Executa funções síncronas independentes ao mesmo tempo e retorna
+    {nome: resultado}. Loga o tempo de cada uma e o total da etapa.
+    Se alguma falhar, a primeira exceção é relançada.
+    Não chamar de dentro de uma tarefa do próprio pool (evita deadlock).
+
+    Usage:
+        resultados = run_parallel({
+            "clinica": (clinic_cache.get_by_id, clinic_id),
+            "historico": (history_service.get_langchain_history,),
+        }, etapa="Bootstrap")
+    """
+    tempos = {}
+
+    def _medir(nome, func, *args):
+        inicio = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            tempos[nome] = (time.perf_counter() - inicio) * 1000
+
+    inicio_total = time.perf_counter()
+    futures = {
+        nome: _executor.submit(_medir, nome, func, *args)
+        for nome, (func, *args) in tarefas.items()
+    }
+    resultados = {}
+    erro = None
+    for nome, future in futures.items():
+        try:
+            resultados[nome] = future.result()
+        except Exception as e:
+            erro = erro or e
+
+    total = (time.perf_counter() - inicio_total) * 1000
+    detalhes = " | ".join(f"{nome}={tempos.get(nome, 0):.0f}ms" for nome in tarefas)
+    print(f"⏱️ [{etapa}] {detalhes} | total={total:.0f}ms")
+
+    if erro:
+        raise erro
+    return resultados
+
+def run_parallel_parcial(tarefas: dict, timeout: float, etapa: str = "Paralelo") -> dict:
+    """
+    Como run_parallel, mas para respostas parciais: espera no máximo
+    `timeout` segundos e retorna {nome: resultado} apenas das tarefas que
+    terminaram sem erro. As que falharam ou estouraram o tempo são logadas
+    e ficam de fora. Roda no pool próprio (CALENDAR_FETCH_POOL_SIZE): as
+    atrasadas terminam lá sem tomar threads do run_blocking, e as que nem
+    começaram são canceladas.
+
+    Usage:
+        eventos = run_parallel_parcial({
+            cal_id: (calendar_service.listar_eventos_periodo, inicio, fim, cal_id)
+            for cal_id in calendar_ids
+        }, timeout=8, etapa="Eventos")
+    """
+    inicio_total = time.perf_counter()
+    futures = {
+        nome: _executor_parcial.submit(func, *args)
+        for nome, (func, *args) in tarefas.items()
+    }
+    wait(futures.values(), timeout=timeout)
+
+    resultados = {}
+    falhas = []
+    for nome, future in futures.items():
+        if not future.done():
+            future.cancel()  # só tem efeito se ainda estava na fila
+            falhas.append(f"{nome}=timeout")
+            continue
+        try:
+            resultados[nome] = future.result()
+        except Exception as e:
+            falhas.append(f"{nome}=erro ({e})")
+
+    total = (time.perf_counter() - inicio_total) * 1000
+    print(f"⏱️ [{etapa}] {len(resultados)}/{len(tarefas)} concluídas | total={total:.0f}ms")
+    if falhas:
+        print(f"⚠️ [{etapa}] Parcial: {' | '.join(falhas)}")
+
+    return resultados
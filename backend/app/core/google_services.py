@@ -0,0 +1,112 @@
+"""
+Reuso dos clients da API do Google no processo.
+- Os documentos de discovery (calendar v3, oauth2 v2) são lidos uma única vez
+  do pacote google-api-python-client (cópia estática, sem rede) e mantidos
+  já parseados; os Resources são montados com build_from_document.
+- Os Resources do Calendar ficam num pool por clínica (checkout/checkin):
+  cada uso pega um Resource ocioso com o transporte HTTP aberto, troca as
+  credenciais dele pelas do uso atual e o devolve ao final. Um Resource nunca é usado
+  por duas threads/greenlets ao mesmo tempo (httplib2 não é thread-safe).
+  Eviction: LRU entre clínicas, limite por clínica e TTL de ociosidade.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GOOGLE_POOL_CLINICAS = int(os.getenv("GOOGLE_POOL_CLINICAS", "256"))
+GOOGLE_POOL_POR_CLINICA = int(os.getenv("GOOGLE_POOL_POR_CLINICA", "4"))
+GOOGLE_POOL_TTL = int(os.getenv("GOOGLE_POOL_TTL", "1800"))
+
+_documentos = {}
+_documentos_lock = threading.Lock()
+
+def _documento(api: str, versao: str) -> dict:
+    """
+    Documento de discovery já parseado (carregado uma vez por processo).
+    """
+    chave = (api, versao)
+    if chave not in _documentos:
+        with _documentos_lock:
+            if chave not in _documentos:
+                conteudo = get_static_doc(api, versao)
+                _documentos[chave] = json.loads(conteudo) if conteudo else None
+    return _documentos[chave]
+
+def montar_servico(api: str, versao: str, credentials):
+    """
+    Equivalente a build(api, versao, credentials=...) sem reler/parsear o discovery.
+    """
+    documento = _documento(api, versao)
+    if documento is None:
+        # Versão do pacote sem cópia estática: cai no build normal
+        return build(api, versao, credentials=credentials)
+    return build_from_document(documento, credentials=credentials)
+
+class GoogleServicePool:
+    """
+    Pool de Resources do Calendar por clínica.
+    Um Resource só é reaproveitado se foi montado com o mesmo refresh token
+    (reconexão da conta invalida os antigos), e a cada retirada recebe as
+    credenciais atuais: o access token nunca fica preso ao Resource.
+    """
+    def __init__(self):
+        self._ociosos: "OrderedDict[str, list]" = OrderedDict()  # {clinic_id: [(refresh_token, devolvido_em, service)]}
+        self._lock = threading.Lock()
+
+    def _retirar(self, clinic_id: str, credentials):
+        agora = time.monotonic()
+        with self._lock:
+            fila = self._ociosos.get(clinic_id)
+            while fila:
+                refresh_token, devolvido_em, service = fila.pop()
+                if refresh_token == credentials.refresh_token and agora - devolvido_em < GOOGLE_POOL_TTL:
+                    self._ociosos.move_to_end(clinic_id)
+                    # Troca as credenciais do AuthorizedHttp pelas deste uso (access
+                    # token vindo do access_token_cache); o transporte é mantido
+                    service._http.credentials = credentials
+                    return service
+
+        return montar_servico('calendar', 'v3', credentials)
+
+    def _devolver(self, clinic_id: str, credentials, service):
+        with self._lock:
+            fila = self._ociosos.setdefault(clinic_id, [])
+            if len(fila) < GOOGLE_POOL_POR_CLINICA:
+                fila.append((credentials.refresh_token, time.monotonic(), service))
+            self._ociosos.move_to_end(clinic_id)
+
+            while len(self._ociosos) > GOOGLE_POOL_CLINICAS:
+                self._ociosos.popitem(last=False)
+
+    @contextmanager
+    def usar(self, clinic_id: str, credentials):
+        """
+        Usage:
+            with google_pool.usar(clinic_id, creds) as service:
+                service.events().list(...).execute()
+        """
+        service = self._retirar(clinic_id, credentials)
+        yield service
+        # Só volta para o pool se a chamada terminou sem erro (conexão íntegra)
+        self._devolver(clinic_id, credentials, service)
+
+    def limpar(self, clinic_id: str):
+        with self._lock:
+            self._ociosos.pop(clinic_id, None)
+
+
+# Carrega os documentos no import (início do processo)
+_documento('calendar', 'v3')
+_documento('oauth2', 'v2')
+
+# Instância global
+google_pool = GoogleServicePool()
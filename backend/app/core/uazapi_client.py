@@ -0,0 +1,238 @@
+"""
+Cliente HTTP compartilhado para a Uazapi.
+Mantém conexões keep-alive (requests.Session para código síncrono e
+httpx.AsyncClient para rotas async), aplica timeout padrão, faz retry com
+jitter e registra latência/erros por endpoint.
+Chamadas não idempotentes (POST /send/text...) só são repetidas quando a
+conexão falhou antes do envio (recusada/timeout de conexão); as idempotentes
+também são repetidas após queda da conexão e 5xx.
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+import requests
+import httpx
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UAZAPI_URL = os.getenv("UAZAPI_URL")
+
+UAZAPI_TIMEOUT = float(os.getenv("UAZAPI_TIMEOUT", "15"))
+UAZAPI_CONNECT_TIMEOUT = float(os.getenv("UAZAPI_CONNECT_TIMEOUT", "5"))
+UAZAPI_MAX_RETRIES = int(os.getenv("UAZAPI_MAX_RETRIES", "2"))
+UAZAPI_POOL_SIZE = int(os.getenv("UAZAPI_POOL_SIZE", "32"))
+
+# Métodos que podem ser repetidos após 5xx sem risco de duplicar efeito
+IDEMPOTENT_METHODS = {"GET", "HEAD", "DELETE", "PUT", "OPTIONS"}
+
+class UazapiClient:
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=UAZAPI_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._async_client = None
+        self._stats = {}  # {"POST /send/text": {...}}
+        self._lock = threading.Lock()
+
+    # --- Helpers ---
+
+    def _url(self, path: str) -> str:
+        return f"{UAZAPI_URL}{path}"
+
+    def _headers(self, token: str = None, admin_token: str = None) -> dict:
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["token"] = token.strip()
+        if admin_token:
+            headers["admintoken"] = admin_token.strip()
+        return headers
+
+    def _backoff(self, tentativa: int) -> float:
+        # Exponencial com jitter total (0.2s, 0.4s, 0.8s... aleatorizado)
+        return random.uniform(0, 0.2 * (2 ** tentativa))
+
+    def _pode_repetir(self, method: str, idempotent) -> bool:
+        if idempotent is None:
+            return method.upper() in IDEMPOTENT_METHODS
+        return idempotent
+
+    def _falhou_antes_de_enviar(self, erro: requests.ConnectionError) -> bool:
+        """
+        True se a requisição não chegou a sair (conexão recusada, DNS, timeout
+        de conexão). Queda depois do envio (RemoteDisconnected, reset) não conta:
+        a Uazapi pode ter processado a mensagem.
+        """
+        if isinstance(erro, requests.exceptions.ConnectTimeout):
+            return True
+        motivo = erro.args[0] if erro.args else None
+        motivo = getattr(motivo, "reason", motivo)  # MaxRetryError -> causa
+        return isinstance(motivo, (NewConnectionError, ConnectTimeoutError))
+
+    def _record(self, method: str, path: str, elapsed: float, status: int = None, erro: bool = False, retry: bool = False):
+        chave = f"{method.upper()} {path}"
+        with self._lock:
+            item = self._stats.setdefault(chave, {
+                "calls": 0,
+                "errors": 0,
+                "retries": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "last_status": None,
+            })
+            if retry:
+                item["retries"] += 1
+                return
+            item["calls"] += 1
+            item["total_ms"] += elapsed * 1000
+            item["max_ms"] = max(item["max_ms"], elapsed * 1000)
+            item["last_status"] = status
+            if erro or (status is not None and status >= 500):
+                item["errors"] += 1
+
+    # --- API síncrona ---
+
+    def request(self, method: str, path: str, token: str = None, admin_token: str = None,
+                json=None, params=None, timeout: float = None, idempotent: bool = None) -> requests.Response:
+        """
+        Faz a chamada para {UAZAPI_URL}{path}.
+        Falha de conexão antes do envio é sempre repetida; queda da conexão
+        depois do envio e 5xx só são repetidos se a chamada for idempotente.
+        """
+        timeout = (UAZAPI_CONNECT_TIMEOUT, timeout or UAZAPI_TIMEOUT)
+        repetir = self._pode_repetir(method, idempotent)
+
+        for tentativa in range(UAZAPI_MAX_RETRIES + 1):
+            inicio = time.perf_counter()
+            ultima = tentativa == UAZAPI_MAX_RETRIES
+            try:
+                response = self.session.request(
+                    method,
+                    self._url(path),
+                    json=json,
+                    params=params,
+                    headers=self._headers(token, admin_token),
+                    timeout=timeout,
+                )
+            except requests.ConnectionError as e:
+                self._record(method, path, time.perf_counter() - inicio, erro=True)
+                if ultima or not (repetir or self._falhou_antes_de_enviar(e)):
+                    raise
+                self._record(method, path, 0, retry=True)
+                time.sleep(self._backoff(tentativa))
+                continue
+            except requests.RequestException:
+                self._record(method, path, time.perf_counter() - inicio, erro=True)
+                raise
+
+            self._record(method, path, time.perf_counter() - inicio, status=response.status_code)
+            if response.status_code >= 500 and repetir and not ultima:
+                self._record(method, path, 0, retry=True)
+                time.sleep(self._backoff(tentativa))
+                continue
+            return response
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+    # --- API async ---
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=UAZAPI_POOL_SIZE, max_keepalive_connections=UAZAPI_POOL_SIZE),
+            )
+        return self._async_client
+
+    async def arequest(self, method: str, path: str, token: str = None, admin_token: str = None,
+                       json=None, params=None, timeout: float = None, idempotent: bool = None) -> httpx.Response:
+        """
+        Versão async de request() para as rotas da API (não ocupa o pool de threads).
+        Mesma regra de retry: ConnectError/ConnectTimeout acontecem antes do
+        envio; as demais quedas de conexão só são repetidas se idempotente.
+        """
+        timeout = httpx.Timeout(timeout or UAZAPI_TIMEOUT, connect=UAZAPI_CONNECT_TIMEOUT)
+        repetir = self._pode_repetir(method, idempotent)
+        client = self._get_async_client()
+
+        for tentativa in range(UAZAPI_MAX_RETRIES + 1):
+            inicio = time.perf_counter()
+            ultima = tentativa == UAZAPI_MAX_RETRIES
+            try:
+                response = await client.request(
+                    method,
+                    self._url(path),
+                    json=json,
+                    params=params,
+                    headers=self._headers(token, admin_token),
+                    timeout=timeout,
+                )
+            except (httpx.NetworkError, httpx.RemoteProtocolError, httpx.ConnectTimeout) as e:
+                self._record(method, path, time.perf_counter() - inicio, erro=True)
+                antes_do_envio = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if ultima or not (repetir or antes_do_envio):
+                    raise
+                self._record(method, path, 0, retry=True)
+                await asyncio.sleep(self._backoff(tentativa))
+                continue
+            except httpx.HTTPError:
+                self._record(method, path, time.perf_counter() - inicio, erro=True)
+                raise
+
+            self._record(method, path, time.perf_counter() - inicio, status=response.status_code)
+            if response.status_code >= 500 and repetir and not ultima:
+                self._record(method, path, 0, retry=True)
+                await asyncio.sleep(self._backoff(tentativa))
+                continue
+            return response
+
+    async def apost(self, path: str, **kwargs) -> httpx.Response:
+        return await self.arequest("POST", path, **kwargs)
+
+    async def aget(self, path: str, **kwargs) -> httpx.Response:
+        return await self.arequest("GET", path, **kwargs)
+
+    async def adelete(self, path: str, **kwargs) -> httpx.Response:
+        return await self.arequest("DELETE", path, **kwargs)
+
+    async def aclose(self):
+        """
+        Fecha o httpx.AsyncClient (chamado no shutdown da API).
+        """
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    # --- Métricas ---
+
+    def get_stats(self) -> dict:
+        """
+        Latência e erros por endpoint (apenas deste processo).
+        """
+        with self._lock:
+            return {
+                chave: {
+                    **item,
+                    "avg_ms": round(item["total_ms"] / item["calls"], 1) if item["calls"] else 0,
+                    "total_ms": round(item["total_ms"], 1),
+                    "max_ms": round(item["max_ms"], 1),
+                }
+                for chave, item in self._stats.items()
+            }
+
+
+# Instância global
+uazapi_client = UazapiClient()
@@ -13,12 +13,16 @@ from dotenv import load_dotenv
 from app.api.auth import router as auth_router
 from app.api.webhook import router as webhook_router
 from app.api.webhook_asaas import router as webhook_asaas_router
+from app.api.webhook_calendar import router as webhook_calendar_router
 from app.api.admin_rate_limit import router as admin_rate_limit_router
+from app.api.admin_metrics import router as admin_metrics_router
 from app.api.admin_auth import router as admin_auth_router
 from app.api.payments import router as payments_router
 from app.api.calendars import router as calendars_router
 from app.api.subscriptions import router as subscriptions_router
+from app.api.clinics import router as clinics_router
 from app.core.database import get_supabase
+from app.core.uazapi_client import uazapi_client
 
 load_dotenv()  # Carrega variáveis do .env
 
@@ -66,11 +70,19 @@ app.include_router(auth_router, tags=["Autenticação"])
 app.include_router(webhook_router, tags=["Webhooks"]) # Webhook precisa ser público (tem token próprio)
 app.include_router(admin_auth_router, tags=["Admin - Autenticação"], dependencies=[Depends(verify_global_password)])
 app.include_router(admin_rate_limit_router, tags=["Admin - Rate Limiting"], dependencies=[Depends(verify_global_password)])
+app.include_router(admin_metrics_router, tags=["Admin - Métricas"], dependencies=[Depends(verify_global_password)])
 app.include_router(payments_router, tags=["Pagamentos"], dependencies=[Depends(verify_global_password)])
 app.include_router(webhook_asaas_router, tags=["Pagamentos"]) # Webhook Asaas precisa ser público
+app.include_router(webhook_calendar_router, tags=["Calendários"]) # Push do Google Calendar precisa ser público (tem token próprio)
 app.include_router(calendars_router, tags=["Calendários"], dependencies=[Depends(verify_global_password)])
 app.include_router(subscriptions_router, tags=["Assinaturas"], dependencies=[Depends(verify_global_password)])
+app.include_router(clinics_router, tags=["Clínicas"], dependencies=[Depends(verify_global_password)])
 
 @app.get("/")
 def root():
     return {"status": "Ok"}
+
+@app.on_event("shutdown")
+async def fechar_clientes_http():
+    # Fecha as conexões keep-alive do cliente async da Uazapi
+    await uazapi_client.aclose()
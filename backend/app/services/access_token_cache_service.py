@@ -0,0 +1,124 @@
+"""
+    Cache compartilhado de access tokens dos calendários (Google/Outlook).
+    O access token renovado fica no Redis (criptografado) por clínica até
+    perto de expirar, evitando uma ida ao endpoint OAuth a cada instância do
+    serviço de calendário. A renovação é single-flight: só um worker renova,
+    os demais aguardam o token aparecer no cache.
+"""
+
+import os
+import json
+import time
+import hashlib
+from typing import Callable, Optional, Tuple
+from dotenv import load_dotenv
+from app.core.security import encrypt_token, decrypt_token
+from app.services.buffer_service import BufferService
+
+load_dotenv()
+
+# Margem antes da expiração em que o token deixa de ser reaproveitado
+ACCESS_TOKEN_MARGEM = int(os.getenv("ACCESS_TOKEN_MARGEM", "120"))
+# Tempo máximo da renovação (TTL do lock) e da espera pelos outros workers
+ACCESS_TOKEN_LOCK_TTL = int(os.getenv("ACCESS_TOKEN_LOCK_TTL", "15"))
+ACCESS_TOKEN_ESPERA = float(os.getenv("ACCESS_TOKEN_ESPERA", "5"))
+
+class AccessTokenCacheService:
+    def __init__(self):
+        self.redis = BufferService().client
+
+    def _key(self, provider: str, clinic_id: str) -> str:
+        return f"cache:access_token:{provider}:{clinic_id}"
+
+    def _lock_key(self, provider: str, clinic_id: str) -> str:
+        return f"lock:access_token:{provider}:{clinic_id}"
+
+    @staticmethod
+    def _impressao(refresh_token: str) -> str:
+        """
+        Identifica a conexão (refresh token) sem guardá-lo: reconectar a conta
+        invalida o access token em cache.
+        """
+        return hashlib.sha256(refresh_token.encode()).hexdigest()[:16]
+
+    def _ler(self, provider: str, clinic_id: str, refresh_token: str) -> Optional[Tuple[str, float]]:
+        try:
+            valor = self.redis.get(self._key(provider, clinic_id))
+            if not valor:
+                return None
+
+            dados = json.loads(decrypt_token(valor))
+            if dados.get("rt") != self._impressao(refresh_token):
+                return None
+            if dados["expira_em"] - time.time() < ACCESS_TOKEN_MARGEM:
+                return None
+            return dados["token"], dados["expira_em"]
+        except Exception as e:
+            print(f"⚠️ [AccessTokenCache] Erro ao ler token: {e}")
+            return None
+
+    def _gravar(self, provider: str, clinic_id: str, refresh_token: str, token: str, expira_em: float):
+        ttl = int(expira_em - time.time() - ACCESS_TOKEN_MARGEM)
+        if ttl <= 0:
+            return
+
+        try:
+            valor = encrypt_token(json.dumps({
+                "token": token,
+                "expira_em": expira_em,
+                "rt": self._impressao(refresh_token),
+            }))
+            self.redis.setex(self._key(provider, clinic_id), ttl, valor)
+        except Exception as e:
+            print(f"⚠️ [AccessTokenCache] Erro ao salvar token: {e}")
+
+    def obter(self, provider: str, clinic_id: str, refresh_token: str, renovar: Callable[[], Tuple[str, float]]) -> Tuple[str, float]:
+        """
+        Retorna (access_token, expira_em epoch).
+        Usa o cache; se não houver token válido, renova com `renovar()` (que
+        deve retornar (token, expira_em)) segurando um lock no Redis. Quem não
+        pega o lock espera o token do outro worker e, no limite, renova sozinho.
+        """
+        em_cache = self._ler(provider, clinic_id, refresh_token)
+        if em_cache:
+            return em_cache
+
+        lock_key = self._lock_key(provider, clinic_id)
+        try:
+            tem_lock = bool(self.redis.set(lock_key, "1", nx=True, ex=ACCESS_TOKEN_LOCK_TTL))
+        except Exception:
+            tem_lock = True  # Redis fora: renova direto
+
+        if not tem_lock:
+            limite = time.monotonic() + ACCESS_TOKEN_ESPERA
+            while time.monotonic() < limite:
+                time.sleep(0.1)
+                em_cache = self._ler(provider, clinic_id, refresh_token)
+                if em_cache:
+                    return em_cache
+            print(f"⚠️ [AccessTokenCache] Espera esgotada, renovando token {provider} da clínica {clinic_id}")
+
+        try:
+            token, expira_em = renovar()
+            self._gravar(provider, clinic_id, refresh_token, token, expira_em)
+            print(f"🔑 [AccessTokenCache] Token {provider} renovado para clínica {clinic_id}")
+            return token, expira_em
+        finally:
+            if tem_lock:
+                try:
+                    self.redis.delete(lock_key)
+                except Exception:
+                    pass
+
+    def invalidate(self, provider: str, clinic_id: str):
+        """
+        Remove o access token em cache (ex: token rejeitado ou conta desconectada).
+        """
+        try:
+            self.redis.delete(self._key(provider, clinic_id))
+        except Exception as e:
+            print(f"⚠️ [AccessTokenCache] Erro ao invalidar token: {e}")
+
+
+# Instância global
+access_token_cache = AccessTokenCacheService()
@@ -7,6 +7,7 @@
 import os
 import datetime as dt
 import holidays
+from contextvars import ContextVar
 from typing import List, Optional
 from pydantic import BaseModel, Field
 from unidecode import unidecode
@@ -25,8 +26,17 @@ from langchain.schema import BaseMessage
 
 # Seus serviços
 from app.services.factory import get_calendar_service
-from app.services.buffer_service import BufferService
-from app.utils.date_utils import formatar_hora
+from app.services.clinic_context_service import clinic_context
+from app.services.token_ledger_service import token_ledger
+from app.services.availability_cache_service import availability_cache
+from app.services.slot_engine import (
+    MascaraDia,
+    OcupacaoDia,
+    calcular_slots_livres,
+    minutos_para_datetimes,
+    primeiro_inicio_hoje,
+)
+from app.utils.date_utils import formatar_hora, horario_expediente, proximos_dias_atendimento
 from app.core.database import get_supabase, TIMEZONE_BR, SLOT_CONSULTA
 
 load_dotenv()  # Carrega variáveis do .env
@@ -34,6 +44,11 @@ load_dotenv()  # Carrega variáveis do .env
 # Configuração do Supabase 
 supabase = get_supabase()
 
+MODELO_IA = "gpt-4.1-mini"
+
+# Janela máxima (em dias de atendimento) da busca de próximos horários
+MAX_DIAS_BUSCA = 14
+
 def normalizar_output(output) -> str:
     if output is None:
         return ""
@@ -94,6 +109,14 @@ class VerificaDisponibilidade(BaseModel):
     data: str = Field(description="Data para verificar no formato DD/MM/AAAA")
     nome_profissional: Optional[str] = Field(default=None, description="Nome do médico ou especialista")
 
+class BuscarProximosHorarios(BaseModel):
+    nome_profissional: Optional[str] = Field(default=None, description="Nome do médico. Envie APENAS o nome (ex: 'Roberto'), SEM títulos como Dr. ou Dra. Deixe vazio para buscar em todos.")
+    data_inicio: Optional[str] = Field(default=None, description="Data a partir da qual buscar, no formato DD/MM/AAAA. Vazio = hoje.")
+    dias: int = Field(default=5, description="Quantos dias de atendimento olhar a partir da data inicial (máx. 14)")
+    quantidade: int = Field(default=6, description="Quantos horários sugerir no total")
+    turno: Optional[str] = Field(default=None, description="'manha' ou 'tarde' se o paciente tiver preferência; vazio para qualquer turno")
+    duracao_minutos: int = Field(default=60, description="Duração da consulta em minutos (ex: 30, 60, 90)")
+
 class RealizaAgendamento(BaseModel):
     nome_paciente: str = Field(description="Nome completo do paciente")
     data_hora: str = Field(description="Data e hora ISO (ex: 2024-11-25T14:30:00)")
@@ -120,133 +143,101 @@ class ReagendarInput(BaseModel):
 class SalvarNomeClienteInput(BaseModel):
     nome_cliente: str = Field(description="O nome completo do cliente a ser salvo no sistema.")
     
+def identificar_paciente(clinic_id: str, session_id: str):
+    """
+    Busca se esse telefone (session_id) já é um paciente cadastrado.
+    """
+    # Limpa o session_id para garantir que só tem números
+    telefone_busca = ''.join(filter(str.isdigit, session_id))
+    
+    print(f"🔍 [DEBUG] Buscando paciente com telefone: {telefone_busca} (original: {session_id})")
+    
+    try:
+        response = supabase.table('leads')\
+            .select('nome', 'id', 'telefone')\
+            .eq('clinic_id', clinic_id)\
+            .eq('telefone', telefone_busca)\
+            .limit(1)\
+            .execute()
+        
+        print(f"🔍 [DEBUG] Resultado da busca: {response.data}")
+            
+        if response.data and len(response.data) > 0:
+            print(f"✅ [DEBUG] Paciente identificado: {response.data[0].get('nome')}")
+
+            if response.data[0].get('nome') == '':
+                return None
+            
+            return response.data[0]
+        
+        print(f"⚠️ [DEBUG] Nenhum paciente encontrado para este telefone")
+        return None 
+    except Exception as e:
+        print(f"❌ [DEBUG] Erro ao identificar paciente: {e}")
+        return None
+
+def buscar_consultas_paciente(clinic_id: str, session_id: str) -> list:
+    """
+    Busca as consultas do paciente pelo telefone (join com leads), sem
+    depender do ID do lead. Assim pode rodar em paralelo com identificar_paciente.
+    """
+    telefone_busca = ''.join(filter(str.isdigit, session_id))
+
+    try:
+        response = supabase.table('consultas')\
+            .select('horario_consulta, leads!inner(telefone)')\
+            .eq('clinic_id', clinic_id)\
+            .eq('leads.telefone', telefone_busca)\
+            .execute()
+        return response.data or []
+    except Exception as e:
+        print(f"❌ Erro ao buscar consultas do paciente: {e}")
+        return []
+
+# Marca "não pré-carregado" (None é um resultado válido para paciente)
+_CARREGAR = object()
+
 class AgenteClinica:
-    def __init__(self, clinic_id: str, session_id: str, lid: str):
+    def __init__(self, clinic_id: str, session_id: str, lid: str, contexto: Optional[dict] = None,
+                 dados_paciente=_CARREGAR, consultas_paciente=_CARREGAR):
+        """
+        contexto, dados_paciente e consultas_paciente podem vir pré-carregados
+        (o worker busca tudo em paralelo); o que não vier é buscado aqui.
+        """
         self.clinic_id = clinic_id
         self.session_id = session_id
         self.lid = lid
-        self.calendar_service = get_calendar_service(clinic_id)
-        self.cache_service = BufferService()  # Serviço de cache Redis
+        self.cache_service = availability_cache  # Cache de ocupação dos calendários (Redis)
         
-        # Carregar dados da clínica (Nome, Prompt, Profissionais)
-        self.dados_clinica = self._carregar_dados_clinica()
-        self.profissionais = self._carregar_profissionais()
+        # Carregar contexto da clínica (Nome, Prompt, Profissionais, Dias fechados) do cache
+        if contexto is None:
+            contexto = clinic_context.get(clinic_id)
+        if not contexto:
+            raise ValueError(f"Clínica não encontrada: {clinic_id}")
+
+        self.dados_clinica = contexto['clinica']
+        self.profissionais = contexto['profissionais']
         self.profissionais_por_id = {p['id']: p for p in self.profissionais} # Cache de profissionais por ID para busca O(1)
-        self.dados_paciente = self._identificar_paciente()
+        self.clinica_fechada = contexto['clinica_fechada']
+        self.tipo_calendario = contexto['tipo_calendario']
+        self._calendar_service = None
+
+        if dados_paciente is _CARREGAR:
+            dados_paciente = identificar_paciente(clinic_id, session_id)
+        self.dados_paciente = dados_paciente
+        self._consultas_paciente = consultas_paciente
         self.dia_hoje = self._formatar_data_extenso(dt.datetime.now(TIMEZONE_BR))
-        self.clinica_fechada = self._verificar_clinica_fechada()
 
-    def _carregar_dados_clinica(self):
-        response = supabase.table('clinicas').select('*').eq('id', self.clinic_id).single().execute()
-        return response.data
-
-    def _carregar_profissionais(self):
-        # Trazemos os profissionais para injetar no prompt do sistema
-        response = supabase.table('profissionais').select('id, nome, especialidade, external_calendar_id').eq('clinic_id', self.clinic_id).execute()
-        return response.data
-    
-    def _verificar_clinica_fechada(self):
+    @property
+    def calendar_service(self):
         """
-        Retorna a lista dos dias que a clínica está fechada.
-        O campo clinica_fechada é um JSONB que pode conter:
-        - Nova estrutura: [{"date": "2024-12-25", "description": "Feriado de Natal"}]
-        - Estrutura antiga: ["2024-12-25", "2024-01-01"] (retrocompatível)
+        Criado só quando alguma tool usa a agenda (evita buscar credenciais
+        e montar o client em mensagens que não envolvem calendário).
         """
-        dias_fechados_raw = self.dados_clinica.get('clinica_fechada')
-        
-        if not dias_fechados_raw:
-            return []
-        
-        dias_fechados = []
-        try:
-            if isinstance(dias_fechados_raw, list):
-                for item in dias_fechados_raw:
-                    # Nova estrutura: objeto com date e description
-                    if isinstance(item, dict):
-                        date_str = item.get('date')
-                        description = item.get('description', '')
-                        
-                        if not date_str:
-                            continue
-                        
-                        try:
-                            # Tenta parsear no formato ISO (YYYY-MM-DD)
-                            data_obj = dt.datetime.strptime(date_str, "%Y-%m-%d").date()
-                            dias_fechados.append({
-                                'date': data_obj,
-                                'description': description
-                            })
-                        except ValueError:
-                            try:
-                                # Tenta parsear no formato brasileiro (DD/MM/YYYY)
-                                data_obj = dt.datetime.strptime(date_str, "%d/%m/%Y").date()
-                                dias_fechados.append({
-                                    'date': data_obj,
-                                    'description': description
-                                })
-                            except ValueError:
-                                print(f"⚠️ Data inválida em clinica_fechada: {date_str}")
-                                continue
-                    
-                    # Estrutura antiga: apenas string (retrocompatibilidade)
-                    elif isinstance(item, str):
-                        try:
-                            # Tenta parsear no formato ISO (YYYY-MM-DD)
-                            data_obj = dt.datetime.strptime(item, "%Y-%m-%d").date()
-                            dias_fechados.append({
-                                'date': data_obj,
-                                'description': ''
-                            })
-                        except ValueError:
-                            try:
-                                # Tenta parsear no formato brasileiro (DD/MM/YYYY)
-                                data_obj = dt.datetime.strptime(item, "%d/%m/%Y").date()
-                                dias_fechados.append({
-                                    'date': data_obj,
-                                    'description': ''
-                                })
-                            except ValueError:
-                                print(f"⚠️ Data inválida em clinica_fechada: {item}")
-                                continue
-        except Exception as e:
-            print(f"❌ Erro ao processar clinica_fechada: {e}")
-            return []
-        
-        return dias_fechados
-    
-    def _identificar_paciente(self):
-        """
-        Busca se esse telefone (session_id) já é um paciente cadastrado.
-        """
-        # Limpa o session_id para garantir que só tem números
-        telefone_busca = ''.join(filter(str.isdigit, self.session_id))
-        
-        print(f"🔍 [DEBUG] Buscando paciente com telefone: {telefone_busca} (original: {self.session_id})")
-        
-        try:
-            response = supabase.table('leads')\
-                .select('nome', 'id', 'telefone')\
-                .eq('clinic_id', self.clinic_id)\
-                .eq('telefone', telefone_busca)\
-                .limit(1)\
-                .execute()
-            
-            print(f"🔍 [DEBUG] Resultado da busca: {response.data}")
-                
-            if response.data and len(response.data) > 0:
-                print(f"✅ [DEBUG] Paciente identificado: {response.data[0].get('nome')}")
+        if self._calendar_service is None:
+            self._calendar_service = get_calendar_service(self.clinic_id, self.tipo_calendario)
+        return self._calendar_service
 
-                if response.data[0].get('nome') == '':
-                    return None
-                
-                return response.data[0]
-            
-            print(f"⚠️ [DEBUG] Nenhum paciente encontrado para este telefone")
-            return None 
-        except Exception as e:
-            print(f"❌ [DEBUG] Erro ao identificar paciente: {e}")
-            return None
-        
     def _identificar_profissional(self, id: str):
         """
         Busca o profissional pelo id usando cache O(1).
@@ -270,8 +261,10 @@ class AgenteClinica:
         # Formata: Quarta-feira, 17/12/2025 - 14:30
         return f"{dia_semana}, {data.strftime('%d/%m/%Y - %H:%M')}"
     
-    def _gerar_bloco_paciente(self, paciente_id):
-        consultas = supabase.table('consultas').select('*').eq('paciente_id', paciente_id).execute().data
+    def _gerar_bloco_paciente(self):
+        consultas = self._consultas_paciente
+        if consultas is _CARREGAR:
+            consultas = buscar_consultas_paciente(self.clinic_id, self.session_id)
         
         if not consultas:
             return "Nenhuma consulta registrada ainda.\n"
@@ -331,130 +324,36 @@ class AgenteClinica:
 
         return f"Horários OCUPADOS em {data}:\n" + "\n".join(lista_ocupada)
     
-    def _calcular_slots_livres(self, eventos, data_base: dt.date, duracao_consulta_minutos: int = 60, eventos_ignorar: List[str] = []):
+    def _horario_expediente(self, data_base: dt.date):
+        """
+        Retorna (abertura, fechamento) em minutos desde a meia-noite para o dia
+        da semana de data_base, conforme horario_funcionamento da clínica.
+        Padrão 08:00 às 18:00. Retorna None se o dia não estiver ativo.
         """
-        Recebe a lista de eventos ocupados e retorna a lista de horários livres (slots de 5min).
-        Considera horário comercial 08:00 às 18:00.
+        return horario_expediente(self.dados_clinica.get('horario_funcionamento'), data_base)
+
+    def _calcular_slots_livres(self, ocupacao: OcupacaoDia, data_base: dt.date, duracao_consulta_minutos: int = 60, eventos_ignorar: List[str] = []):
+        """
+        Recebe a ocupação do dia e retorna a lista de horários livres (slots de 5min).
+        Considera o horário de funcionamento da clínica (padrão 08:00 às 18:00).
         duracao_consulta_minutos: Duração da consulta em minutos (padrão 60).
+        O cálculo é feito pelo slot_engine (intervalos mesclados + soma de prefixos).
         """
-        # Configuração da Clínica 
-        # Mapeamento de dias da semana (0=Segunda, 6=Domingo) para os nomes no JSON
-        dias_semana_map = {
-            0: "Segunda-feira",
-            1: "Terça-feira",
-            2: "Quarta-feira",
-            3: "Quinta-feira",
-            4: "Sexta-feira",
-            5: "Sábado",
-            6: "Domingo"
-        }
-        
-        dia_atual_nome = dias_semana_map.get(data_base.weekday())
-        horario_funcionamento = self.dados_clinica.get('horario_funcionamento') or []
-        
-        # Valores padrão
-        hora_abertura = 8
-        minuto_abertura = 0
-        hora_fechamento = 18
-        minuto_fechamento = 0
-        dia_ativo = True
-
-        # Busca configuração do dia
-        config_dia = next((h for h in horario_funcionamento if h.get('dia') == dia_atual_nome), None)
-        
-        if config_dia:
-            if not config_dia.get('ativo', True):
-                dia_ativo = False
-            else:
-                abertura_str = config_dia.get('abertura', '08:00')
-                fechamento_str = config_dia.get('fechamento', '18:00')
-                
-                try:
-                    hora_abertura, minuto_abertura = map(int, abertura_str.split(':'))
-                    hora_fechamento, minuto_fechamento = map(int, fechamento_str.split(':'))
-                except ValueError:
-                    pass # Mantém padrão se der erro no parse
+        expediente = self._horario_expediente(data_base)
 
         # Se o dia não for ativo, não há slots livres
-        if not dia_ativo:
+        if not expediente:
             return []
 
-        # DEFINIÇÕES DE TEMPO
-        duracao_consulta = dt.timedelta(minutes=duracao_consulta_minutos)  # Duração dinâmica do bloco ocupado
-        intervalo_step = dt.timedelta(minutes=SLOT_CONSULTA)     # Pulo visual (08:00, 08:05, 08:10...)
-        
-        # Fuso Horário
-        tz_br = TIMEZONE_BR
-        
-        # Define marcos de início e fim do dia
-        inicio_expediente = dt.datetime.combine(data_base, dt.time(hour=hora_abertura, minute=minuto_abertura), tzinfo=tz_br)
-        fim_expediente = dt.datetime.combine(data_base, dt.time(hour=hora_fechamento, minute=minuto_fechamento), tzinfo=tz_br)
-        
-        # Cursor que vai percorrer o dia
-        cursor_tempo = inicio_expediente
-
-        # --- TRATAMENTO PARA "HOJE" ---
-        agora = dt.datetime.now(tz_br)
-        
-        if data_base == agora.date():
-            # Margem de 1h de antecedência mínima
-            margem_seguranca = agora + dt.timedelta(hours=1)
-            
-            # Se a margem já passou do início do expediente, avançamos o cursor
-            if margem_seguranca > cursor_tempo:
-                cursor_tempo = margem_seguranca
-                
-                # Arredondamento Matemático para o próximo slot de 5 min
-                # Ex: Se são 14:12, viraria 15:12. Arredondamos para 15:15.
-                minutos = cursor_tempo.minute
-                resto = minutos % SLOT_CONSULTA
-                
-                if resto > 0:
-                    falta_para_proximo = SLOT_CONSULTA - resto
-                    cursor_tempo += dt.timedelta(minutes=falta_para_proximo)
-                
-                # Zera segundos para ficar limpo
-                cursor_tempo = cursor_tempo.replace(second=0, microsecond=0)
-
-        # --- LOOP DE VERIFICAÇÃO ---
-        slots_livres = []
-        
-        # Enquanto o horário do slot + duração da consulta couber no expediente
-        while cursor_tempo + duracao_consulta <= fim_expediente:
-            slot_inicio = cursor_tempo
-            slot_fim = cursor_tempo + duracao_consulta
-            
-            esta_livre = True
-            
-            for e in eventos:
-                try:
-                    # Se o evento for do próprio paciente, IGNORA O BLOQUEIO
-                    if e.get('id') in eventos_ignorar:
-                        continue
-                    
-                    # Bloqueia dias inteiros
-                    if 'date' in e['start']:
-                        esta_livre = False
-                        break
-
-                    start_evt = dt.datetime.fromisoformat(e['start'].get('dateTime'))
-                    end_evt = dt.datetime.fromisoformat(e['end'].get('dateTime'))
-                    
-                    # Lógica de Colisão de Horário
-                    if slot_inicio < end_evt and slot_fim > start_evt:
-                        esta_livre = False
-                        break
-                    
-                except:
-                    continue 
-
-            if esta_livre:
-                slots_livres.append(slot_inicio)
-            
-            # Avança o cursor em 5 minutos
-            cursor_tempo += intervalo_step
-
-        return slots_livres
+        abertura, fechamento = expediente
+        return calcular_slots_livres(
+            ocupacao,
+            data_base,
+            abertura,
+            fechamento,
+            duracao_minutos=duracao_consulta_minutos,
+            eventos_ignorar=eventos_ignorar,
+        )
     
     def _agrupar_horarios(self, slots_dt: List[dt.datetime]) -> str:
         """
@@ -496,6 +395,58 @@ class AgenteClinica:
                 
         return ", ".join(textos)
         
+    def _calendarios_alvo(self, nome_profissional: Optional[str] = None) -> List[dict]:
+        """
+        Retorna [{'nome', 'id'}] dos calendários a consultar: o do profissional
+        citado (lista vazia se não encontrado) ou todos.
+        """
+        calendarios_alvo = []
+        
+        if nome_profissional:
+            term = unidecode(nome_profissional).lower()
+            
+            for p in self.profissionais:
+                if term in p['nome_normalizado']:
+                    calendarios_alvo.append({'nome': p['nome'], 'id': p['external_calendar_id']})
+                    break
+        else:
+            for p in self.profissionais:
+                calendarios_alvo.append({'nome': p['nome'], 'id': p['external_calendar_id']})
+
+        return calendarios_alvo
+
+    def _ids_eventos_paciente(self) -> List[str]:
+        """
+        IDs dos eventos do calendário associados às consultas AGENDADAS do paciente.
+        """
+        if not self.dados_paciente:
+            return []
+
+        ids_para_ignorar = []
+        
+        try:
+            # Busca IDs dos eventos do Google associados a este paciente
+            minhas_consultas = supabase.table('consultas')\
+                .select('external_event_id')\
+                .eq('paciente_id', self.dados_paciente['id'])\
+                .eq('status', 'AGENDADA')\
+                .execute()
+            
+            if minhas_consultas.data:
+                ids_para_ignorar = [c['external_event_id'] for c in minhas_consultas.data if c['external_event_id']]
+                print(f"🕵️ Ignorando {len(ids_para_ignorar)} eventos do próprio paciente na verificação.")
+        except Exception as e:
+            print(f"⚠️ Erro ao buscar eventos para ignorar: {e}")
+
+        return ids_para_ignorar
+
+    def _buscar_ocupacao(self, calendar_ids: List[str], datas: List[dt.date]) -> dict:
+        """
+        Retorna {(calendar_id, data): OcupacaoDia} para todos os pares pedidos
+        (cache + uma única consulta ao calendário para o que faltar).
+        """
+        return self.cache_service.buscar(self.clinic_id, self.calendar_service, calendar_ids, datas)
+
     # --- DEFINIÇÃO DAS FERRAMENTAS (TOOLS) ---
 
     def _logic_verificar_disponibilidade(self, data: str, nome_profissional: Optional[str] = None):
@@ -507,10 +458,8 @@ class AgenteClinica:
         # 1. Parsing Data
         try:
             dt_inicio = dt.datetime.strptime(data, "%d/%m/%Y")
-            tz_br = TIMEZONE_BR
             # Garante que temos a data correta
             data_base = dt_inicio.date()
-            dt_inicio_busca = dt.datetime.combine(data_base, dt.time.min).replace(tzinfo=tz_br)
         except ValueError:
             return "Erro: Data inválida. Use dd/mm/aaaa."
 
@@ -533,60 +482,26 @@ class AgenteClinica:
                     return f"NEGADO: A clínica estará fechada no dia {data}{motivo}."
 
         # 3. Definição dos Calendários
-        calendarios_alvo = [] 
-        
-        if nome_profissional:
-            term = unidecode(nome_profissional).lower()
-            
-            for p in self.profissionais:
-                if term in unidecode(p['nome']).lower():
-                    calendarios_alvo.append({'nome': p['nome'], 'id': p['external_calendar_id']})
-                    break
+        calendarios_alvo = self._calendarios_alvo(nome_profissional)
                 
-            if not calendarios_alvo: 
-                return f"Profissional não encontrado."
-        else:
-            for p in self.profissionais:
-                calendarios_alvo.append({'nome': p['nome'], 'id': p['external_calendar_id']})
-        
-        # Inicializa lista de IDs para ignorar
-        ids_para_ignorar = []
+        if not calendarios_alvo: 
+            return f"Profissional não encontrado."
         
-        try:
-            # Busca IDs dos eventos do Google associados a este paciente
-            minhas_consultas = supabase.table('consultas')\
-                .select('external_event_id')\
-                .eq('paciente_id', self.dados_paciente['id'])\
-                .eq('status', 'AGENDADA')\
-                .execute()
-            
-            if minhas_consultas.data:
-                ids_para_ignorar = [c['external_event_id'] for c in minhas_consultas.data if c['external_event_id']]
-                print(f"🕵️ Ignorando {len(ids_para_ignorar)} eventos do próprio paciente na verificação.")
-        except Exception as e:
-            print(f"⚠️ Erro ao buscar eventos para ignorar: {e}")
+        # IDs dos eventos do próprio paciente (não bloqueiam a agenda)
+        ids_para_ignorar = self._ids_eventos_paciente()
 
-        # 4. Consulta e Cálculo (com Cache)
+        # 4. Consulta e Cálculo (ocupação em cache, filtros aplicados na leitura)
         relatorio_final = []
         
         try:
+            ocupacoes = self._buscar_ocupacao([cal['id'] for cal in calendarios_alvo], [data_base])
+
             for cal in calendarios_alvo:
-                # Busca profissional ID pelo calendar_id
-                prof_id = next((p['id'] for p in self.profissionais if p['external_calendar_id'] == cal['id']), None)
-                
-                # Tenta buscar no cache primeiro
-                slots_livres = self.cache_service.get_cached_availability(prof_id, data) if prof_id else None
-                
-                if slots_livres is None:
-                    # Cache MISS: Busca no Google Calendar
-                    eventos = self.calendar_service.listar_eventos(data=dt_inicio_busca, calendar_id=cal['id']) or []
-                    
-                    # Calcula slots livres (assume duração padrão de 60 minutos para verificação)
-                    slots_livres = self._calcular_slots_livres(eventos, data_base, duracao_consulta_minutos=60, eventos_ignorar=ids_para_ignorar)
-                    
-                    # Armazena no cache (TTL: 5 minutos)
-                    if prof_id:
-                        self.cache_service.set_cached_availability(prof_id, data, slots_livres, ttl=300)
+                # Calcula slots livres (assume duração padrão de 60 minutos para verificação)
+                slots_livres = self._calcular_slots_livres(
+                    ocupacoes[(cal['id'], data_base)], data_base,
+                    duracao_consulta_minutos=60, eventos_ignorar=ids_para_ignorar
+                )
                 
                 # Formata resposta
                 if not slots_livres:
@@ -621,6 +536,101 @@ class AgenteClinica:
 
         return cabecalho + "\n".join(relatorio_final) + instrucao
 
+    def _logic_buscar_proximos_horarios(self, nome_profissional: Optional[str] = None, data_inicio: Optional[str] = None,
+                                        dias: int = 5, quantidade: int = 6, turno: Optional[str] = None, duracao_minutos: int = 60):
+        """
+        Busca os primeiros horários livres nos próximos `dias` dias úteis
+        (a partir de data_inicio ou de hoje), com uma única consulta de
+        ocupação para todos os calendários.
+        """
+        print(f"--- TOOL: Buscando próximos horários (início={data_inicio}, dias={dias}, turno={turno}) ---")
+
+        tz_br = TIMEZONE_BR
+        agora = dt.datetime.now(tz_br)
+
+        try:
+            data_base = dt.datetime.strptime(data_inicio, "%d/%m/%Y").date() if data_inicio else agora.date()
+        except ValueError:
+            return "Erro: Data inválida. Use dd/mm/aaaa."
+
+        data_base = max(data_base, agora.date())
+        dias = min(max(int(dias or 1), 1), MAX_DIAS_BUSCA)
+        quantidade = min(max(int(quantidade or 1), 1), 20)
+        duracao_minutos = int(duracao_minutos or 60)
+        if duracao_minutos <= 0:
+            return "Erro: A duração da consulta deve ser maior que zero."
+        turno = unidecode(turno).lower().strip() if turno else None
+
+        calendarios_alvo = self._calendarios_alvo(nome_profissional)
+        if not calendarios_alvo:
+            return f"Profissional não encontrado."
+
+        # 1. Dias úteis candidatos (fim de semana, feriado, dia fechado e dia inativo ficam de fora)
+        dias_candidatos = proximos_dias_atendimento(
+            self.dados_clinica, self.clinica_fechada, data_base, dias, limite_dias=MAX_DIAS_BUSCA * 2
+        )
+
+        if not dias_candidatos:
+            return "Não há dias de atendimento no período pedido."
+
+        # 2. Ocupação do período (cache + uma única chamada ao calendário para o que faltar)
+        ids_para_ignorar = self._ids_eventos_paciente()
+        datas = [d for d, _ in dias_candidatos]
+
+        encontrados = []  # [(datetime, nome_profissional)]
+        try:
+            ocupacoes = self._buscar_ocupacao([cal['id'] for cal in calendarios_alvo], datas)
+
+            for cal in calendarios_alvo:
+                for data_dia, (abertura, fechamento) in dias_candidatos:
+                    intervalos = ocupacoes[(cal['id'], data_dia)].intervalos(ids_para_ignorar)
+                    if intervalos is None:
+                        continue
+
+                    mascara = MascaraDia(abertura, fechamento, intervalos)
+                    inicios = mascara.inicios_livres(duracao_minutos, primeiro_inicio_hoje(data_dia, agora))
+
+                    if turno == "manha":
+                        inicios = [m for m in inicios if m < 12 * 60]
+                    elif turno == "tarde":
+                        inicios = [m for m in inicios if m >= 12 * 60]
+
+                    # Sugestões sem sobreposição (uma consulta após a outra)
+                    ultimo = None
+                    sugestoes = []
+                    for m in inicios:
+                        if ultimo is None or m >= ultimo + duracao_minutos:
+                            sugestoes.append(m)
+                            ultimo = m
+                        if len(sugestoes) >= quantidade:
+                            break
+
+                    for slot in minutos_para_datetimes(data_dia, sugestoes):
+                        encontrados.append((slot, cal['nome']))
+
+        except Exception as e:
+            return f"Erro técnico na agenda: {str(e)}"
+
+        if not encontrados:
+            return f"Nenhum horário livre encontrado nos próximos {len(dias_candidatos)} dias de atendimento."
+
+        encontrados.sort(key=lambda item: item[0])
+        encontrados = encontrados[:quantidade]
+
+        # 3. Relatório agrupado por dia
+        linhas = []
+        dia_atual = None
+        for slot, nome in encontrados:
+            if slot.date() != dia_atual:
+                dia_atual = slot.date()
+                linhas.append(f"📅 {self._formatar_data_extenso(slot)}:")
+            linhas.append(f"   - {slot.strftime('%Hh%M').replace('h00', 'h')} com {nome}")
+
+        cabecalho = f"PRÓXIMOS HORÁRIOS LIVRES (consulta de {duracao_minutos} min):\n"
+        instrucao = "\n\n⚠️ IMPORTANTE PARA O AGENTE:\n1. Estes são os PRIMEIROS horários livres, não todos.\n2. Para ver todos os horários de um dia específico, use verificar_disponibilidade.\n3. NÃO ofereça horários que não estejam nesta lista ou no relatório de disponibilidade."
+
+        return cabecalho + "\n".join(linhas) + instrucao
+
     def _logic_realizar_agendamento(self, nome_paciente: str, data_hora: str, nome_profissional: str, duracao_minutos: int):
         """
         Realiza o agendamento final.
@@ -641,7 +651,7 @@ class AgenteClinica:
             term_busca = term_busca.replace("dr.", "").replace("dra.", "").replace("doutor", "").replace("doutora", "").strip()
             
             # Busca na lista (usando 'in' para permitir "Roberto" achar "Roberto Mendes")
-            prof_data = next((p for p in self.profissionais if term_busca in unidecode(p['nome']).lower()), None)
+            prof_data = next((p for p in self.profissionais if term_busca in p['nome_normalizado']), None)
 
             if not prof_data:
                 nomes = ", ".join([p['nome'] for p in self.profissionais])
@@ -795,8 +805,7 @@ class AgenteClinica:
             return f"Erro técnico no Google Calendar: {str(e)}"
 
         # 5. Invalidar cache de disponibilidade
-        data_agendamento = dt_inicio.strftime("%d/%m/%Y")
-        self.cache_service.invalidate_availability_cache(prof_data['id'], data_agendamento)
+        self.cache_service.invalidate(self.clinic_id, prof_data['external_calendar_id'], [dt_inicio.date()])
 
         return "Agendamento realizado com sucesso! Confirme para o usuário."
     
@@ -943,9 +952,8 @@ class AgenteClinica:
                 .execute()
             
             # 3. Invalidar cache de disponibilidade
-            prof_id = consulta_alvo['profissionais']['id'] if 'profissionais' in consulta_alvo and consulta_alvo['profissionais'] else None
-            if prof_id:
-                self.cache_service.invalidate_availability_cache(prof_id, data_consulta)
+            if calendar_id:
+                self.cache_service.invalidate(self.clinic_id, calendar_id, [c_dt.date()])
 
             return f"Sucesso: Consulta do dia {data_consulta} às {hora_consulta} foi cancelada."
 
@@ -996,7 +1004,7 @@ class AgenteClinica:
             term_busca = term_busca.replace("dr.", "").replace("dra.", "").replace("doutor", "").replace("doutora", "").strip()
             
             # Busca na lista (usando 'in' para permitir "Roberto" achar "Roberto Mendes")
-            found = next((p for p in self.profissionais if term_busca in unidecode(p['nome']).lower()), None)
+            found = next((p for p in self.profissionais if term_busca in p['nome_normalizado']), None)
             
             if found:
                 prof_novo_data = found
@@ -1027,10 +1035,7 @@ class AgenteClinica:
             else:
                 print(f"🔄 Trocando de médico: {prof_antigo['nome']} -> {prof_novo_data['nome']}")
                 
-                # 4.1. Remove da agenda antiga
-                self.calendar_service.cancelar_evento(prof_antigo['external_calendar_id'], novo_event_id)
-                
-                # 4.2. Cria na agenda nova
+                # Remove da agenda antiga e cria na nova numa única requisição (batch)
                 # Recriamos a descrição básica
                 descricao_formatada = f"""                
                 === 📋 DADOS DO CLIENTE ===
@@ -1042,13 +1047,27 @@ class AgenteClinica:
                 🤖 CANAL: Reagendamento via IA
                 """
                 
-                novo_evento_gcal = self.calendar_service.criar_evento(
-                    calendar_id=prof_novo_data['external_calendar_id'],
-                    resumo=f"Consulta reagendada: {self.dados_paciente['nome']} ({self.dados_paciente['telefone']})",
-                    inicio_dt=dt_novo,
-                    descricao=descricao_formatada
-                )
-                novo_event_id = novo_evento_gcal.get('id')
+                cancelamento, criacao = self.calendar_service.executar_lote([
+                    {
+                        'acao': 'cancelar',
+                        'calendar_id': prof_antigo['external_calendar_id'],
+                        'event_id': novo_event_id,
+                    },
+                    {
+                        'acao': 'criar',
+                        'calendar_id': prof_novo_data['external_calendar_id'],
+                        'resumo': f"Consulta reagendada: {self.dados_paciente['nome']} ({self.dados_paciente['telefone']})",
+                        'inicio_dt': dt_novo,
+                        'descricao': descricao_formatada,
+                    },
+                ])
+
+                if not cancelamento['ok']:
+                    print(f"⚠️ Erro ao cancelar evento antigo: {cancelamento['erro']}")
+                if not criacao['ok']:
+                    raise Exception(criacao['erro'])
+
+                novo_event_id = criacao['evento'].get('id')
 
         except Exception as e:
             return f"Erro técnico no Google Calendar: {str(e)}"
@@ -1083,14 +1102,13 @@ class AgenteClinica:
                 .execute()
             
             # Invalidar cache das datas afetadas (antiga e nova)
-            data_antiga_fmt = dt.datetime.strptime(data_atual, "%d/%m/%Y").strftime("%d/%m/%Y")
-            data_nova_fmt = dt_novo.strftime("%d/%m/%Y")
+            data_antiga = dt.datetime.strptime(data_atual, "%d/%m/%Y").date()
             
             # Invalida cache do profissional antigo na data antiga
-            self.cache_service.invalidate_availability_cache(prof_antigo['id'], data_antiga_fmt)
+            self.cache_service.invalidate(self.clinic_id, prof_antigo['external_calendar_id'], [data_antiga])
             
             # Invalida cache do profissional novo na data nova (pode ser o mesmo)
-            self.cache_service.invalidate_availability_cache(prof_novo_data['id'], data_nova_fmt)
+            self.cache_service.invalidate(self.clinic_id, prof_novo_data['external_calendar_id'], [dt_novo.date()])
 
             medico_nome = prof_novo_data['nome']
             return f"Sucesso! Reagendado para {dt_novo.strftime('%d/%m/%Y às %H:%M')} com {medico_nome}."
@@ -1118,13 +1136,13 @@ class AgenteClinica:
         except Exception as e:
             return f"Erro ao salvar nome do cliente: {str(e)}"
         
-    def _contar_tokens(self, texto: str, model="gpt-4.1-mini"):
-        enc = tiktoken.encoding_for_model(model)
-        return len(enc.encode(texto))
+    def _contar_tokens(self, texto: str):
+        return len(_get_encoding().encode(texto))
         
     def _debitar_tokens(self, tokens_gastos: int, custo_usd: float):
         """
-        Debita os tokens gastos do saldo da clínica no Supabase.
+        Registra o consumo no ledger (Redis). O débito em saldo_tokens /
+        tokens_comprados é aplicado em lote pelo scheduler.
         """
         try:
             clinic_id = self.dados_clinica.get('id')
@@ -1132,23 +1150,8 @@ class AgenteClinica:
             if not clinic_id:
                 return
 
-            # Busca saldo atual
-            resp = supabase.table('clinicas').select('saldo_tokens, tokens_comprados').eq('id', clinic_id).single().execute()
-            
-            if resp.data:
-                saldo_atual = resp.data.get('saldo_tokens', 0) or 0
-                coluna_saldo = 'saldo_tokens'
-
-                if saldo_atual <= 0:
-                    saldo_atual = resp.data.get('tokens_comprados', 0) or 0
-                    coluna_saldo = 'tokens_comprados'
-
-                # Evita saldo negativo, mas permite chegar a 0
-                novo_saldo = max(0, saldo_atual - tokens_gastos)
-                
-                # Atualiza no banco
-                supabase.table('clinicas').update({coluna_saldo: novo_saldo, 'custo_usd': custo_usd}).eq('id', clinic_id).execute()
-                print(f"📉 Tokens debitados: -{tokens_gastos} | Saldo restante: {novo_saldo}")
+            token_ledger.registrar_consumo(clinic_id, tokens_gastos, custo_usd, telefone=self.session_id)
+            print(f"📉 Tokens registrados no ledger: -{tokens_gastos}")
                 
         except Exception as e:
             print(f"❌ Erro ao debitar tokens: {e}")
@@ -1156,64 +1159,12 @@ class AgenteClinica:
     # --- O CÉREBRO (AGENTE) ---
 
     def executar(self, mensagem_usuario: str, historico_conversa: List = []):
-        # 1. Configurar LLM  
-        llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0, api_key=os.getenv("OPENAI_API_KEY"))
-
-        # 2. Bind das Ferramentas (Vincula as funções ao LLM)
-        # --- CRIAÇÃO DAS TOOLS DE FORMA EXPLÍCITA ---
-        # Aqui nós ligamos o método da classe (func) ao Schema Pydantic (args_schema)
-        # O LangChain entende que 'self' já está incluso no método bound.
-        tools = [
-            StructuredTool.from_function(
-                func=self._logic_verificar_disponibilidade,
-                name="verificar_disponibilidade",
-                description="Verifica se existem horários livres na agenda para uma data.",
-                args_schema=VerificaDisponibilidade
-            ),
-            StructuredTool.from_function(
-                func=self._logic_realizar_agendamento,
-                name="realizar_agendamento",
-                description="Realiza o agendamento final da consulta no calendário com duração específica.",
-                args_schema=RealizaAgendamento
-            ),
-            StructuredTool.from_function(
-                func=self._logic_verificar_consultas_existentes,
-                name="verificar_consultas_existentes",
-                description="Verifica se o paciente já tem consultas agendadas para uma data específica.",
-                args_schema=VerificaConsultasExistentes
-            ),
-            StructuredTool.from_function(
-                func=self._logic_listar_consultas_futuras,
-                name="listar_minhas_consultas",
-                description="Lista todas as consultas futuras agendadas para o paciente.",
-                args_schema=ListarMinhasConsultasInput
-            ),
-            StructuredTool.from_function(
-                func=self._logic_cancelar_agendamento,
-                name="cancelar_agendamento",
-                description="Cancela uma consulta específica baseada na data e hora fornecidas.",
-                args_schema=CancelarAgendamentoInput
-            ),
-            StructuredTool.from_function(
-                func=self._logic_reagendar_agendamento,
-                name="reagendar_agendamento",
-                description="Altera o horário de uma consulta existente. Requer data antiga (DD/MM/AAAA) e hora antiga (HH:MM) para identificar, e a nova data ISO. Se mudar o médico, informe o novo nome.",
-                args_schema=ReagendarInput
-            ),
-            StructuredTool.from_function(
-                func=self._logic_salvar_nome_cliente,
-                name="salvar_nome_cliente",
-                description="Salva o nome do cliente no sistema.",
-                args_schema=SalvarNomeClienteInput
-            )
-        ]
-
-        # 3. Criar o Prompt do Sistema
+        # 1. Montar o contexto do Prompt do Sistema
         lista_profs = ", ".join([f"{p['nome']} ({p['especialidade']})" for p in self.profissionais])
         
         # 1. Lógica do Paciente (Mantida e está ótima)
         if self.dados_paciente and self.dados_paciente['nome']:
-            historico_consultas = self._gerar_bloco_paciente(self.dados_paciente['id'])
+            historico_consultas = self._gerar_bloco_paciente()
             
             bloco_paciente = f"""
             --- PACIENTE IDENTIFICADO ---
@@ -1252,55 +1203,164 @@ class AgenteClinica:
         PROFISSIONAIS HOJE: {lista_profs}
         """
 
-        # 2. System Prompt Limpo (Sem repetições)
-        prompt = ChatPromptTemplate.from_messages([
-            # 🔒 System 1 — REGRAS FIXAS (JSON)
-            ("system", "Siga estritamente estas configurações operacionais:\n" + prompt_ia),
-
-            # 📌 System 2 — CONTEXTO DINÂMICO
-            ("system", contexto_tempo_real),
-            
-            # 👤 Dados do paciente (SYSTEM - instrução crítica)
-            ("system", f"INFORMAÇÕES DO PACIENTE (SIGA RIGOROSAMENTE):\n{bloco_paciente}"),
-
-            # 💬 Histórico
-            MessagesPlaceholder(variable_name="chat_history"),
-
-            # 👤 Usuário
-            ("user", "{input}"),
-
-            # 🤖 Scratchpad do agente
-            MessagesPlaceholder(variable_name="agent_scratchpad"),
-        ])
-        
-        mensagens = prompt.format_messages(
-            input=mensagem_usuario,
-            chat_history=historico_conversa,
-            agent_scratchpad=[]
-        )
-
-        # 3. Criar e Executar o Agente
-        tokens_prompt = self._contar_tokens(mensagens_para_texto(mensagens))
-        agent = create_tool_calling_agent(llm, tools, prompt)
-        agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
-        
-        resposta = agent_executor.invoke({
+        # 2. Variáveis do prompt (o template e o agente são compilados uma vez por processo)
+        variaveis_prompt = {
+            "prompt_ia": prompt_ia,
+            "contexto_tempo_real": contexto_tempo_real,
+            "bloco_paciente": bloco_paciente,
             "input": mensagem_usuario,
-            "chat_history": historico_conversa
-        })
+            "chat_history": historico_conversa,
+        }
+
+        # 3. Executar o Agente (as tools usam esta instância via contexto)
+        # O callback soma o `usage` devolvido pela OpenAI em todas as chamadas
+        # do loop do agente (inclusive as rodadas de tools)
+        token_contexto = _agente_atual.set(self)
+        try:
+            with get_openai_callback() as uso:
+                resposta = _get_agent_executor().invoke(variaveis_prompt)
+        finally:
+            _agente_atual.reset(token_contexto)
         
-        texto_output = normalizar_output(resposta.get("output"))
-        tokens_output = self._contar_tokens(texto_output)
-        total_tokens = int((tokens_prompt + tokens_output) * 1.15)
+        tokens_prompt = uso.prompt_tokens
+        tokens_output = uso.completion_tokens
+        total_tokens = uso.total_tokens
+        origem = f"OpenAI usage, {uso.successful_requests} chamadas"
+
+        if total_tokens == 0:
+            # Fallback: provedor não informou o uso, estima pelo tokenizer (com margem)
+            mensagens = PROMPT_AGENTE.format_messages(agent_scratchpad=[], **variaveis_prompt)
+            tokens_prompt = self._contar_tokens(mensagens_para_texto(mensagens))
+            tokens_output = self._contar_tokens(normalizar_output(resposta.get("output")))
+            total_tokens = int((tokens_prompt + tokens_output) * 1.15)
+            origem = "estimativa tiktoken"
         
-        print(f"💰 Uso nesta interação:")
+        print(f"💰 Uso nesta interação ({origem}):")
         print(f"   - Total Tokens: {total_tokens}")
         print(f"   - Tokens Input: {tokens_prompt}")
         print(f"   - Tokens Output: {tokens_output}")
         
         if total_tokens > 0:
             custo_usd = tokens_prompt * (0.4 / 1000000) + tokens_output * (1.6 / 1000000)
-            print(f"   - Custo Estimado (USD): ${custo_usd:.6f}")
+            print(f"   - Custo (USD): ${custo_usd:.6f}")
             self._debitar_tokens(total_tokens, custo_usd)
 
-        return resposta["output"]
\ No newline at end of file
+        return resposta["output"]
+
+# --- AGENTE COMPILADO (um por processo) ---
+# LLM, tools, prompt e AgentExecutor são criados uma única vez e reaproveitados
+# em todas as conversas. O estado da conversa (AgenteClinica) chega às tools
+# por um ContextVar definido em executar().
+
+_agente_atual: ContextVar = ContextVar("agente_atual")
+
+def _ferramenta(metodo: str, name: str, description: str, args_schema):
+    def _executar(**kwargs):
+        return getattr(_agente_atual.get(), metodo)(**kwargs)
+
+    return StructuredTool.from_function(
+        func=_executar,
+        name=name,
+        description=description,
+        args_schema=args_schema
+    )
+
+TOOLS_AGENTE = [
+    _ferramenta(
+        "_logic_verificar_disponibilidade",
+        name="verificar_disponibilidade",
+        description="Verifica se existem horários livres na agenda para uma data.",
+        args_schema=VerificaDisponibilidade
+    ),
+    _ferramenta(
+        "_logic_buscar_proximos_horarios",
+        name="buscar_proximos_horarios",
+        description="Busca os primeiros horários livres nos próximos dias de atendimento (ex: 'qualquer dia da semana que vem', 'o mais cedo possível'). Use em vez de chamar verificar_disponibilidade dia a dia.",
+        args_schema=BuscarProximosHorarios
+    ),
+    _ferramenta(
+        "_logic_realizar_agendamento",
+        name="realizar_agendamento",
+        description="Realiza o agendamento final da consulta no calendário com duração específica.",
+        args_schema=RealizaAgendamento
+    ),
+    _ferramenta(
+        "_logic_verificar_consultas_existentes",
+        name="verificar_consultas_existentes",
+        description="Verifica se o paciente já tem consultas agendadas para uma data específica.",
+        args_schema=VerificaConsultasExistentes
+    ),
+    _ferramenta(
+        "_logic_listar_consultas_futuras",
+        name="listar_minhas_consultas",
+        description="Lista todas as consultas futuras agendadas para o paciente.",
+        args_schema=ListarMinhasConsultasInput
+    ),
+    _ferramenta(
+        "_logic_cancelar_agendamento",
+        name="cancelar_agendamento",
+        description="Cancela uma consulta específica baseada na data e hora fornecidas.",
+        args_schema=CancelarAgendamentoInput
+    ),
+    _ferramenta(
+        "_logic_reagendar_agendamento",
+        name="reagendar_agendamento",
+        description="Altera o horário de uma consulta existente. Requer data antiga (DD/MM/AAAA) e hora antiga (HH:MM) para identificar, e a nova data ISO. Se mudar o médico, informe o novo nome.",
+        args_schema=ReagendarInput
+    ),
+    _ferramenta(
+        "_logic_salvar_nome_cliente",
+        name="salvar_nome_cliente",
+        description="Salva o nome do cliente no sistema.",
+        args_schema=SalvarNomeClienteInput
+    )
+]
+
+PROMPT_AGENTE = ChatPromptTemplate.from_messages([
+    # 🔒 System 1 — REGRAS FIXAS (JSON)
+    ("system", "Siga estritamente estas configurações operacionais:\n{prompt_ia}"),
+
+    # 📌 System 2 — CONTEXTO DINÂMICO
+    ("system", "{contexto_tempo_real}"),
+
+    # 👤 Dados do paciente (SYSTEM - instrução crítica)
+    ("system", "INFORMAÇÕES DO PACIENTE (SIGA RIGOROSAMENTE):\n{bloco_paciente}"),
+
+    # 💬 Histórico
+    MessagesPlaceholder(variable_name="chat_history"),
+
+    # 👤 Usuário
+    ("user", "{input}"),
+
+    # 🤖 Scratchpad do agente
+    MessagesPlaceholder(variable_name="agent_scratchpad"),
+])
+
+_agent_executor = None
+_encoding = None
+
+def _get_agent_executor() -> AgentExecutor:
+    """
+    Cria (uma vez) o ChatOpenAI com seu pool HTTP e o AgentExecutor.
+    """
+    global _agent_executor
+    if _agent_executor is None:
+        llm = ChatOpenAI(model=MODELO_IA, temperature=0, api_key=os.getenv("OPENAI_API_KEY"))
+        agent = create_tool_calling_agent(llm, TOOLS_AGENTE, PROMPT_AGENTE)
+        # stream_runnable=False: com streaming a OpenAI não devolve o usage e o
+        # get_openai_callback ficaria zerado (débito cairia na estimativa)
+        _agent_executor = AgentExecutor(agent=agent, tools=TOOLS_AGENTE, verbose=True, stream_runnable=False)
+    return _agent_executor
+
+def _get_encoding():
+    """
+    Tokenizer (cacheado) usado só como fallback quando a OpenAI não informa o usage.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.encoding_for_model(MODELO_IA)
+        except KeyError:
+            # Versões antigas do tiktoken não conhecem o modelo; família gpt-4o/4.1
+            _encoding = tiktoken.get_encoding("o200k_base")
+    return _encoding
@@ -1,86 +1,106 @@
 import os
-import requests
-import tempfile
+import shutil
+import subprocess
 from openai import OpenAI
 from dotenv import load_dotenv
+from app.core.uazapi_client import uazapi_client
 import base64
 
 load_dotenv()
 
-UAZAPI_URL = os.getenv("UAZAPI_URL")
+# Limite do Whisper é 25 MB; acima disso nem tenta enviar
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", str(25 * 1024 * 1024)))
+# Áudios maiores que isso são reduzidos (mono 16 kHz) antes do upload, se houver ffmpeg
+AUDIO_DOWNSAMPLE_BYTES = int(os.getenv("AUDIO_DOWNSAMPLE_BYTES", str(1024 * 1024)))
+FFMPEG_PATH = shutil.which("ffmpeg")
 
 class AudioService:
     def __init__(self):
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+    def _reduzir_audio(self, audio_bytes: bytes) -> bytes:
+        """
+        Converte para Opus mono 16 kHz via ffmpeg (stdin -> stdout, sem disco).
+        Em caso de erro devolve o áudio original.
+        """
+        try:
+            resultado = subprocess.run(
+                [
+                    FFMPEG_PATH, "-loglevel", "error",
+                    "-i", "pipe:0",
+                    "-ac", "1", "-ar", "16000",
+                    "-c:a", "libopus", "-b:a", "24k",
+                    "-f", "ogg", "pipe:1",
+                ],
+                input=audio_bytes,
+                capture_output=True,
+                timeout=30,
+            )
+            if resultado.returncode == 0 and resultado.stdout:
+                print(f"🗜️ Áudio reduzido: {len(audio_bytes)} -> {len(resultado.stdout)} bytes")
+                return resultado.stdout
+            print(f"⚠️ ffmpeg falhou: {resultado.stderr[:200]}")
+        except Exception as e:
+            print(f"⚠️ Erro ao reduzir áudio: {e}")
+        return audio_bytes
+
     def transcrever_audio_uazapi(self, token, message_id):
         """
         Usa o endpoint /message/download da Uazapi para baixar o áudio descriptografado.
+        O upload para o Whisper é feito direto da memória, sem arquivo temporário.
         """
-        temp_filename = None
-        
         try:
             print(f"📥 Baixando áudio da mensagem {message_id} via API...")
-            
-            # Endpoint baseado na documentação
-            url = f"{UAZAPI_URL}/message/download"
-            
-            headers = {
-                "Content-Type": "application/json",
-                "token": token
-            }
-            
+
             body = {
                 "id": message_id,
                 "return_base64": True,  # Pedimos o arquivo físico
                 "generate_mp3": False   # False = Retorna OGG (nativo do Whats), True = MP3
             }
-            
-            response = requests.post(url, json=body, headers=headers, timeout=15)
-            
+
+            response = uazapi_client.post("/message/download", json=body, token=token, idempotent=True)
+
             if response.status_code != 200:
                 print(f"❌ Erro Download Uazapi ({response.status_code}): {response.text}")
                 return None
-            
+
             resp_json = response.json()
             print("✅ Áudio baixado com sucesso.")
-            # print(resp_json)
-            
+
             # O Base64 pode vir em 'base64Data' ou 'data'
             audio_base64 = resp_json.get("base64Data") or resp_json.get("data")
-            
+            del resp_json, response
+
             if not audio_base64:
                 print("❌ Nenhum Base64 retornado pela API.")
                 return None
-            
+
             # Limpa cabeçalho se existir (data:audio/ogg;base64,...)
-            if "," in audio_base64:
-                audio_base64 = audio_base64.split(",")[1]
+            if audio_base64.startswith("data:"):
+                audio_base64 = audio_base64[audio_base64.find(",") + 1:]
 
-            # Decodifica
+            # Checa o tamanho antes de decodificar (base64 = 4/3 do binário)
+            if len(audio_base64) * 3 // 4 > AUDIO_MAX_BYTES:
+                print(f"❌ Áudio acima do limite de {AUDIO_MAX_BYTES} bytes.")
+                return None
+
+            # Decodifica (única cópia binária em memória)
             audio_bytes = base64.b64decode(audio_base64)
-            
-            # Salva temporário
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".ogg") as temp_file:
-                temp_file.write(audio_bytes)
-                temp_filename = temp_file.name
+            del audio_base64
 
-            # Transcreve
+            if FFMPEG_PATH and len(audio_bytes) > AUDIO_DOWNSAMPLE_BYTES:
+                audio_bytes = self._reduzir_audio(audio_bytes)
+
+            # Transcreve (tupla nome/bytes/mime: o SDK envia direto do buffer)
             print("📝 Enviando para OpenAI Whisper...")
-            with open(temp_filename, "rb") as audio_file:
-                transcript = self.client.audio.transcriptions.create(
-                    model="whisper-1", 
-                    file=audio_file,
-                    language="pt"
-                )
-            
+            transcript = self.client.audio.transcriptions.create(
+                model="whisper-1",
+                file=("audio.ogg", audio_bytes, "audio/ogg"),
+                language="pt"
+            )
+
             return transcript.text
 
         except Exception as e:
             print(f"❌ Erro na transcrição: {e}")
             return None
-            
-        finally:
-            if temp_filename and os.path.exists(temp_filename):
-                try: os.remove(temp_filename)
-                except: pass
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+    Cache de ocupação dos calendários (base do cálculo de disponibilidade).
+    Guarda a ocupação bruta (OcupacaoDia empacotada) por calendário e dia,
+    que vale para qualquer paciente e duração de consulta; exclusões do
+    paciente, duração e "agora" são aplicados na leitura pelo slot_engine.
+    Invalidação por calendário/dia (agendamento, cancelamento, reagendamento
+    ou edição pelo painel). Calendários com espelho em dia (calendar_mirror)
+    são lidos do espelho em vez da API.
+"""
+
+import os
+import datetime as dt
+from typing import Dict, Iterable, List, Tuple
+from dotenv import load_dotenv
+from app.services.buffer_service import BufferService
+from app.core.database import TIMEZONE_BR
+from app.services.slot_engine import OcupacaoDia, eventos_por_dia
+from app.services.calendar_mirror_service import calendar_mirror
+
+load_dotenv()
+
+class AvailabilityCacheService:
+    def __init__(self):
+        """
+        Usa o Redis do BufferService (mesmo padrão do ClinicCacheService).
+        """
+        self.redis = BufferService().client
+        self.TTL = int(os.getenv("AVAILABILITY_CACHE_TTL", "300"))
+
+    def _key(self, clinic_id: str, calendar_id: str, data: dt.date) -> str:
+        return f"cache:busy:{clinic_id}:{calendar_id}:{data.isoformat()}"
+
+    def get_many(self, clinic_id: str, calendar_ids: Iterable[str], datas: Iterable[dt.date]) -> Dict[Tuple[str, dt.date], OcupacaoDia]:
+        """
+        Busca a ocupação de vários calendários/dias num único MGET.
+        Retorna apenas os pares (calendar_id, data) encontrados no cache.
+        """
+        pares = [(cal_id, data) for cal_id in calendar_ids for data in datas]
+        if not pares:
+            return {}
+
+        try:
+            valores = self.redis.mget([self._key(clinic_id, cal_id, data) for cal_id, data in pares])
+        except Exception as e:
+            print(f"⚠️ [AvailabilityCache] Erro ao ler cache: {e}")
+            return {}
+
+        encontrados = {}
+        for par, valor in zip(pares, valores):
+            if not valor:
+                continue
+            try:
+                encontrados[par] = OcupacaoDia.desempacotar(valor)
+            except Exception:
+                continue
+
+        print(f"📦 [AvailabilityCache] {len(encontrados)}/{len(pares)} calendário-dia em cache")
+        return encontrados
+
+    def set_many(self, clinic_id: str, ocupacoes: Dict[Tuple[str, dt.date], OcupacaoDia], ttl: int = None):
+        """
+        Grava a ocupação de vários calendários/dias num único pipeline.
+        """
+        if not ocupacoes:
+            return
+
+        try:
+            pipe = self.redis.pipeline()
+            for (cal_id, data), ocupacao in ocupacoes.items():
+                pipe.setex(self._key(clinic_id, cal_id, data), ttl or self.TTL, ocupacao.empacotar())
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️ [AvailabilityCache] Erro ao salvar cache: {e}")
+
+    def buscar(self, clinic_id: str, calendar_service, calendar_ids: List[str], datas: List[dt.date], atualizar: bool = False) -> Dict[Tuple[str, dt.date], OcupacaoDia]:
+        """
+        Retorna {(calendar_id, data): OcupacaoDia} para todos os pares pedidos.
+        Lê o cache num único MGET; os calendários faltantes vêm do espelho
+        (se em dia) ou de uma única consulta de ocupação (período do primeiro
+        ao último dia).
+        atualizar=True ignora o cache e regrava tudo (usado pelo aquecimento).
+        """
+        calendar_ids = list(dict.fromkeys(calendar_ids))
+        datas = sorted(datas)
+        ocupacoes = {} if atualizar else self.get_many(clinic_id, calendar_ids, datas)
+
+        faltantes = [
+            cal_id for cal_id in calendar_ids
+            if any((cal_id, data) not in ocupacoes for data in datas)
+        ]
+        if not faltantes:
+            return ocupacoes
+
+        inicio_busca = dt.datetime.combine(datas[0], dt.time.min, tzinfo=TIMEZONE_BR)
+        fim_busca = dt.datetime.combine(datas[-1], dt.time.max, tzinfo=TIMEZONE_BR)
+        eventos_por_calendario = calendar_mirror.ler_periodo(clinic_id, faltantes, inicio_busca, fim_busca)
+        restantes = [cal_id for cal_id in faltantes if cal_id not in eventos_por_calendario]
+        if restantes:
+            eventos_por_calendario.update(calendar_service.consultar_ocupacao(restantes, inicio_busca, fim_busca))
+
+        novas = {}
+        for cal_id in faltantes:
+            eventos_dia = eventos_por_dia(eventos_por_calendario.get(cal_id) or [], datas)
+            for data in datas:
+                novas[(cal_id, data)] = OcupacaoDia.de_eventos(eventos_dia[data], data)
+
+        self.set_many(clinic_id, novas)
+        ocupacoes.update(novas)
+        return ocupacoes
+
+    def invalidate(self, clinic_id: str, calendar_id: str, datas: List[dt.date]):
+        """
+        Remove a ocupação de um calendário nos dias informados.
+        Deve ser chamado sempre que houver agendamento, cancelamento ou reagendamento.
+        """
+        calendar_mirror.marcar_desatualizado(clinic_id, calendar_id)
+        self.descartar(clinic_id, calendar_id, datas)
+
+    def descartar(self, clinic_id: str, calendar_id: str, datas: List[dt.date]):
+        """
+        Remove a ocupação em cache sem mexer no espelho (usado pela própria
+        sincronização do espelho).
+        """
+        if not calendar_id or not datas:
+            return
+
+        try:
+            self.redis.delete(*[self._key(clinic_id, calendar_id, data) for data in datas])
+            print(f"🗑️ [AvailabilityCache] Invalidado: {calendar_id} - {', '.join(d.isoformat() for d in datas)}")
+        except Exception as e:
+            print(f"⚠️ [AvailabilityCache] Erro ao invalidar cache: {e}")
+
+    def invalidate_calendar(self, clinic_id: str, calendar_id: str):
+        """
+        Remove todos os dias em cache de um calendário (quando a data do
+        evento alterado não é conhecida, ex: exclusão pelo painel).
+        """
+        calendar_mirror.marcar_desatualizado(clinic_id, calendar_id)
+        self.descartar_calendario(clinic_id, calendar_id)
+
+    def descartar_calendario(self, clinic_id: str, calendar_id: str):
+        """
+        Remove todos os dias em cache de um calendário sem mexer no espelho.
+        """
+        if not calendar_id:
+            return
+
+        try:
+            chaves = list(self.redis.scan_iter(match=f"cache:busy:{clinic_id}:{calendar_id}:*", count=200))
+            if chaves:
+                self.redis.delete(*chaves)
+            print(f"🗑️ [AvailabilityCache] Calendário invalidado: {calendar_id} ({len(chaves)} dias)")
+        except Exception as e:
+            print(f"⚠️ [AvailabilityCache] Erro ao invalidar calendário: {e}")
+
+
+# Instância global
+availability_cache = AvailabilityCacheService()
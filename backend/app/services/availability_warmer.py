@@ -0,0 +1,122 @@
+"""
+    Aquecimento do cache de ocupação (availability_cache).
+    Roda no scheduler: para as clínicas com conversas recentes (mais recentes
+    primeiro), busca a ocupação dos próximos dias de atendimento de todos os
+    profissionais numa única consulta por clínica e regrava o cache, para que a
+    primeira verificação de disponibilidade da conversa já seja cache hit.
+    Cada conta de calendário (clínica) tem um orçamento de chamadas por hora.
+"""
+
+import os
+import time
+import datetime as dt
+from dotenv import load_dotenv
+from app.core.database import TIMEZONE_BR
+from app.core.executor import run_parallel
+from app.services.buffer_service import BufferService
+from app.services.clinic_context_service import clinic_context
+from app.services.availability_cache_service import availability_cache
+from app.services.factory import get_calendar_service
+from app.utils.date_utils import proximos_dias_atendimento
+
+load_dotenv()
+
+# Sorted set {clinic_id: epoch da última mensagem recebida}
+ATIVIDADE_KEY = "warmer:clinics:activity"
+
+WARMER_DIAS = int(os.getenv("WARMER_DIAS", "5"))                              # dias de atendimento aquecidos
+WARMER_JANELA_ATIVIDADE = int(os.getenv("WARMER_JANELA_ATIVIDADE", "7200"))   # segundos desde a última mensagem
+WARMER_MAX_CLINICAS = int(os.getenv("WARMER_MAX_CLINICAS", "20"))             # clínicas por rodada
+WARMER_ORCAMENTO_HORA = int(os.getenv("WARMER_ORCAMENTO_HORA", "120"))        # chamadas de calendário por conta/hora
+
+redis_client = BufferService().client
+
+def registrar_atividade(clinic_id: str):
+    """
+    Marca a clínica como ativa (chamado quando uma conversa é disparada para a IA).
+    """
+    try:
+        redis_client.zadd(ATIVIDADE_KEY, {clinic_id: time.time()})
+    except Exception as e:
+        print(f"⚠️ [Warmer] Erro ao registrar atividade: {e}")
+
+def _clinicas_ativas() -> list:
+    """
+    Clínicas com mensagem dentro da janela, da mais recente para a mais antiga.
+    """
+    pipe = redis_client.pipeline()
+    pipe.zremrangebyscore(ATIVIDADE_KEY, 0, time.time() - WARMER_JANELA_ATIVIDADE)
+    pipe.zrevrange(ATIVIDADE_KEY, 0, WARMER_MAX_CLINICAS - 1)
+    _, clinicas = pipe.execute()
+    return clinicas
+
+def _reservar_orcamento(clinic_id: str, chamadas: int) -> bool:
+    """
+    Desconta `chamadas` do orçamento da hora atual da conta de calendário da
+    clínica. Retorna False (sem descontar) se o orçamento não comporta.
+    """
+    key = f"warmer:budget:{clinic_id}:{int(time.time() // 3600)}"
+    # Incrementa antes de checar: com GET + INCRBY duas execuções simultâneas
+    # liam o mesmo saldo e as duas gastavam
+    pipe = redis_client.pipeline()
+    pipe.incrby(key, chamadas)
+    pipe.expire(key, 3600)
+    usado, _ = pipe.execute()
+
+    if usado > WARMER_ORCAMENTO_HORA:
+        redis_client.decrby(key, chamadas)
+        return False
+    return True
+
+def aquecer_clinica(clinic_id: str) -> str:
+    """
+    Regrava a ocupação dos próximos WARMER_DIAS dias de atendimento de todos
+    os profissionais da clínica. Retorna o resultado para o log.
+    """
+    try:
+        contexto = clinic_context.get(clinic_id)
+        if not contexto:
+            return "sem clínica"
+
+        calendar_ids = list(dict.fromkeys(
+            p['external_calendar_id'] for p in contexto['profissionais'] if p.get('external_calendar_id')
+        ))
+        if not calendar_ids:
+            return "sem calendários"
+
+        hoje = dt.datetime.now(TIMEZONE_BR).date()
+        dias = proximos_dias_atendimento(contexto['clinica'], contexto['clinica_fechada'], hoje, WARMER_DIAS)
+        if not dias:
+            return "sem dias de atendimento"
+
+        # O batch conta uma chamada por calendário na cota da conta
+        if not _reservar_orcamento(clinic_id, len(calendar_ids)):
+            return "orçamento esgotado"
+
+        calendar_service = get_calendar_service(clinic_id, contexto['tipo_calendario'])
+        availability_cache.buscar(clinic_id, calendar_service, calendar_ids, [d for d, _ in dias], atualizar=True)
+        return f"{len(calendar_ids)} calendários x {len(dias)} dias"
+
+    except Exception as e:
+        return f"erro: {e}"
+
+def aquecer_disponibilidade():
+    """
+    Rodada do aquecimento (scheduler). As clínicas são processadas em paralelo,
+    cada uma com sua própria conta de calendário.
+    """
+    try:
+        clinicas = _clinicas_ativas()
+    except Exception as e:
+        print(f"❌ [Warmer] Erro ao buscar clínicas ativas: {e}")
+        return
+
+    if not clinicas:
+        return
+
+    resultados = run_parallel(
+        {clinic_id: (aquecer_clinica, clinic_id) for clinic_id in clinicas},
+        etapa="Warmer"
+    )
+    for clinic_id, resultado in resultados.items():
+        print(f"🔥 [Warmer] {clinic_id}: {resultado}")
@@ -1,136 +1,222 @@
 import os
+import time
 import redis
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Sorted set com o deadline (score = epoch em segundos) de cada conversa pendente
+DEADLINES_KEY = "buffer:deadlines"
+# Sorted set das rajadas reivindicadas pelo poller (score = fim do lease em ms)
+PROCESSING_KEY = "buffer:processing"
+
+# Os scripts recebem todas as chaves em KEYS: os sorted sets globais e as
+# chaves da conversa (msgs, meta, proc:msgs, proc:meta, ver _chaves_conversa).
+# Como misturam chaves globais com chaves por conversa, exigem Redis de nó
+# único (em Redis Cluster cairiam em slots diferentes -> CROSSSLOT).
+
+# Reivindica uma conversa vencida e lê o meta na mesma operação atômica.
+# Conversa que ainda está em processamento (ou cujo deadline foi empurrado
+# depois do ZRANGEBYSCORE) fica no agendamento para a próxima rodada.
+# Retorna o meta no formato do HGETALL, ou false se não reivindicou.
+CLAIM_SCRIPT = """
+local m = ARGV[1]
+local deadline = redis.call('ZSCORE', KEYS[1], m)
+if not deadline or tonumber(deadline) > tonumber(ARGV[2]) then return false end
+if redis.call('ZSCORE', KEYS[2], m) then return false end
+redis.call('ZREM', KEYS[1], m)
+redis.call('ZADD', KEYS[2], ARGV[3], m)
+redis.call('DEL', KEYS[5], KEYS[6])
+if redis.call('EXISTS', KEYS[3]) == 1 then redis.call('RENAME', KEYS[3], KEYS[5]) end
+if redis.call('EXISTS', KEYS[4]) == 1 then redis.call('RENAME', KEYS[4], KEYS[6]) end
+return redis.call('HGETALL', KEYS[6])
+"""
+
+# Apaga a rajada reivindicada, desde que o lease ainda seja o mesmo.
+ACK_SCRIPT = """
+local m = ARGV[1]
+local lease = redis.call('ZSCORE', KEYS[1], m)
+if lease and tonumber(lease) == tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[2], KEYS[3])
+    redis.call('ZREM', KEYS[1], m)
+    return 1
+end
+return 0
+"""
+
+# Devolve a rajada reivindicada ao buffer: mensagens na frente das novas,
+# meta novo prevalece (HSETNX) e deadline de retry se não houver um menor.
+REQUEUE_SCRIPT = """
+local m = ARGV[1]
+local antigas = redis.call('LRANGE', KEYS[5], 0, -1)
+if #antigas > 0 then
+    for i = #antigas, 1, -1 do redis.call('LPUSH', KEYS[3], antigas[i]) end
+    redis.call('EXPIRE', KEYS[3], 3600)
+    local campos = redis.call('HGETALL', KEYS[6])
+    for i = 1, #campos, 2 do redis.call('HSETNX', KEYS[4], campos[i], campos[i + 1]) end
+    redis.call('EXPIRE', KEYS[4], 3600)
+    local atual = redis.call('ZSCORE', KEYS[1], m)
+    if not atual or tonumber(atual) > tonumber(ARGV[2]) then
+        redis.call('ZADD', KEYS[1], ARGV[2], m)
+    end
+end
+redis.call('DEL', KEYS[5], KEYS[6])
+redis.call('ZREM', KEYS[2], m)
+return #antigas
+"""
+
+def _chaves_conversa(member: str) -> list:
+    """
+    Chaves da conversa na ordem esperada pelos scripts:
+    msgs, meta, proc:msgs, proc:meta.
+    """
+    return [
+        f"buffer:msgs:{member}",
+        f"buffer:meta:{member}",
+        f"buffer:proc:msgs:{member}",
+        f"buffer:proc:meta:{member}",
+    ]
+
 class BufferService:
     def __init__(self):
         # Pega a URL do Redis do .env ou usa o padrão do Docker
         redis_url = os.getenv("CACHE_REDIS_URI")
 
         self.client = redis.from_url(redis_url, decode_responses=True)
-        # Tempo do Lock = Tempo do Buffer + Margem de segurança (10s)
-        self.LOCK_TTL = 20 
+        # Silêncio necessário (em segundos) antes de disparar a IA
+        self.BUFFER_DELAY = int(os.getenv("BUFFER_DELAY", "10"))
+        # Espera máxima desde a primeira mensagem da rajada (evita adiar para sempre)
+        self.BUFFER_MAX_WAIT = int(os.getenv("BUFFER_MAX_WAIT", "30"))
+        # Tempo que o poller tem para enfileirar uma rajada antes de ela voltar ao buffer
+        self.BUFFER_LEASE = int(os.getenv("BUFFER_LEASE", "60"))
+        # Atraso até a nova tentativa quando o enfileiramento falha
+        self.BUFFER_RETRY_DELAY = int(os.getenv("BUFFER_RETRY_DELAY", "5"))
+
+        self._claim_script = self.client.register_script(CLAIM_SCRIPT)
+        self._ack_script = self.client.register_script(ACK_SCRIPT)
+        self._requeue_script = self.client.register_script(REQUEUE_SCRIPT)
 
     def add_message(self, clinic_id: str, phone: str, message: str):
         """
         Adiciona a mensagem na lista do Redis.
         """
         key = f"buffer:msgs:{clinic_id}:{phone}"
-        self.client.rpush(key, message)
+        pipe = self.client.pipeline()
+        pipe.rpush(key, message)
         # Expira em 1 hora para não deixar lixo se der erro
-        self.client.expire(key, 3600)
+        pipe.expire(key, 3600)
+        pipe.execute()
 
-    def should_start_timer(self, clinic_id: str, phone: str) -> bool:
+    def schedule_flush(self, clinic_id: str, phone: str, token_instancia: str, lid: str) -> bool:
         """
-        Tenta adquirir o 'cadeado' para iniciar o timer.
-        Retorna True se você for o primeiro (deve iniciar o timer).
-        Retorna False se já existe um timer rodando (apenas ignore).
+        Empurra o deadline da conversa para agora + BUFFER_DELAY (debounce),
+        limitado a BUFFER_MAX_WAIT desde a primeira mensagem da rajada.
+        Tudo fica no Redis, então rajadas pendentes sobrevivem a restart/deploy.
+        Retorna True se esta mensagem abriu uma nova rajada.
         """
-        key = f"buffer:lock:{clinic_id}:{phone}"
-        
-        # setnx (Set if Not Exists) é atômico.
-        # Só retorna True se a chave NÃO existia.
-        acquired = self.client.setnx(key, "processing")
-        
-        if acquired:
-            # Se conseguiu o lock, define o tempo que ele vai durar (o tempo do buffer)
-            self.client.expire(key, self.LOCK_TTL)
-            return True
-            
-        return False
-
-    def get_and_clear_messages(self, clinic_id: str, phone: str) -> str:
+        member = f"{clinic_id}:{phone}"
+        meta_key = f"buffer:meta:{clinic_id}:{phone}"
+        agora = time.time()
+
+        pipe = self.client.pipeline()
+        pipe.hsetnx(meta_key, "inicio", agora)
+        pipe.hset(meta_key, mapping={"token": token_instancia or "", "lid": lid or ""})
+        pipe.hget(meta_key, "inicio")
+        pipe.expire(meta_key, 3600)
+        nova_rajada, _, inicio, _ = pipe.execute()
+
+        inicio = float(inicio or agora)
+        deadline = min(agora + self.BUFFER_DELAY, inicio + self.BUFFER_MAX_WAIT)
+        self.client.zadd(DEADLINES_KEY, {member: deadline})
+
+        return bool(nova_rajada)
+
+    def claim_due_conversations(self, limit: int = 100) -> list:
         """
-        Pega todas as mensagens acumuladas, junta e limpa.
+        Reivindica as conversas cujo deadline já venceu.
+        Num script atômico por conversa: tira a conversa do agendamento, registra no conjunto
+        de processamento com um lease e move mensagens/meta para chaves de
+        processamento. Mensagens que chegarem depois abrem uma nova rajada,
+        sem misturar com a que está sendo enviada.
+        As chaves só são apagadas no ack (após enfileirar); se o poller cair
+        antes disso, requeue_expired devolve a rajada ao buffer.
         """
-        key = f"buffer:msgs:{clinic_id}:{phone}"
-        lock_key = f"buffer:lock:{clinic_id}:{phone}"
-        
-        # Pega todas as mensagens da lista (0 a -1)
-        messages = self.client.lrange(key, 0, -1)
-        
+        agora = time.time()
+        lease = int((agora + self.BUFFER_LEASE) * 1000)
+        members = self.client.zrangebyscore(DEADLINES_KEY, '-inf', agora, start=0, num=limit)
+        if not members:
+            return []
+
+        # Um script por conversa (com todas as chaves declaradas), num único round-trip
+        pipe = self.client.pipeline(transaction=False)
+        for member in members:
+            self._claim_script(
+                keys=[DEADLINES_KEY, PROCESSING_KEY, *_chaves_conversa(member)],
+                args=[member, agora, lease],
+                client=pipe
+            )
+        resultado = pipe.execute()
+
+        vencidas = []
+        for member, meta_lista in zip(members, resultado):
+            if meta_lista is None:
+                continue
+            meta = dict(zip(meta_lista[::2], meta_lista[1::2]))
+            clinic_id, phone = member.split(":", 1)
+            vencidas.append({
+                "clinic_id": clinic_id,
+                "phone": phone,
+                "token": meta.get("token") or None,
+                "lid": meta.get("lid") or None,
+                "lease": lease,
+            })
+
+        return vencidas
+
+    def get_claimed_messages(self, clinic_id: str, phone: str) -> str:
+        """
+        Junta as mensagens da rajada reivindicada (sem apagar; ver ack_conversation).
+        """
+        messages = self.client.lrange(f"buffer:proc:msgs:{clinic_id}:{phone}", 0, -1)
+
         if not messages:
             return None
-            
-        # Limpa o buffer e o lock
-        self.client.delete(key)
-        self.client.delete(lock_key)
-        
+
         # Junta as mensagens com ponto final para a IA entender a separação
         return ". ".join(messages)
-    
-    # --- CACHE DE DISPONIBILIDADE ---
-    
-    def get_cached_availability(self, profissional_id: str, data: str):
+
+    def ack_conversation(self, conversa: dict):
         """
-        Busca slots livres no cache para um profissional em uma data específica.
-        
-        Args:
-            profissional_id: ID do profissional
-            data: Data no formato DD/MM/AAAA
-            
-        Returns:
-            Lista de slots livres (ex: ["08:00", "09:00", "14:00"]) ou None se não houver cache
+        Conclui a rajada reivindicada (enfileirada ou descartada de propósito).
+        Só apaga se o lease ainda for o nosso: se ele venceu e a rajada já foi
+        devolvida/reivindicada de novo, não apaga a do outro.
         """
-        key = f"cache:availability:{profissional_id}:{data}"
-        
-        try:
-            cached_data = self.client.get(key)
-            
-            if cached_data:
-                print(f"✅ [Cache HIT] Disponibilidade encontrada: {profissional_id} - {data}")
-                # Converte string JSON de volta para lista
-                import json
-                return json.loads(cached_data)
-            else:
-                print(f"❌ [Cache MISS] Disponibilidade não encontrada: {profissional_id} - {data}")
-                return None
-                
-        except Exception as e:
-            print(f"⚠️ Erro ao buscar cache: {e}")
-            return None
-    
-    def set_cached_availability(self, profissional_id: str, data: str, slots_livres: list, ttl: int = 300):
+        member = f"{conversa['clinic_id']}:{conversa['phone']}"
+        self._ack_script(
+            keys=[PROCESSING_KEY, *_chaves_conversa(member)[2:]],
+            args=[member, conversa["lease"]]
+        )
+
+    def requeue_conversation(self, clinic_id: str, phone: str) -> int:
         """
-        Armazena slots livres no cache com TTL (Time To Live).
-        
-        Args:
-            profissional_id: ID do profissional
-            data: Data no formato DD/MM/AAAA
-            slots_livres: Lista de horários livres (ex: ["08:00", "09:00"])
-            ttl: Tempo de vida em segundos (padrão: 300s = 5 minutos)
+        Devolve a rajada reivindicada ao buffer (falha ao enfileirar).
+        As mensagens voltam na frente das que chegaram depois, e o deadline
+        fica em agora + BUFFER_RETRY_DELAY (ou antes, se já houver um menor).
+        Retorna quantas mensagens voltaram.
         """
-        key = f"cache:availability:{profissional_id}:{data}"
-        
-        try:
-            import json
-            # Serializa a lista para JSON
-            self.client.setex(key, ttl, json.dumps(slots_livres))
-            print(f"💾 [Cache SET] Armazenado: {profissional_id} - {data} (TTL: {ttl}s)")
-            
-        except Exception as e:
-            print(f"⚠️ Erro ao salvar cache: {e}")
-    
-    def invalidate_availability_cache(self, profissional_id: str, data: str):
+        member = f"{clinic_id}:{phone}"
+        return self._requeue_script(
+            keys=[DEADLINES_KEY, PROCESSING_KEY, *_chaves_conversa(member)],
+            args=[member, time.time() + self.BUFFER_RETRY_DELAY]
+        )
+
+    def requeue_expired(self) -> int:
         """
-        Invalida o cache de disponibilidade para um profissional em uma data específica.
-        Deve ser chamado sempre que houver agendamento, cancelamento ou reagendamento.
-        
-        Args:
-            profissional_id: ID do profissional
-            data: Data no formato DD/MM/AAAA
+        Devolve ao buffer as rajadas cujo lease venceu (poller caiu entre o
+        claim e o ack). Retorna quantas conversas foram devolvidas.
         """
-        key = f"cache:availability:{profissional_id}:{data}"
-        
-        try:
-            deleted = self.client.delete(key)
-            
-            if deleted:
-                print(f"🗑️ [Cache INVALIDATED] Removido cache: {profissional_id} - {data}")
-            else:
-                print(f"ℹ️ [Cache] Nenhum cache para invalidar: {profissional_id} - {data}")
-                
-        except Exception as e:
-            print(f"⚠️ Erro ao invalidar cache: {e}")
\ No newline at end of file
+        members = self.client.zrangebyscore(PROCESSING_KEY, 0, int(time.time() * 1000))
+        for member in members:
+            clinic_id, phone = member.split(":", 1)
+            self.requeue_conversation(clinic_id, phone)
+        return len(members)
@@ -0,0 +1,56 @@
+"""
+    Cache da lista de calendários da conta conectada (calendarList) por clínica.
+    A lista muda raramente (novo profissional, reconexão da conta) e era
+    buscada paginada a cada abertura da agenda no painel.
+"""
+
+import os
+import json
+from dotenv import load_dotenv
+from app.services.buffer_service import BufferService
+
+load_dotenv()
+
+class CalendarListCacheService:
+    def __init__(self):
+        """
+        Usa o Redis do BufferService (mesmo padrão do ClinicCacheService).
+        """
+        self.redis = BufferService().client
+        self.TTL = int(os.getenv("CALENDAR_LIST_CACHE_TTL", "600"))
+
+    def _key(self, clinic_id: str) -> str:
+        return f"cache:calendar_list:{clinic_id}"
+
+    def get(self, clinic_id: str, calendar_service) -> list:
+        """
+        Lista de calendários da clínica; busca na API só se não estiver em cache.
+        """
+        try:
+            cached = self.redis.get(self._key(clinic_id))
+            if cached:
+                return json.loads(cached)
+        except Exception as e:
+            print(f"⚠️ [CalendarListCache] Erro ao ler cache: {e}")
+
+        return self.set(clinic_id, calendar_service.listar_calendarios())
+
+    def set(self, clinic_id: str, calendars: list) -> list:
+        try:
+            self.redis.setex(self._key(clinic_id), self.TTL, json.dumps(calendars))
+        except Exception as e:
+            print(f"⚠️ [CalendarListCache] Erro ao salvar cache: {e}")
+        return calendars
+
+    def invalidate(self, clinic_id: str):
+        """
+        Deve ser chamado quando a conta de calendário da clínica é (re)conectada.
+        """
+        try:
+            self.redis.delete(self._key(clinic_id))
+        except Exception as e:
+            print(f"⚠️ [CalendarListCache] Erro ao invalidar cache: {e}")
+
+
+# Instância global
+calendar_list_cache = CalendarListCacheService()
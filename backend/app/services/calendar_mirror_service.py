@@ -0,0 +1,278 @@
+"""
+    Espelho local dos calendários do Google (um por calendário de profissional).
+    Os eventos ficam no Redis, separados por dia, e são mantidos por
+    sincronização incremental (events.list com syncToken): só o que mudou
+    desde a última sincronização trafega. As mudanças chegam por push
+    (events.watch -> /webhook/google-calendar) quando GOOGLE_CALENDAR_WEBHOOK_URL
+    está configurada, e o scheduler sincroniza periodicamente como fallback
+    (funciona sem endereço público, ex: ambiente local).
+    Leituras só usam o espelho se ele estiver em dia; senão caem na API.
+"""
+
+import os
+import json
+import time
+import uuid
+import datetime as dt
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.core.database import TIMEZONE_BR
+from app.services.buffer_service import BufferService
+from app.services.slot_engine import dias_do_evento, _para_datetime
+from app.services.google_calendar_service import SyncTokenExpirado
+
+load_dotenv()
+
+ESPELHO_DIAS = int(os.getenv("ESPELHO_DIAS", "60"))                              # dias à frente mantidos no espelho
+ESPELHO_MAX_ATRASO = int(os.getenv("ESPELHO_MAX_ATRASO", "900"))                 # segundos sem sincronizar até o espelho ser ignorado
+ESPELHO_RESYNC_COMPLETO = int(os.getenv("ESPELHO_RESYNC_COMPLETO", "86400"))     # carga completa periódica (avança a janela)
+GOOGLE_CALENDAR_WEBHOOK_URL = os.getenv("GOOGLE_CALENDAR_WEBHOOK_URL")
+GOOGLE_CALENDAR_WEBHOOK_TOKEN = os.getenv("GOOGLE_CALENDAR_WEBHOOK_TOKEN")
+CANAL_TTL = int(os.getenv("GOOGLE_CALENDAR_CANAL_TTL", str(7 * 86400)))
+CANAL_RENOVAR_ANTES = 86400
+
+class CalendarMirrorService:
+    def __init__(self):
+        self.redis = BufferService().client
+
+    def _estado_key(self, clinic_id: str, calendar_id: str) -> str:
+        return f"espelho:estado:{clinic_id}:{calendar_id}"
+
+    def _indice_key(self, clinic_id: str, calendar_id: str) -> str:
+        # {event_id: "data1,data2"}: dias em que o evento está gravado
+        return f"espelho:indice:{clinic_id}:{calendar_id}"
+
+    def _dia_key(self, clinic_id: str, calendar_id: str, data: dt.date) -> str:
+        # {event_id: evento JSON}
+        return f"espelho:dia:{clinic_id}:{calendar_id}:{data.isoformat()}"
+
+    def _canal_key(self, canal_id: str) -> str:
+        return f"espelho:canal:{canal_id}"
+
+    # ---------------- Leitura ----------------
+
+    def _em_dia(self, estado: dict, primeiro: dt.date, ultimo: dt.date) -> bool:
+        if not estado.get('sincronizado_em') or not estado.get('cobertura_ate'):
+            return False
+        # Escrita feita pela aplicação depois da última sincronização
+        if estado.get('versao', '0') != estado.get('versao_sincronizada'):
+            return False
+        if time.time() - float(estado['sincronizado_em']) > ESPELHO_MAX_ATRASO:
+            return False
+        return dt.date.fromisoformat(estado['cobertura_de']) <= primeiro and ultimo <= dt.date.fromisoformat(estado['cobertura_ate'])
+
+    def ler_periodo(self, clinic_id: str, calendar_ids: List[str], start_dt: dt.datetime, end_dt: dt.datetime) -> Dict[str, list]:
+        """
+        Eventos de [start_dt, end_dt) dos calendários cujo espelho está em dia.
+        Calendários fora do espelho (ou atrasados) não aparecem no retorno.
+        """
+        if start_dt.tzinfo is None:
+            start_dt = start_dt.replace(tzinfo=TIMEZONE_BR)
+        if end_dt.tzinfo is None:
+            end_dt = end_dt.replace(tzinfo=TIMEZONE_BR)
+
+        primeiro = start_dt.astimezone(TIMEZONE_BR).date()
+        ultimo = (end_dt - dt.timedelta(microseconds=1)).astimezone(TIMEZONE_BR).date()
+        dias = [primeiro + dt.timedelta(days=i) for i in range((ultimo - primeiro).days + 1)]
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for cal_id in calendar_ids:
+                pipe.hgetall(self._estado_key(clinic_id, cal_id))
+            estados = pipe.execute()
+
+            em_dia = [cal_id for cal_id, estado in zip(calendar_ids, estados) if self._em_dia(estado, primeiro, ultimo)]
+            if not em_dia:
+                return {}
+
+            pipe = self.redis.pipeline(transaction=False)
+            for cal_id in em_dia:
+                for dia in dias:
+                    pipe.hvals(self._dia_key(clinic_id, cal_id, dia))
+            valores = pipe.execute()
+        except Exception as e:
+            print(f"⚠️ [Espelho] Erro ao ler espelho: {e}")
+            return {}
+
+        resultado = {}
+        for i, cal_id in enumerate(em_dia):
+            eventos = {}
+            for bruto in (v for lista in valores[i * len(dias):(i + 1) * len(dias)] for v in lista):
+                evento = json.loads(bruto)
+                if evento['id'] in eventos:
+                    continue  # evento de vários dias
+                if 'dateTime' in evento['start']:
+                    inicio_evt = _para_datetime(evento['start']['dateTime'], TIMEZONE_BR)
+                    fim_evt = _para_datetime(evento['end']['dateTime'], TIMEZONE_BR)
+                    if inicio_evt >= end_dt or fim_evt <= start_dt:
+                        continue
+                eventos[evento['id']] = evento
+
+            resultado[cal_id] = sorted(eventos.values(), key=lambda e: e['start'].get('dateTime') or e['start'].get('date'))
+
+        print(f"🪞 [Espelho] {len(resultado)}/{len(calendar_ids)} calendários lidos do espelho")
+        return resultado
+
+    def marcar_desatualizado(self, clinic_id: str, calendar_id: str):
+        """
+        A aplicação alterou o calendário: o espelho deixa de ser usado até a
+        próxima sincronização (que chega pelo push ou pelo scheduler).
+        """
+        if not calendar_id:
+            return
+        try:
+            self.redis.hincrby(self._estado_key(clinic_id, calendar_id), 'versao', 1)
+        except Exception as e:
+            print(f"⚠️ [Espelho] Erro ao marcar espelho desatualizado: {e}")
+
+    # ---------------- Sincronização ----------------
+
+    def sincronizar(self, clinic_id: str, calendar_service, calendar_id: str) -> Tuple[bool, List[dt.date]]:
+        """
+        Aplica as mudanças do calendário no espelho.
+        Retorna (carga_completa, dias_alterados).
+        """
+        estado_key = self._estado_key(clinic_id, calendar_id)
+        estado = self.redis.hgetall(estado_key)
+        versao = estado.get('versao', '0')
+
+        sync_token = estado.get('sync_token')
+        if sync_token and time.time() - float(estado.get('carga_completa_em') or 0) > ESPELHO_RESYNC_COMPLETO:
+            sync_token = None
+
+        hoje = dt.datetime.now(TIMEZONE_BR).date()
+        cobertura_de = hoje - dt.timedelta(days=1)
+        cobertura_ate = hoje + dt.timedelta(days=ESPELHO_DIAS)
+        inicio_carga = dt.datetime.combine(cobertura_de, dt.time.min, tzinfo=TIMEZONE_BR)
+
+        itens = None
+        if sync_token:
+            try:
+                itens, proximo_token = calendar_service.sincronizar_eventos(calendar_id, sync_token=sync_token)
+                cobertura_de = dt.date.fromisoformat(estado['cobertura_de'])
+                cobertura_ate = dt.date.fromisoformat(estado['cobertura_ate'])
+            except SyncTokenExpirado:
+                print(f"🔄 [Espelho] Sync token expirado: {calendar_id}. Refazendo carga completa.")
+
+        completa = itens is None
+        if completa:
+            itens, proximo_token = calendar_service.sincronizar_eventos(calendar_id, time_min=inicio_carga)
+
+        indice_key = self._indice_key(clinic_id, calendar_id)
+        alterados = set()
+        pipe = self.redis.pipeline(transaction=True)
+
+        if completa:
+            # Descarta o espelho anterior inteiro
+            for dias_gravados in self.redis.hvals(indice_key):
+                for data_iso in filter(None, dias_gravados.split(',')):
+                    pipe.delete(self._dia_key(clinic_id, calendar_id, dt.date.fromisoformat(data_iso)))
+            pipe.delete(indice_key)
+            anteriores = [None] * len(itens)
+        else:
+            anteriores = self.redis.hmget(indice_key, [e['id'] for e in itens]) if itens else []
+
+        for evento, dias_gravados in zip(itens, anteriores):
+            for data_iso in filter(None, (dias_gravados or '').split(',')):
+                data = dt.date.fromisoformat(data_iso)
+                pipe.hdel(self._dia_key(clinic_id, calendar_id, data), evento['id'])
+                alterados.add(data)
+
+            if evento.get('status') == 'cancelled':
+                pipe.hdel(indice_key, evento['id'])
+                continue
+
+            try:
+                primeiro, ultimo = dias_do_evento(evento)
+            except Exception:
+                continue
+
+            primeiro, ultimo = max(primeiro, cobertura_de), min(ultimo, cobertura_ate)
+            dias = [primeiro + dt.timedelta(days=i) for i in range((ultimo - primeiro).days + 1)]
+            if not dias:
+                pipe.hdel(indice_key, evento['id'])
+                continue
+
+            bruto = json.dumps(evento)
+            for data in dias:
+                pipe.hset(self._dia_key(clinic_id, calendar_id, data), evento['id'], bruto)
+                alterados.add(data)
+            pipe.hset(indice_key, evento['id'], ','.join(d.isoformat() for d in dias))
+
+        novo_estado = {
+            'sync_token': proximo_token or '',
+            'sincronizado_em': time.time(),
+            'versao_sincronizada': versao,
+            'cobertura_de': cobertura_de.isoformat(),
+            'cobertura_ate': cobertura_ate.isoformat(),
+        }
+        if completa:
+            novo_estado['carga_completa_em'] = time.time()
+        pipe.hset(estado_key, mapping=novo_estado)
+        pipe.execute()
+
+        print(f"🪞 [Espelho] {calendar_id}: {len(itens)} mudanças ({'carga completa' if completa else 'incremental'})")
+        return completa, sorted(alterados)
+
+    # ---------------- Canais de push ----------------
+
+    def garantir_canal(self, clinic_id: str, calendar_service, calendar_id: str):
+        """
+        Registra (ou renova, perto de expirar) o canal de push do calendário.
+        Sem GOOGLE_CALENDAR_WEBHOOK_URL o espelho vive só da sincronização periódica.
+        """
+        if not GOOGLE_CALENDAR_WEBHOOK_URL:
+            return
+        if not GOOGLE_CALENDAR_WEBHOOK_TOKEN:
+            # O webhook recusa notificações sem token configurado
+            print(f"⚠️ [Espelho] GOOGLE_CALENDAR_WEBHOOK_TOKEN não definido: canal de push não registrado")
+            return
+
+        estado_key = self._estado_key(clinic_id, calendar_id)
+        estado = self.redis.hgetall(estado_key)
+        if estado.get('canal_id') and float(estado.get('canal_expira_em') or 0) - time.time() > CANAL_RENOVAR_ANTES:
+            return
+
+        if estado.get('canal_id'):
+            try:
+                calendar_service.parar_canal(estado['canal_id'], estado.get('canal_resource_id'))
+            except Exception as e:
+                print(f"⚠️ [Espelho] Erro ao encerrar canal antigo de {calendar_id}: {e}")
+            self.redis.delete(self._canal_key(estado['canal_id']))
+
+        canal_id = uuid.uuid4().hex
+        canal = calendar_service.observar_calendario(
+            calendar_id, canal_id, GOOGLE_CALENDAR_WEBHOOK_URL, GOOGLE_CALENDAR_WEBHOOK_TOKEN, CANAL_TTL
+        )
+        expira_em = int(canal.get('expiration') or 0) / 1000 or time.time() + CANAL_TTL
+
+        pipe = self.redis.pipeline()
+        pipe.hset(estado_key, mapping={
+            'canal_id': canal_id,
+            'canal_resource_id': canal.get('resourceId', ''),
+            'canal_expira_em': expira_em,
+        })
+        pipe.setex(self._canal_key(canal_id), int(expira_em - time.time()) + 3600, json.dumps([clinic_id, calendar_id]))
+        pipe.execute()
+        print(f"📡 [Espelho] Canal de push registrado: {calendar_id}")
+
+    def localizar_canal(self, canal_id: str, resource_id: str) -> Optional[Tuple[str, str]]:
+        """
+        (clinic_id, calendar_id) de um canal de push, ou None se o canal é
+        desconhecido, já foi substituído ou o resourceId não é o registrado.
+        """
+        valor = self.redis.get(self._canal_key(canal_id))
+        if not valor or not resource_id:
+            return None
+
+        clinic_id, calendar_id = json.loads(valor)
+        canal_atual, resource_atual = self.redis.hmget(
+            self._estado_key(clinic_id, calendar_id), ['canal_id', 'canal_resource_id']
+        )
+        if canal_atual != canal_id or resource_atual != resource_id:
+            return None
+        return clinic_id, calendar_id
+
+
+# Instância global
+calendar_mirror = CalendarMirrorService()
@@ -0,0 +1,111 @@
+"""
+    Sincronização dos espelhos de calendário (calendar_mirror).
+    - sincronizar_calendario: chamado pelo webhook de push do Google; uma
+      sincronização por calendário por vez (lock no Redis), notificações que
+      chegam durante ela geram uma nova rodada ao final.
+    - sincronizar_espelhos: rodada do scheduler (fallback do push), cobre
+      todos os calendários de profissionais das clínicas com Google e renova
+      os canais de push.
+"""
+
+import os
+from dotenv import load_dotenv
+from app.core.database import get_supabase
+from app.core.executor import run_parallel
+from app.services.buffer_service import BufferService
+from app.services.calendar_mirror_service import calendar_mirror
+from app.services.availability_cache_service import availability_cache
+from app.services.factory import get_calendar_service
+
+load_dotenv()
+
+ESPELHO_LOCK_TTL = int(os.getenv("ESPELHO_LOCK_TTL", "120"))
+
+redis_client = BufferService().client
+
+def sincronizar_calendario(clinic_id: str, calendar_id: str, calendar_service=None) -> str:
+    """
+    Sincroniza o espelho de um calendário e descarta a ocupação em cache dos
+    dias alterados. Retorna o resultado para o log.
+    """
+    lock_key = f"espelho:lock:{clinic_id}:{calendar_id}"
+    pendente_key = f"espelho:pendente:{clinic_id}:{calendar_id}"
+
+    if not redis_client.set(lock_key, "1", nx=True, ex=ESPELHO_LOCK_TTL):
+        # Já há uma sincronização em andamento: ela roda de novo ao terminar
+        redis_client.setex(pendente_key, ESPELHO_LOCK_TTL, "1")
+        return "agendada"
+
+    try:
+        calendar_service = calendar_service or get_calendar_service(clinic_id, 'google')
+        while True:
+            redis_client.delete(pendente_key)
+            completa, alterados = calendar_mirror.sincronizar(clinic_id, calendar_service, calendar_id)
+
+            if completa:
+                availability_cache.descartar_calendario(clinic_id, calendar_id)
+            else:
+                availability_cache.descartar(clinic_id, calendar_id, alterados)
+
+            if not redis_client.get(pendente_key):
+                return f"{len(alterados)} dias alterados"
+    except Exception as e:
+        print(f"❌ [Espelho] Erro ao sincronizar {calendar_id}: {e}")
+        return f"erro: {e}"
+    finally:
+        redis_client.delete(lock_key)
+
+def _calendarios_espelhados() -> dict:
+    """
+    {clinic_id: [calendar_ids]} dos profissionais das clínicas conectadas ao Google.
+    """
+    supabase = get_supabase()
+    response = supabase.table('profissionais')\
+        .select('clinic_id, external_calendar_id, clinicas!inner(tipo_calendario, calendar_refresh_token)')\
+        .not_.is_('external_calendar_id', 'null')\
+        .eq('clinicas.tipo_calendario', 'google')\
+        .not_.is_('clinicas.calendar_refresh_token', 'null')\
+        .execute()
+
+    calendarios = {}
+    for p in response.data or []:
+        calendarios.setdefault(p['clinic_id'], [])
+        if p['external_calendar_id'] not in calendarios[p['clinic_id']]:
+            calendarios[p['clinic_id']].append(p['external_calendar_id'])
+    return calendarios
+
+def _sincronizar_clinica(clinic_id: str, calendar_ids: list) -> str:
+    try:
+        calendar_service = get_calendar_service(clinic_id, 'google')
+    except Exception as e:
+        return f"erro: {e}"
+
+    resultados = []
+    for calendar_id in calendar_ids:
+        try:
+            calendar_mirror.garantir_canal(clinic_id, calendar_service, calendar_id)
+        except Exception as e:
+            print(f"⚠️ [Espelho] Erro ao registrar canal de {calendar_id}: {e}")
+        resultados.append(sincronizar_calendario(clinic_id, calendar_id, calendar_service))
+    return ", ".join(resultados)
+
+def sincronizar_espelhos():
+    """
+    Rodada periódica do espelho (scheduler). As clínicas são processadas em
+    paralelo, cada uma com sua própria conta de calendário.
+    """
+    try:
+        calendarios = _calendarios_espelhados()
+    except Exception as e:
+        print(f"❌ [Espelho] Erro ao buscar calendários: {e}")
+        return
+
+    if not calendarios:
+        return
+
+    resultados = run_parallel(
+        {clinic_id: (_sincronizar_clinica, clinic_id, cal_ids) for clinic_id, cal_ids in calendarios.items()},
+        etapa="Espelho"
+    )
+    for clinic_id, resultado in resultados.items():
+        print(f"🪞 [Espelho] {clinic_id}: {resultado}")
@@ -43,4 +43,25 @@ def limpar_checkouts_antigos():
             print("   ✅ Nenhuma sessão para limpar hoje.")
 
     except Exception as e:
-        print(f"❌ Erro na limpeza de dados: {e}")
\ No newline at end of file
+        print(f"❌ Erro na limpeza de dados: {e}")
+
+def limpar_lotes_ledger_antigos():
+    """
+    Remove os registros de idempotência do ledger de tokens (ledger_lotes_aplicados)
+    com mais de 7 dias. Um lote só é reenviado enquanto está pendente no Redis,
+    que é questão de segundos/minutos.
+    """
+    data_limite_iso = (dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=7)).isoformat()
+
+    try:
+        response = supabase.table('ledger_lotes_aplicados')\
+            .delete()\
+            .lt('aplicado_em', data_limite_iso)\
+            .execute()
+
+        qtd_deletada = len(response.data) if response.data else 0
+        if qtd_deletada > 0:
+            print(f"   🗑️ Removidos {qtd_deletada} registros de lotes do ledger.")
+
+    except Exception as e:
+        print(f"❌ Erro na limpeza dos lotes do ledger: {e}")
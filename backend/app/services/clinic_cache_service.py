@@ -0,0 +1,193 @@
+"""
+    Cache de resolução de clínicas (tenant) por token da instância Uazapi e por ID.
+    Camada 1: LRU em memória do processo (TTL curto, tamanho limitado).
+    Camada 2: Redis, compartilhado entre API, worker e scheduler.
+    Deve ser invalidado sempre que ia_ativa, saldo de tokens ou uazapi_token mudarem.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+from app.services.buffer_service import BufferService
+from app.core.database import get_supabase
+
+load_dotenv()
+
+# Campos usados no roteamento de mensagens (webhook, buffer e worker)
+CAMPOS_CLINICA = 'id, ia_ativa, saldo_tokens, tokens_comprados, uazapi_token'
+
+class ClinicCacheService:
+    def __init__(self):
+        """
+        Usa o Redis do BufferService (mesmo padrão do RateLimiter).
+        """
+        self.redis = BufferService().client
+        self.supabase = get_supabase()
+
+        # O cache local só segura leituras repetidas dentro do mesmo processo.
+        # Outros processos enxergam a invalidação em no máximo LOCAL_TTL segundos.
+        self.LOCAL_TTL = int(os.getenv("CLINIC_CACHE_LOCAL_TTL", "5"))
+        self.REDIS_TTL = int(os.getenv("CLINIC_CACHE_TTL", "60"))
+        # Entradas locais (id e token contam separado); as menos usadas saem primeiro
+        self.LOCAL_MAX = int(os.getenv("CLINIC_CACHE_LOCAL_SIZE", "1024"))
+
+        self._local: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()  # {chave: (clinica, timestamp)}
+        self._local_lock = threading.Lock()  # rotas chamam o cache a partir do pool de threads
+
+    # --- Chaves ---
+
+    def _key_id(self, clinic_id: str) -> str:
+        return f"cache:clinic:id:{clinic_id}"
+
+    def _key_token(self, uazapi_token: str) -> str:
+        return f"cache:clinic:token:{uazapi_token}"
+
+    # --- Camada local ---
+
+    def _get_local(self, key: str) -> Optional[dict]:
+        with self._local_lock:
+            item = self._local.get(key)
+            if not item:
+                return None
+            if time.time() - item[1] >= self.LOCAL_TTL:
+                self._local.pop(key, None)
+                return None
+            self._local.move_to_end(key)
+            return item[0]
+
+    def _set_local(self, clinica: dict):
+        agora = time.time()
+        chaves = [self._key_id(clinica['id'])]
+        if clinica.get('uazapi_token'):
+            chaves.append(self._key_token(clinica['uazapi_token']))
+
+        with self._local_lock:
+            for chave in chaves:
+                self._local[chave] = (clinica, agora)
+                self._local.move_to_end(chave)
+            while len(self._local) > self.LOCAL_MAX:
+                self._local.popitem(last=False)
+
+    def _pop_local(self, *keys: str):
+        with self._local_lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    # --- Camada Redis ---
+
+    def _set_redis(self, clinica: dict):
+        try:
+            pipe = self.redis.pipeline()
+            pipe.setex(self._key_id(clinica['id']), self.REDIS_TTL, json.dumps(clinica))
+            if clinica.get('uazapi_token'):
+                pipe.setex(self._key_token(clinica['uazapi_token']), self.REDIS_TTL, clinica['id'])
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️ [ClinicCache] Erro ao salvar cache: {e}")
+
+    def _get_redis_by_id(self, clinic_id: str) -> Optional[dict]:
+        try:
+            cached = self.redis.get(self._key_id(clinic_id))
+            return json.loads(cached) if cached else None
+        except Exception as e:
+            print(f"⚠️ [ClinicCache] Erro ao ler cache: {e}")
+            return None
+
+    # --- API pública ---
+
+    def get_by_token(self, uazapi_token: str) -> Optional[dict]:
+        """
+        Resolve a clínica pelo token da instância Uazapi.
+        Retorna None se o token não pertence a nenhuma clínica.
+        """
+        if not uazapi_token:
+            return None
+
+        clinica = self._get_local(self._key_token(uazapi_token))
+        if clinica:
+            return clinica
+
+        try:
+            clinic_id = self.redis.get(self._key_token(uazapi_token))
+        except Exception as e:
+            print(f"⚠️ [ClinicCache] Erro ao ler cache: {e}")
+            clinic_id = None
+
+        if clinic_id:
+            clinica = self._get_redis_by_id(clinic_id)
+            if clinica and clinica.get('uazapi_token') == uazapi_token:
+                self._set_local(clinica)
+                return clinica
+
+        resp = self.supabase.table('clinicas')\
+            .select(CAMPOS_CLINICA)\
+            .eq('uazapi_token', uazapi_token)\
+            .limit(1)\
+            .execute()
+
+        if not resp.data:
+            return None
+
+        clinica = resp.data[0]
+        self._set_redis(clinica)
+        self._set_local(clinica)
+        return clinica
+
+    def get_by_id(self, clinic_id: str) -> Optional[dict]:
+        """
+        Resolve a clínica pelo ID.
+        Retorna None se a clínica não existe.
+        """
+        clinica = self._get_local(self._key_id(clinic_id))
+        if clinica:
+            return clinica
+
+        clinica = self._get_redis_by_id(clinic_id)
+        if clinica:
+            self._set_local(clinica)
+            return clinica
+
+        resp = self.supabase.table('clinicas')\
+            .select(CAMPOS_CLINICA)\
+            .eq('id', clinic_id)\
+            .limit(1)\
+            .execute()
+
+        if not resp.data:
+            return None
+
+        clinica = resp.data[0]
+        self._set_redis(clinica)
+        self._set_local(clinica)
+        return clinica
+
+    def invalidate(self, clinic_id: str, *tokens: str):
+        """
+        Remove a clínica do cache (local e Redis).
+        Deve ser chamado após qualquer update de ia_ativa, saldo_tokens,
+        tokens_comprados ou uazapi_token. Tokens antigos/novos podem ser
+        informados explicitamente; o token em cache também é removido.
+        """
+        if not clinic_id:
+            return
+
+        tokens_para_remover = {t for t in tokens if t}
+        cached = self._get_redis_by_id(clinic_id) or self._get_local(self._key_id(clinic_id))
+        if cached and cached.get('uazapi_token'):
+            tokens_para_remover.add(cached['uazapi_token'])
+
+        self._pop_local(self._key_id(clinic_id), *[self._key_token(t) for t in tokens_para_remover])
+
+        try:
+            self.redis.delete(self._key_id(clinic_id), *[self._key_token(t) for t in tokens_para_remover])
+            print(f"🗑️ [ClinicCache] Cache invalidado: {clinic_id}")
+        except Exception as e:
+            print(f"⚠️ [ClinicCache] Erro ao invalidar cache: {e}")
+
+
+# Instância global
+clinic_cache = ClinicCacheService()
@@ -0,0 +1,183 @@
+"""
+    Cache do contexto da clínica usado na construção do AgenteClinica.
+    Guarda a linha de clinicas, os profissionais (com nome já normalizado),
+    os dias fechados já parseados e o provedor de calendário.
+    Camada 1: LRU em memória do worker, validada pela versão no Redis e
+    com TTL curto (uma invalidação perdida expira junto com o Redis).
+    Camada 2: Redis, chave versionada por clínica.
+    invalidate() incrementa a versão; nenhuma leitura antiga sobrevive à troca.
+"""
+
+import os
+import json
+import time
+import datetime as dt
+from collections import OrderedDict
+from typing import Optional
+from unidecode import unidecode
+from dotenv import load_dotenv
+from app.services.buffer_service import BufferService
+from app.core.database import get_supabase
+from app.utils.date_utils import parse_clinica_fechada
+
+load_dotenv()
+
+# Só as colunas lidas pelo agente/warmer: tokens (calendar_refresh_token,
+# uazapi_token...) não vão para o Redis nem para a memória do worker
+COLUNAS_CLINICA = (
+    'id, nome, uf, prompt_ia, hora_abertura, hora_fechamento, horario_funcionamento, '
+    'clinica_fechada, tipo_calendario, ia_ativa'
+)
+
+class ClinicContextService:
+    def __init__(self):
+        """
+        Usa o Redis do BufferService (mesmo padrão do ClinicCacheService).
+        """
+        self.redis = BufferService().client
+        self.supabase = get_supabase()
+
+        self.REDIS_TTL = int(os.getenv("CLINIC_CONTEXT_TTL", "3600"))
+        self.LOCAL_MAX = int(os.getenv("CLINIC_CONTEXT_LOCAL_SIZE", "256"))
+        # Sem TTL local, uma escrita que não chamou invalidate() ficaria na memória
+        # do worker para sempre; assim ela vale no máximo REDIS_TTL + LOCAL_TTL
+        self.LOCAL_TTL = int(os.getenv("CLINIC_CONTEXT_LOCAL_TTL", "60"))
+
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()  # {clinic_id: (versao, contexto, timestamp)}
+
+    # --- Chaves ---
+
+    def _key_version(self, clinic_id: str) -> str:
+        return f"ctx:clinic:version:{clinic_id}"
+
+    def _key_context(self, clinic_id: str, versao: str) -> str:
+        # c3: COLUNAS_CLINICA com hora_abertura/hora_fechamento (entradas c2 expiram pelo TTL)
+        return f"ctx:clinic:{clinic_id}:c3:v{versao}"
+
+    # --- Serialização ---
+
+    def _carregar_do_banco(self, clinic_id: str) -> Optional[dict]:
+        clinica_resp = self.supabase.table('clinicas')\
+            .select(COLUNAS_CLINICA)\
+            .eq('id', clinic_id)\
+            .limit(1)\
+            .execute()
+
+        if not clinica_resp.data:
+            return None
+
+        profissionais_resp = self.supabase.table('profissionais')\
+            .select('id, nome, especialidade, external_calendar_id')\
+            .eq('clinic_id', clinic_id)\
+            .execute()
+
+        clinica = clinica_resp.data[0]
+        profissionais = profissionais_resp.data or []
+        for p in profissionais:
+            p['nome_normalizado'] = unidecode(p.get('nome') or '').lower()
+
+        dias_fechados = parse_clinica_fechada(clinica.get('clinica_fechada'))
+
+        return {
+            "clinica": clinica,
+            "profissionais": profissionais,
+            "clinica_fechada": [
+                {"date": d['date'].isoformat(), "description": d['description']}
+                for d in dias_fechados
+            ],
+            "tipo_calendario": clinica.get('tipo_calendario') or 'google',
+        }
+
+    def _hidratar(self, contexto: dict) -> dict:
+        """
+        Converte os campos serializados de volta (datas) para uso no agente.
+        """
+        return {
+            **contexto,
+            "clinica_fechada": [
+                {"date": dt.date.fromisoformat(d['date']), "description": d['description']}
+                for d in contexto.get("clinica_fechada", [])
+            ],
+        }
+
+    # --- Camada local (LRU) ---
+
+    def _get_local(self, clinic_id: str, versao: str) -> Optional[dict]:
+        item = self._local.get(clinic_id)
+        if not item or item[0] != versao:
+            return None
+        if time.time() - item[2] >= self.LOCAL_TTL:
+            self._local.pop(clinic_id, None)
+            return None
+        self._local.move_to_end(clinic_id)
+        return item[1]
+
+    def _set_local(self, clinic_id: str, versao: str, contexto: dict):
+        self._local[clinic_id] = (versao, contexto, time.time())
+        self._local.move_to_end(clinic_id)
+        while len(self._local) > self.LOCAL_MAX:
+            self._local.popitem(last=False)
+
+    # --- API pública ---
+
+    def get(self, clinic_id: str) -> Optional[dict]:
+        """
+        Retorna o contexto da clínica ou None se ela não existe.
+        """
+        try:
+            versao = self.redis.get(self._key_version(clinic_id)) or "0"
+        except Exception as e:
+            print(f"⚠️ [ClinicContext] Erro ao ler versão: {e}")
+            versao = None
+
+        if versao is not None:
+            contexto = self._get_local(clinic_id, versao)
+            if contexto:
+                return contexto
+
+            try:
+                cached = self.redis.get(self._key_context(clinic_id, versao))
+                if cached:
+                    contexto = self._hidratar(json.loads(cached))
+                    self._set_local(clinic_id, versao, contexto)
+                    return contexto
+            except Exception as e:
+                print(f"⚠️ [ClinicContext] Erro ao ler cache: {e}")
+
+        contexto_raw = self._carregar_do_banco(clinic_id)
+        if not contexto_raw:
+            return None
+
+        contexto = self._hidratar(contexto_raw)
+        if versao is not None:
+            try:
+                self.redis.setex(
+                    self._key_context(clinic_id, versao),
+                    self.REDIS_TTL,
+                    json.dumps(contexto_raw, default=str)
+                )
+            except Exception as e:
+                print(f"⚠️ [ClinicContext] Erro ao salvar cache: {e}")
+            self._set_local(clinic_id, versao, contexto)
+
+        return contexto
+
+    def invalidate(self, clinic_id: str):
+        """
+        Incrementa a versão do contexto da clínica.
+        Deve ser chamado após mudanças em clinicas (prompt, horários, dias
+        fechados, calendário) ou em profissionais.
+        """
+        if not clinic_id:
+            return
+
+        self._local.pop(clinic_id, None)
+        try:
+            self.redis.incr(self._key_version(clinic_id))
+            print(f"🗑️ [ClinicContext] Contexto invalidado: {clinic_id}")
+        except Exception as e:
+            print(f"⚠️ [ClinicContext] Erro ao invalidar contexto: {e}")
+
+
+# Instância global
+clinic_context = ClinicContextService()
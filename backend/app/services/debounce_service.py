@@ -0,0 +1,100 @@
+"""
+    Poller do buffer de mensagens (debounce).
+    Lê as conversas com deadline vencido no Redis (sorted set do BufferService)
+    e envia o bloco acumulado para a fila do Celery.
+    Roda no scheduler (processo único), não no processo da API.
+"""
+
+from dotenv import load_dotenv
+from app.core.database import get_supabase
+from app.services.buffer_service import BufferService
+from app.services.clinic_cache_service import clinic_cache
+from app.services.tasks import processar_mensagem_ia
+from app.services.availability_warmer import registrar_atividade
+
+load_dotenv()
+
+supabase = get_supabase()
+buffer_service = BufferService()
+
+def _ia_continua_ativa(clinic_id: str, telefone_cliente: str) -> bool:
+    """
+    Verifica se IA global/lead continuam ativas antes de processar.
+    """
+    try:
+        clinica = clinic_cache.get_by_id(clinic_id)
+        if clinica and clinica.get('ia_ativa') is False:
+            print("🛑 [Buffer] IA global desativada. Abortando processamento.")
+            return False
+
+        lead_resp = supabase.table('leads')\
+            .select('status_ia')\
+            .eq('clinic_id', clinic_id)\
+            .eq('telefone', telefone_cliente)\
+            .limit(1)\
+            .execute()
+        if lead_resp.data and lead_resp.data[0].get('status_ia') is False:
+            print("🛑 [Buffer] IA desativada para o lead. Abortando processamento.")
+            return False
+    except Exception as status_err:
+        print(f"⚠️ [Buffer] Erro ao checar status da IA: {status_err}")
+
+    return True
+
+def processar_buffers_vencidos():
+    """
+    Dispara a IA para cada conversa cujo deadline de buffer já venceu.
+    Deve ser rodado a cada segundo.
+    """
+    try:
+        devolvidas = buffer_service.requeue_expired()
+        if devolvidas:
+            print(f"♻️ [Buffer] {devolvidas} rajada(s) com lease vencido devolvida(s) ao buffer")
+        conversas = buffer_service.claim_due_conversations()
+    except Exception as e:
+        print(f"❌ [Buffer] Erro ao buscar conversas vencidas: {e}")
+        return
+
+    for conversa in conversas:
+        clinic_id = conversa["clinic_id"]
+        telefone_cliente = conversa["phone"]
+
+        try:
+            texto_completo = buffer_service.get_claimed_messages(clinic_id, telefone_cliente)
+
+            if not texto_completo:
+                print(f"⚠️ [Buffer] Deadline venceu mas não havia mensagens (já processado?).")
+                buffer_service.ack_conversation(conversa)
+                continue
+
+            if not _ia_continua_ativa(clinic_id, telefone_cliente):
+                buffer_service.ack_conversation(conversa)
+                continue
+
+            print(f"🚀 [Buffer] Disparando IA com bloco: {texto_completo}")
+
+            # Clínica com conversa ativa: entra no aquecimento da agenda
+            registrar_atividade(clinic_id)
+
+            # Envia para a fila do Celery (Background Worker)
+            processar_mensagem_ia.delay(
+                clinic_id,
+                telefone_cliente,
+                texto_completo,
+                conversa["token"],
+                conversa["lid"]
+            )
+        except Exception as e:
+            print(f"❌ Erro no processamento do buffer: {e}")
+            # Não enfileirou: a rajada volta ao buffer para nova tentativa
+            try:
+                buffer_service.requeue_conversation(clinic_id, telefone_cliente)
+            except Exception as requeue_err:
+                print(f"❌ [Buffer] Erro ao devolver rajada ao buffer (volta pelo lease): {requeue_err}")
+            continue
+
+        # Só apaga a rajada depois de enfileirada
+        try:
+            buffer_service.ack_conversation(conversa)
+        except Exception as e:
+            print(f"⚠️ [Buffer] Erro no ack da rajada (pode ser reenviada após o lease): {e}")
@@ -3,6 +3,7 @@
 """
 
 import os
+from typing import Optional
 from app.services.interfaces import CalendarService
 from app.services.google_calendar_service import GoogleCalendarService
 from app.services.outlook_calendar_service import OutlookCalendarService
@@ -14,27 +15,29 @@ load_dotenv()  # Carrega variáveis do .env
 # Config Supabase
 supabase = get_supabase()
 
-def get_calendar_service(clinic_id: str) -> CalendarService:
+def get_calendar_service(clinic_id: str, provider: Optional[str] = None) -> CalendarService:
     """
     Factory Pattern:
     Decide qual implementação de calendário retornar baseado
     na configuração da clínica no banco de dados.
+    Se o provedor já for conhecido (ex: contexto em cache), a consulta é pulada.
     """
     
     # 1. Verifica no banco qual é o provedor dessa clínica
-    try:
-        response = supabase.table('clinicas')\
-            .select('tipo_calendario')\
-            .eq('id', clinic_id)\
-            .single()\
-            .execute()
+    if not provider:
+        try:
+            response = supabase.table('clinicas')\
+                .select('tipo_calendario')\
+                .eq('id', clinic_id)\
+                .single()\
+                .execute()
+                
+            # Se não tiver a coluna tipo_calendario ou der erro, assume Google (V1)
+            provider = response.data.get('tipo_calendario', 'google')
             
-        # Se não tiver a coluna tipo_calendario ou der erro, assume Google (V1)
-        provider = response.data.get('tipo_calendario', 'google')
-        
-    except Exception:
-        # Fallback para V1
-        provider = 'google'
+        except Exception:
+            # Fallback para V1
+            provider = 'google'
 
     # 2. Retorna a classe correta
     if provider == 'google':
@@ -6,14 +6,26 @@
 import os
 import datetime as dt
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+from app.core.google_services import google_pool, montar_servico
 from dotenv import load_dotenv
 from app.core.security import decrypt_token 
 from app.services.interfaces import CalendarService
+from app.services.access_token_cache_service import access_token_cache
 from app.core.database import get_supabase, TIMEZONE_BR, TIMEZONE_STR
 
 load_dotenv()  # Carrega variáveis do .env
 
+# Máximo de chamadas por requisição batch do Google
+GOOGLE_BATCH_LIMIT = 50
+
+class SyncTokenExpirado(Exception):
+    """
+    O Google invalidou o sync token (HTTP 410): é preciso refazer a carga completa.
+    """
+    pass
+
 class GoogleCalendarService(CalendarService):
     SCOPES = [
         'https://www.googleapis.com/auth/calendar.events', 
@@ -32,22 +44,24 @@ class GoogleCalendarService(CalendarService):
         
         # Busca e monta as credenciais
         self.creds = self._get_credentials_from_db()
-        
-        # Constrói o serviço
-        self.service = build('calendar', 'v3', credentials=self.creds)
+
+    def _servico(self):
+        """
+        Resource do Calendar emprestado do pool da clínica (discovery em cache,
+        access token e conexão reaproveitados). Usar com `with`.
+        """
+        return google_pool.usar(self.clinic_id, self.creds)
         
     def obter_email_usuario(self):
         """
         Obtém o email do usuário conectado ao Google Calendar.
         """
         try:
-            # Validar se o token tem os escopos necessários
-            if not self._validar_escopo_token(self.creds):
+            # Validar se o token tem os escopos necessários (a mesma chamada já traz o usuário)
+            user_info = self._validar_escopo_token(self.creds)
+            if not user_info:
                 raise Exception("Token inválido ou com escopo incompatível. Por favor, reconecte sua conta Google.")
             
-            # Usar o serviço OAuth2 para obter informações do usuário
-            oauth_service = build('oauth2', 'v2', credentials=self.creds)
-            user_info = oauth_service.userinfo().get().execute()
             return user_info.get('email')
         except Exception as e:
             print(f"⚠️ Erro ao obter email do usuário: {e}")
@@ -89,11 +103,12 @@ class GoogleCalendarService(CalendarService):
             raise ValueError("GOOGLE_CLIENT_ID ou SECRET ausentes no .env")
         
         """
-            Criamos o objeto Credentials apenas com o refresh_token.
-            O token de acesso (access_token) é None, então a biblioteca do Google vai usar o refresh_token para gerar um novo automaticamente na primeira chamada.
+            Criamos o objeto Credentials com o refresh_token e o access_token
+            compartilhado entre os workers (cache no Redis). Se não houver um
+            válido, um único worker renova e publica no cache.
         """
         creds = Credentials(
-            token=None, # Não temos o token temporário, vamos gerar agora
+            token=None,
             refresh_token=refresh_token,
             token_uri="https://oauth2.googleapis.com/token",
             client_id=client_id,
@@ -101,18 +116,31 @@ class GoogleCalendarService(CalendarService):
             scopes=self.SCOPES
         )
 
+        def _renovar():
+            creds.refresh(Request())
+            return creds.token, creds.expiry.replace(tzinfo=dt.timezone.utc).timestamp()
+
+        try:
+            token, expira_em = access_token_cache.obter('google', self.clinic_id, refresh_token, _renovar)
+            creds.token = token
+            # google-auth trabalha com expiry em UTC sem tzinfo
+            creds.expiry = dt.datetime.fromtimestamp(expira_em, dt.timezone.utc).replace(tzinfo=None)
+        except Exception as e:
+            # Sem token: a biblioteca renova na primeira chamada (erros de escopo tratados lá)
+            print(f"⚠️ Erro ao obter access token do Google: {e}")
+
         return creds
     
     def _validar_escopo_token(self, creds):
         """
         Valida se o token tem os escopos necessários.
         Se não tiver, invalida o token forçando nova autenticação.
+        Retorna as informações do usuário (userinfo) ou False.
         """
         try:
             # Tenta fazer uma chamada simples para verificar se o token funciona
-            oauth_service = build('oauth2', 'v2', credentials=creds)
-            oauth_service.userinfo().get().execute()
-            return True
+            oauth_service = montar_servico('oauth2', 'v2', creds)
+            return oauth_service.userinfo().get().execute()
         except Exception as e:
             error_str = str(e).lower()
             if 'scope' in error_str or 'invalid_scope' in error_str:
@@ -125,6 +153,8 @@ class GoogleCalendarService(CalendarService):
                         'calendar_refresh_token': None
                     }).eq('id', self.clinic_id).execute()
                     print(f"✅ Token invalidado com sucesso para clínica {self.clinic_id}")
+                    google_pool.limpar(self.clinic_id)
+                    access_token_cache.invalidate('google', self.clinic_id)
                 except Exception as db_error:
                     print(f"⚠️ Erro ao invalidar token no banco: {db_error}")
                 
@@ -139,18 +169,19 @@ class GoogleCalendarService(CalendarService):
         page_token = None
         calendars = []
         
-        while True:
-            calendar_list = self.service.calendarList().list(pageToken=page_token).execute()
-            
-            for calendar_list_entry in calendar_list['items']:
-                calendars.append({
-                    'id': calendar_list_entry['id'],
-                    'summary': calendar_list_entry['summary']
-                })
-            page_token = calendar_list.get('nextPageToken')
-            
-            if not page_token:
-                break
+        with self._servico() as service:
+            while True:
+                calendar_list = service.calendarList().list(pageToken=page_token).execute()
+                
+                for calendar_list_entry in calendar_list['items']:
+                    calendars.append({
+                        'id': calendar_list_entry['id'],
+                        'summary': calendar_list_entry['summary']
+                    })
+                page_token = calendar_list.get('nextPageToken')
+                
+                if not page_token:
+                    break
             
         return calendars
     
@@ -174,14 +205,15 @@ class GoogleCalendarService(CalendarService):
         
         print(f"🔍 Buscando eventos entre {start_of_day} e {end_of_day}")
 
-        events_result = self.service.events().list(
-            calendarId=calendar_id,
-            timeMin=start_of_day.isoformat(),
-            timeMax=end_of_day.isoformat(),
-            maxResults=2500,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+        with self._servico() as service:
+            events_result = service.events().list(
+                calendarId=calendar_id,
+                timeMin=start_of_day.isoformat(),
+                timeMax=end_of_day.isoformat(),
+                maxResults=2500,
+                singleEvents=True,
+                orderBy='startTime'
+            ).execute()
         
         return events_result.get('items', [])
 
@@ -192,23 +224,134 @@ class GoogleCalendarService(CalendarService):
         """
         print(f"🔍 Buscando eventos (range) entre {start_dt.isoformat()} e {end_dt.isoformat()}")
 
-        events_result = self.service.events().list(
-            calendarId=calendar_id,
-            timeMin=start_dt.isoformat(),
-            timeMax=end_dt.isoformat(),
-            maxResults=2500,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+        with self._servico() as service:
+            events_result = service.events().list(
+                calendarId=calendar_id,
+                timeMin=start_dt.isoformat(),
+                timeMax=end_dt.isoformat(),
+                maxResults=2500,
+                singleEvents=True,
+                orderBy='startTime'
+            ).execute()
         
         return events_result.get('items', [])
 
-    def criar_evento(self, calendar_id, resumo, inicio_dt: dt.datetime, descricao: str = None, duracao_minutos: int = 60):
+    def consultar_ocupacao(self, calendar_ids, start_dt: dt.datetime, end_dt: dt.datetime):
+        """
+        Busca os eventos de vários calendários numa única requisição HTTP (batch),
+        trazendo só id/start/end de cada evento.
+        Não usa freebusy().query: ele omite eventos marcados como "Disponível"
+        (padrão dos eventos de dia inteiro, ex: Folga) e não devolve o id do
+        evento, necessário para ignorar as consultas do próprio paciente.
+        Se algum calendário falhar, lança exceção (não dá para afirmar que está livre).
+        """
+        calendar_ids = list(dict.fromkeys(calendar_ids))
+        resultado = {cal_id: [] for cal_id in calendar_ids}
+        pendentes = {}  # calendários com mais de uma página
+        erros = {}
+
+        print(f"🔍 Buscando ocupação de {len(calendar_ids)} calendários entre {start_dt.isoformat()} e {end_dt.isoformat()}")
+
+        def _callback(request_id, response, exception):
+            cal_id = calendar_ids[int(request_id)]
+            if exception is not None:
+                erros[cal_id] = exception
+                return
+            resultado[cal_id] = response.get('items', [])
+            if response.get('nextPageToken'):
+                pendentes[cal_id] = True
+
+        # O Google aceita até 50 chamadas por batch
+        with self._servico() as service:
+            for inicio in range(0, len(calendar_ids), GOOGLE_BATCH_LIMIT):
+                batch = service.new_batch_http_request(callback=_callback)
+                for indice in range(inicio, min(inicio + GOOGLE_BATCH_LIMIT, len(calendar_ids))):
+                    batch.add(
+                        service.events().list(
+                            calendarId=calendar_ids[indice],
+                            timeMin=start_dt.isoformat(),
+                            timeMax=end_dt.isoformat(),
+                            maxResults=2500,
+                            singleEvents=True,
+                            fields='nextPageToken,items(id,start,end)'
+                        ),
+                        request_id=str(indice)
+                    )
+                batch.execute()
+
+        if erros:
+            cal_id, erro = next(iter(erros.items()))
+            raise Exception(f"Erro ao consultar ocupação do calendário {cal_id}: {erro}")
+
+        # Raro (mais de 2500 eventos no período): completa pela busca normal
+        for cal_id in pendentes:
+            resultado[cal_id] = self.listar_eventos_periodo(start_dt, end_dt, cal_id)
+
+        return resultado
+
+    def sincronizar_eventos(self, calendar_id: str, sync_token: str = None, time_min: dt.datetime = None):
+        """
+        Sincronização incremental (events.list com syncToken).
+        Sem sync_token faz a carga completa a partir de time_min.
+        Retorna (eventos, next_sync_token); eventos removidos vêm com status 'cancelled'.
+        """
+        params = {
+            'calendarId': calendar_id,
+            'singleEvents': True,
+            'maxResults': 2500,
+        }
+        if sync_token:
+            params['syncToken'] = sync_token
+        else:
+            params['timeMin'] = time_min.isoformat()
+
+        itens = []
+        page_token = None
+
+        with self._servico() as service:
+            while True:
+                try:
+                    resp = service.events().list(pageToken=page_token, **params).execute()
+                except HttpError as e:
+                    if e.resp.status == 410:
+                        raise SyncTokenExpirado(f"Sync token expirado para o calendário {calendar_id}")
+                    raise
+
+                itens.extend(resp.get('items', []))
+                page_token = resp.get('nextPageToken')
+                if not page_token:
+                    return itens, resp.get('nextSyncToken')
+
+    def observar_calendario(self, calendar_id: str, canal_id: str, endereco: str, token: str, ttl_segundos: int):
+        """
+        Registra um canal de push (events.watch): o Google avisa o endereço
+        sempre que o calendário mudar. Retorna o canal (resourceId, expiration).
+        """
+        with self._servico() as service:
+            return service.events().watch(
+                calendarId=calendar_id,
+                body={
+                    'id': canal_id,
+                    'type': 'web_hook',
+                    'address': endereco,
+                    'token': token,
+                    'params': {'ttl': str(ttl_segundos)}
+                }
+            ).execute()
+
+    def parar_canal(self, canal_id: str, resource_id: str):
+        """
+        Encerra um canal de push.
+        """
+        with self._servico() as service:
+            service.channels().stop(body={'id': canal_id, 'resourceId': resource_id}).execute()
+
+    def _corpo_evento(self, resumo, inicio_dt: dt.datetime, descricao: str = None, duracao_minutos: int = 60):
         # inicio_dt deve ser um objeto datetime
         fim_dt = inicio_dt + dt.timedelta(minutes=duracao_minutos)
         texto_descricao = descricao if descricao else ""
                 
-        evento = {
+        return {
             'summary': resumo,
             'start': {
                 'dateTime': inicio_dt.isoformat(), 
@@ -220,8 +363,19 @@ class GoogleCalendarService(CalendarService):
             },
             'description': texto_descricao
         }
+
+    def _corpo_horario(self, novo_inicio: dt.datetime, duracao_minutos: int = 60):
+        novo_fim = novo_inicio + dt.timedelta(minutes=duracao_minutos)
+        return {
+            'start': {'dateTime': novo_inicio.isoformat(), 'timeZone': TIMEZONE_STR},
+            'end': {'dateTime': novo_fim.isoformat(), 'timeZone': TIMEZONE_STR},
+        }
+
+    def criar_evento(self, calendar_id, resumo, inicio_dt: dt.datetime, descricao: str = None, duracao_minutos: int = 60):
+        evento = self._corpo_evento(resumo, inicio_dt, descricao, duracao_minutos)
         
-        return self.service.events().insert(calendarId=calendar_id, body=evento).execute()
+        with self._servico() as service:
+            return service.events().insert(calendarId=calendar_id, body=evento).execute()
     
     def cancelar_evento(self, calendar_id: str, event_id: str):
         """
@@ -230,10 +384,11 @@ class GoogleCalendarService(CalendarService):
         """
         try:
             print(f"🗑️ Cancelando evento {event_id} no calendário {calendar_id}...")
-            self.service.events().delete(
-                calendarId=calendar_id,
-                eventId=event_id
-            ).execute()
+            with self._servico() as service:
+                service.events().delete(
+                    calendarId=calendar_id,
+                    eventId=event_id
+                ).execute()
             return True
         except Exception as e:
             print(f"⚠️ Erro ao cancelar no Google Calendar: {e}")
@@ -248,19 +403,15 @@ class GoogleCalendarService(CalendarService):
             print(f"🔄 Movendo evento {event_id} para {novo_inicio}...")
             
             # Recalcula o fim (assumindo 1h de duração padrão)
-            novo_fim = novo_inicio + dt.timedelta(hours=1)
-            
             # Usamos PATCH para alterar apenas os campos de horário, mantendo título e descrição
-            body = {
-                'start': {'dateTime': novo_inicio.isoformat(), 'timeZone': TIMEZONE_STR},
-                'end': {'dateTime': novo_fim.isoformat(), 'timeZone': TIMEZONE_STR},
-            }
+            body = self._corpo_horario(novo_inicio)
             
-            evento_atualizado = self.service.events().patch(
-                calendarId=calendar_id,
-                eventId=event_id,
-                body=body
-            ).execute()
+            with self._servico() as service:
+                evento_atualizado = service.events().patch(
+                    calendarId=calendar_id,
+                    eventId=event_id,
+                    body=body
+                ).execute()
             
             return evento_atualizado
             
@@ -275,12 +426,56 @@ class GoogleCalendarService(CalendarService):
         """
         try:
             print(f"✏️ Atualizando evento {event_id} em {calendar_id}...")
-            evento_atualizado = self.service.events().patch(
-                calendarId=calendar_id,
-                eventId=event_id,
-                body=body
-            ).execute()
+            with self._servico() as service:
+                evento_atualizado = service.events().patch(
+                    calendarId=calendar_id,
+                    eventId=event_id,
+                    body=body
+                ).execute()
             return evento_atualizado
         except Exception as e:
             print(f"⚠️ Erro ao atualizar evento no Google Calendar: {e}")
-            raise e
\ No newline at end of file
+            raise e
+
+    def _requisicao_lote(self, service, operacao: dict):
+        """
+        Monta (sem executar) a chamada da API para uma operação do lote.
+        """
+        acao = operacao['acao']
+        if acao == 'criar':
+            body = self._corpo_evento(
+                operacao['resumo'], operacao['inicio_dt'], operacao.get('descricao'), operacao.get('duracao_minutos', 60)
+            )
+            return service.events().insert(calendarId=operacao['calendar_id'], body=body)
+        if acao == 'mover':
+            body = self._corpo_horario(operacao['novo_inicio'], operacao.get('duracao_minutos', 60))
+            return service.events().patch(calendarId=operacao['calendar_id'], eventId=operacao['event_id'], body=body)
+        if acao == 'cancelar':
+            return service.events().delete(calendarId=operacao['calendar_id'], eventId=operacao['event_id'])
+        raise ValueError(f"Ação de lote desconhecida: {acao}")
+
+    def executar_lote(self, operacoes):
+        """
+        Executa criações/movimentações/cancelamentos numa única requisição batch
+        (até 50 por requisição). Retorna o resultado de cada operação, na ordem.
+        """
+        resultados = [None] * len(operacoes)
+
+        def _callback(request_id, response, exception):
+            indice = int(request_id)
+            if exception is not None:
+                resultados[indice] = {'ok': False, 'evento': None, 'erro': str(exception)}
+            else:
+                # DELETE responde sem corpo
+                resultados[indice] = {'ok': True, 'evento': response or None, 'erro': None}
+
+        print(f"📦 Executando lote de {len(operacoes)} operações no Google Calendar...")
+
+        with self._servico() as service:
+            for inicio in range(0, len(operacoes), GOOGLE_BATCH_LIMIT):
+                batch = service.new_batch_http_request(callback=_callback)
+                for indice in range(inicio, min(inicio + GOOGLE_BATCH_LIMIT, len(operacoes))):
+                    batch.add(self._requisicao_lote(service, operacoes[indice]), request_id=str(indice))
+                batch.execute()
+
+        return resultados
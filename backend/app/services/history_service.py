@@ -51,6 +51,8 @@ class HistoryService:
                         if isinstance(parsed, dict) and parsed.get('type'):
                             if parsed.get('type') == 'audio':
                                 content = parsed.get('transcript') or '[áudio]'
+                            elif parsed.get('type') == 'image' and parsed.get('analysis'):
+                                content = f"[Imagem enviada] {parsed.get('analysis')}"
                             else:
                                 content = parsed.get('caption') or f"[{parsed.get('type')}]"
                     except Exception:
@@ -67,15 +69,43 @@ class HistoryService:
             return [] # Retorna lista vazia se der erro (melhor que quebrar)
 
     def add_user_message(self, conteudo: str):
-        self._save_message('user', conteudo)
+        return self._save_message('user', conteudo)
 
     def add_ai_message(self, conteudo: str):
-        self._save_message('ai', conteudo)
+        return self._save_message('ai', conteudo)
+
+    def set_media_fields(self, message_row_id, **campos):
+        """
+        Grava campos extras (transcript, analysis) no JSON de uma mensagem de mídia já salva.
+        """
+        response = supabase.table('chat_messages')\
+            .select('conteudo')\
+            .eq('id', message_row_id)\
+            .limit(1)\
+            .execute()
+
+        if not response.data:
+            return
+
+        try:
+            conteudo = json.loads(response.data[0].get('conteudo') or '{}')
+        except Exception:
+            conteudo = {}
+
+        conteudo.update(campos)
+        supabase.table('chat_messages')\
+            .update({'conteudo': json.dumps(conteudo)})\
+            .eq('id', message_row_id)\
+            .execute()
 
     def _save_message(self, quem_enviou: str, conteudo: str):
-        supabase.table('chat_messages').insert({
+        """
+        Salva a mensagem e retorna o ID da linha criada (ou None).
+        """
+        response = supabase.table('chat_messages').insert({
             'clinic_id': self.clinic_id,
             'session_id': self.session_id,
             'quem_enviou': quem_enviou,
             'conteudo': conteudo
         }).execute()
+        return response.data[0].get('id') if response.data else None
@@ -1,39 +1,50 @@
 import os
-import requests
 import base64
+import hashlib
 from openai import OpenAI
 from dotenv import load_dotenv
+from app.core.uazapi_client import uazapi_client
+from app.services.buffer_service import BufferService
 
 load_dotenv()
 
-UAZAPI_URL = os.getenv("UAZAPI_URL")
+# Cache da análise por hash do conteúdo (imagens encaminhadas repetem muito)
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))
+IGNORAR = "IGNORAR"
 
 class ImageService:
     def __init__(self):
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.redis = BufferService().client
+
+    def _get_cached(self, image_hash: str):
+        try:
+            return self.redis.get(f"cache:image:{image_hash}")
+        except Exception as e:
+            print(f"⚠️ [ImageCache] Erro ao ler cache: {e}")
+            return None
+
+    def _set_cached(self, image_hash: str, resposta: str):
+        try:
+            self.redis.setex(f"cache:image:{image_hash}", IMAGE_CACHE_TTL, resposta)
+        except Exception as e:
+            print(f"⚠️ [ImageCache] Erro ao salvar cache: {e}")
 
     def analisar_imagem_uazapi(self, token, message_id):
         """
         Baixa a imagem da Uazapi e analisa com OpenAI Vision para verificar se é relacionada a clínicas/saúde.
+        O resultado (inclusive IGNORAR) fica em cache pelo sha256 da imagem.
         """
         try:
             print(f"📷 Baixando imagem da mensagem {message_id} via API...")
             
-            # Endpoint baseado na documentação
-            url = f"{UAZAPI_URL}/message/download"
-            
-            headers = {
-                "Content-Type": "application/json",
-                "token": token
-            }
-            
             body = {
                 "id": message_id,
                 "return_base64": True,
                 "generate_mp3": False
             }
             
-            response = requests.post(url, json=body, headers=headers, timeout=15)
+            response = uazapi_client.post("/message/download", json=body, token=token, idempotent=True)
             
             if response.status_code != 200:
                 print(f"❌ Erro Download Imagem Uazapi ({response.status_code}): {response.text}")
@@ -51,6 +62,16 @@ class ImageService:
             
             # Obter informações sobre a imagem
             mime_type = resp_json.get("mimetype") or resp_json.get("mimeType") or "image/jpeg"
+
+            # Limpa cabeçalho se existir (data:image/jpeg;base64,...)
+            if "," in image_base64:
+                image_base64 = image_base64.split(",")[1]
+
+            image_hash = hashlib.sha256(base64.b64decode(image_base64)).hexdigest()
+            cached = self._get_cached(image_hash)
+            if cached:
+                print(f"♻️ Análise da imagem em cache ({image_hash[:12]})")
+                return None if cached == IGNORAR else cached
             
             print("📝 Enviando para OpenAI Vision...")
             
@@ -85,8 +106,10 @@ Seja conciso e profissional."""
             
             resposta = response.choices[0].message.content.strip()
             print(f"🎯 Análise da imagem: {resposta}")
+
+            self._set_cached(image_hash, resposta)
             
-            if resposta == "IGNORAR":
+            if resposta == IGNORAR:
                 return None
             
             return resposta
@@ -23,6 +23,23 @@ class CalendarService(ABC):
         """
         pass
 
+    @abstractmethod
+    def listar_eventos_periodo(self, start_dt: dt.datetime, end_dt: dt.datetime, calendar_id: str = 'primary') -> List[Dict[str, Any]]:
+        """
+        Deve retornar a lista de eventos entre start_dt e end_dt (uma única busca).
+        Em caso de erro deve lançar exceção, nunca devolver lista vazia/parcial.
+        """
+        pass
+
+    @abstractmethod
+    def consultar_ocupacao(self, calendar_ids: List[str], start_dt: dt.datetime, end_dt: dt.datetime) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Deve retornar {calendar_id: [eventos]} para vários calendários numa
+        única chamada HTTP. Os eventos vêm reduzidos a id/start/end (o
+        suficiente para o cálculo de slots livres).
+        """
+        pass
+
     @abstractmethod
     def criar_evento(self, calendar_id: str, resumo: str, inicio_dt: dt.datetime, descricao: str, duracao_minutos: int) -> Dict[str, Any]:
         """
@@ -40,6 +57,19 @@ class CalendarService(ABC):
         """Atualiza a data/hora de um evento existente."""
         pass
 
+    @abstractmethod
+    def executar_lote(self, operacoes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Executa várias alterações de eventos numa única requisição HTTP (batch).
+        Cada operação é um dict com 'acao' e os argumentos do método equivalente:
+            {'acao': 'criar', 'calendar_id', 'resumo', 'inicio_dt', 'descricao', 'duracao_minutos'}
+            {'acao': 'mover', 'calendar_id', 'event_id', 'novo_inicio', 'duracao_minutos'}
+            {'acao': 'cancelar', 'calendar_id', 'event_id'}
+        Retorna, na mesma ordem, {'ok': bool, 'evento': dict | None, 'erro': str | None}.
+        O lote não é transacional: cada operação pode falhar isoladamente.
+        """
+        pass
+
     @abstractmethod
     def obter_email_usuario(self) -> str:
         """Obtém o email do usuário conectado ao calendário."""
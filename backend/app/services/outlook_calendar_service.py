@@ -4,12 +4,18 @@
 """
 
 import os
+import time
 import requests
 import datetime as dt
+from urllib.parse import urlencode
 from app.core.security import decrypt_token
 from app.services.interfaces import CalendarService
+from app.services.access_token_cache_service import access_token_cache
 from app.core.database import get_supabase, TIMEZONE_BR, TIMEZONE_STR
 
+# Máximo de chamadas por requisição $batch do Graph
+OUTLOOK_BATCH_LIMIT = 20
+
 class OutlookCalendarService(CalendarService):
     GRAPH_API_URL = "https://graph.microsoft.com/v1.0"
     TOKEN_ENDPOINT = "https://login.microsoftonline.com/common/oauth2/v2.0/token"
@@ -45,7 +51,8 @@ class OutlookCalendarService(CalendarService):
 
     def _get_access_token(self):
         """
-        Renova o access_token usando o refresh_token.
+        Retorna o access_token da clínica: usa o cache compartilhado entre os
+        workers e só renova (com o refresh_token) quando não há um válido.
         """
         if self.access_token:
             return self.access_token
@@ -58,7 +65,7 @@ class OutlookCalendarService(CalendarService):
             "scope": "Calendars.ReadWrite offline_access"
         }
 
-        try:
+        def _renovar():
             resp = requests.post(self.TOKEN_ENDPOINT, data=payload)
             data = resp.json()
             
@@ -66,7 +73,10 @@ class OutlookCalendarService(CalendarService):
                 print(f"❌ Erro renovando token Outlook: {data}")
                 raise Exception(f"Falha na autenticação com Microsoft: {data.get('error_description')}")
             
-            self.access_token = data["access_token"]
+            return data["access_token"], time.time() + int(data.get("expires_in", 3600))
+
+        try:
+            self.access_token, _ = access_token_cache.obter('outlook', self.clinic_id, self.refresh_token, _renovar)
             return self.access_token
             
         except Exception as e:
@@ -136,17 +146,104 @@ class OutlookCalendarService(CalendarService):
             
         return resp.json().get("value", [])
 
-    def criar_evento(self, calendar_id, resumo, inicio_dt: dt.datetime, descricao: str = None):
+    def listar_eventos_periodo(self, start_dt: dt.datetime, end_dt: dt.datetime, calendar_id='primary'):
         """
-        Cria evento.
-        NOTE: O Outlook pede 'body' com 'contentType' e 'content'.
+        Lista eventos em um intervalo personalizado (calendarView),
+        seguindo a paginação (@odata.nextLink) do Graph.
+        Se alguma página falhar, lança exceção.
         """
-        fim_dt = inicio_dt + dt.timedelta(hours=1)
-        
-        endpoint = "/me/events" if calendar_id == 'primary' else f"/me/calendars/{calendar_id}/events"
+        if calendar_id == 'primary' or not calendar_id:
+            endpoint = "/me/calendarView"
+        else:
+            endpoint = f"/me/calendars/{calendar_id}/calendarView"
+
         url = f"{self.GRAPH_API_URL}{endpoint}"
+        params = {
+            "startDateTime": start_dt.isoformat(),
+            "endDateTime": end_dt.isoformat(),
+            "$top": 100
+        }
+
+        print(f"🔍 Outlook: Buscando eventos (range) em {calendar_id} entre {start_dt.isoformat()} e {end_dt.isoformat()}")
+
+        eventos = []
+        while url:
+            resp = requests.get(url, headers=self.headers, params=params)
+
+            if resp.status_code != 200:
+                # Lança em vez de devolver a lista parcial: quem chama decide
+                # (o painel marca o calendário como incompleto)
+                raise Exception(f"Erro buscando eventos Outlook ({calendar_id}): {resp.text}")
+
+            data = resp.json()
+            eventos.extend(data.get("value", []))
+
+            # O nextLink já traz os parâmetros da consulta
+            url = data.get("@odata.nextLink")
+            params = None
+
+        return eventos
+
+    def consultar_ocupacao(self, calendar_ids, start_dt: dt.datetime, end_dt: dt.datetime):
+        """
+        Busca os eventos de vários calendários numa única requisição ($batch do
+        Graph), trazendo só id/start/end de cada evento.
+        Não usa getSchedule: ele trabalha por caixa de e-mail, e os profissionais
+        aqui são calendários da mesma conta.
+        Se algum calendário falhar, lança exceção (não dá para afirmar que está livre).
+        """
+        calendar_ids = list(dict.fromkeys(calendar_ids))
+        resultado = {cal_id: [] for cal_id in calendar_ids}
+        query = urlencode({
+            "startDateTime": start_dt.isoformat(),
+            "endDateTime": end_dt.isoformat(),
+        })
+
+        print(f"🔍 Outlook: Buscando ocupação de {len(calendar_ids)} calendários entre {start_dt.isoformat()} e {end_dt.isoformat()}")
+
+        # O Graph aceita até 20 chamadas por $batch
+        for inicio in range(0, len(calendar_ids), OUTLOOK_BATCH_LIMIT):
+            requisicoes = []
+            for indice in range(inicio, min(inicio + OUTLOOK_BATCH_LIMIT, len(calendar_ids))):
+                cal_id = calendar_ids[indice]
+                if cal_id == 'primary' or not cal_id:
+                    endpoint = "/me/calendarView"
+                else:
+                    endpoint = f"/me/calendars/{cal_id}/calendarView"
+
+                requisicoes.append({
+                    "id": str(indice),
+                    "method": "GET",
+                    "url": f"{endpoint}?{query}&$select=id,start,end&$top=1000",
+                    "headers": {"Prefer": 'outlook.timezone="America/Sao_Paulo"'}
+                })
+
+            resp = requests.post(f"{self.GRAPH_API_URL}/$batch", headers=self.headers, json={"requests": requisicoes})
+
+            if resp.status_code != 200:
+                raise Exception(f"Erro consultando ocupação Outlook: {resp.text}")
+
+            for item in resp.json().get("responses", []):
+                cal_id = calendar_ids[int(item["id"])]
+                if item.get("status") != 200:
+                    raise Exception(f"Erro ao consultar ocupação do calendário {cal_id}: {item.get('body')}")
+
+                corpo = item.get("body") or {}
+                resultado[cal_id] = corpo.get("value", [])
+
+                # Raro (mais de 1000 eventos no período): completa pela busca normal
+                if corpo.get("@odata.nextLink"):
+                    resultado[cal_id] = self.listar_eventos_periodo(start_dt, end_dt, cal_id)
+
+        return resultado
+
+    def _corpo_evento(self, resumo, inicio_dt: dt.datetime, descricao: str = None, duracao_minutos: int = 60):
+        """
+        NOTE: O Outlook pede 'body' com 'contentType' e 'content'.
+        """
+        fim_dt = inicio_dt + dt.timedelta(minutes=duracao_minutos)
         
-        evento = {
+        return {
             "subject": resumo,
             "body": {
                 "contentType": "HTML",
@@ -161,6 +258,29 @@ class OutlookCalendarService(CalendarService):
                 "timeZone": TIMEZONE_STR
             }
         }
+
+    def _corpo_horario(self, novo_inicio: dt.datetime, duracao_minutos: int = 60):
+        novo_fim = novo_inicio + dt.timedelta(minutes=duracao_minutos)
+        return {
+            "start": {
+                "dateTime": novo_inicio.isoformat(),
+                "timeZone": TIMEZONE_STR
+            },
+            "end": {
+                "dateTime": novo_fim.isoformat(),
+                "timeZone": TIMEZONE_STR
+            }
+        }
+
+    def _endpoint_eventos(self, calendar_id: str) -> str:
+        return "/me/events" if calendar_id == 'primary' else f"/me/calendars/{calendar_id}/events"
+
+    def criar_evento(self, calendar_id, resumo, inicio_dt: dt.datetime, descricao: str = None, duracao_minutos: int = 60):
+        """
+        Cria evento.
+        """
+        url = f"{self.GRAPH_API_URL}{self._endpoint_eventos(calendar_id)}"
+        evento = self._corpo_evento(resumo, inicio_dt, descricao, duracao_minutos)
         
         resp = requests.post(url, headers=self.headers, json=evento)
         
@@ -194,18 +314,7 @@ class OutlookCalendarService(CalendarService):
         url = f"{self.GRAPH_API_URL}/me/events/{event_id}"
         print(f"🔄 Outlook: Movendo evento {event_id}...")
         
-        novo_fim = novo_inicio + dt.timedelta(hours=1)
-        
-        body = {
-            "start": {
-                "dateTime": novo_inicio.isoformat(),
-                "timeZone": TIMEZONE_STR
-            },
-            "end": {
-                "dateTime": novo_fim.isoformat(),
-                "timeZone": TIMEZONE_STR
-            }
-        }
+        body = self._corpo_horario(novo_inicio)
         
         resp = requests.patch(url, headers=self.headers, json=body)
         
@@ -213,3 +322,52 @@ class OutlookCalendarService(CalendarService):
              raise Exception(f"Erro ao mover evento Outlook: {resp.text}")
              
         return resp.json()
+
+    def _requisicao_lote(self, indice: int, operacao: dict) -> dict:
+        """
+        Monta a requisição do $batch para uma operação do lote.
+        """
+        acao = operacao['acao']
+        if acao == 'criar':
+            corpo = self._corpo_evento(
+                operacao['resumo'], operacao['inicio_dt'], operacao.get('descricao'), operacao.get('duracao_minutos', 60)
+            )
+            return {"id": str(indice), "method": "POST", "url": self._endpoint_eventos(operacao['calendar_id']),
+                    "body": corpo, "headers": {"Content-Type": "application/json"}}
+        if acao == 'mover':
+            corpo = self._corpo_horario(operacao['novo_inicio'], operacao.get('duracao_minutos', 60))
+            return {"id": str(indice), "method": "PATCH", "url": f"/me/events/{operacao['event_id']}",
+                    "body": corpo, "headers": {"Content-Type": "application/json"}}
+        if acao == 'cancelar':
+            return {"id": str(indice), "method": "DELETE", "url": f"/me/events/{operacao['event_id']}"}
+        raise ValueError(f"Ação de lote desconhecida: {acao}")
+
+    def executar_lote(self, operacoes):
+        """
+        Executa criações/movimentações/cancelamentos num único $batch do Graph
+        (até 20 por requisição). Retorna o resultado de cada operação, na ordem.
+        """
+        resultados = [None] * len(operacoes)
+
+        print(f"📦 Outlook: Executando lote de {len(operacoes)} operações...")
+
+        for inicio in range(0, len(operacoes), OUTLOOK_BATCH_LIMIT):
+            requisicoes = [
+                self._requisicao_lote(indice, operacoes[indice])
+                for indice in range(inicio, min(inicio + OUTLOOK_BATCH_LIMIT, len(operacoes)))
+            ]
+
+            resp = requests.post(f"{self.GRAPH_API_URL}/$batch", headers=self.headers, json={"requests": requisicoes})
+
+            if resp.status_code != 200:
+                for requisicao in requisicoes:
+                    resultados[int(requisicao["id"])] = {'ok': False, 'evento': None, 'erro': resp.text}
+                continue
+
+            for item in resp.json().get("responses", []):
+                if item.get("status") in (200, 201, 204):
+                    resultados[int(item["id"])] = {'ok': True, 'evento': item.get("body") or None, 'erro': None}
+                else:
+                    resultados[int(item["id"])] = {'ok': False, 'evento': None, 'erro': str(item.get("body"))}
+
+        return resultados
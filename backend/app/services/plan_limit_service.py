@@ -1,5 +1,6 @@
 import time
 from app.core.database import get_supabase, SupabaseClient
+from app.services.clinic_context_service import clinic_context
 
 def enforce_professional_limit(clinic_id: str, plan_id: str):
     """
@@ -55,6 +56,7 @@ def enforce_professional_limit(clinic_id: str, plan_id: str):
                     .delete()\
                     .in_('id', ids_to_remove)\
                     .execute()
+                clinic_context.invalidate(clinic_id)
                     
                 print(f"✅ {len(ids_to_remove)} profissionais removidos com sucesso.")
             
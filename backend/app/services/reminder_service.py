@@ -3,6 +3,8 @@ import datetime as dt
 from app.utils.whatsapp_utils import enviar_mensagem_whatsapp
 from dotenv import load_dotenv
 from app.core.database import get_supabase, TIMEZONE_BR
+from app.services.clinic_cache_service import clinic_cache
+from app.services.sse_service import broadcast
 
 load_dotenv()
 
@@ -16,6 +18,16 @@ def salvar_mensagem(clinic_id: str, session_id: str, quem_enviou: str, conteudo:
         'quem_enviou': quem_enviou,
         'conteudo': conteudo
     }).execute()
+    broadcast(clinic_id, {
+        "type": "message",
+        "message": {
+            "id": f"reminder-{dt.datetime.utcnow().timestamp()}",
+            "session_id": session_id,
+            "quem_enviou": quem_enviou,
+            "conteudo": conteudo,
+            "created_at": dt.datetime.utcnow().isoformat() + "Z",
+        }
+    })
 
 def processar_lembretes():
     """
@@ -56,13 +68,8 @@ def processar_lembretes():
             pronome_medico = 'o Dr.' if genero_medico.lower() != 'feminino' else 'a Dra.'
             
             try:
-                response = supabase.table('clinicas') \
-                    .select('uazapi_token') \
-                    .eq('id', clinic_id) \
-                    .single() \
-                    .execute()
-
-                token = response.data.get('uazapi_token')
+                clinica = clinic_cache.get_by_id(clinic_id)
+                token = clinica.get('uazapi_token') if clinica else None
                 
                 if not token:
                     raise Exception("Token da Uazapi não cadastrado para esta clínica.")
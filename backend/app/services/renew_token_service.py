@@ -2,6 +2,7 @@
 import datetime as dt
 from dateutil.relativedelta import relativedelta
 from app.core.database import get_supabase
+from app.services.clinic_cache_service import clinic_cache
 
 def renovar_tokens_diario():
     """
@@ -83,6 +84,7 @@ def renovar_tokens_diario():
                 supabase.table('clinicas').update({
                     'saldo_tokens': max_tokens
                 }).eq('id', clinic_id).execute()
+                clinic_cache.invalidate(clinic_id)
                 
                 # 2. Marcar recarga na assinatura
                 # Usamos o momento atual em UTC/ISO
@@ -0,0 +1,274 @@
+"""
+    Motor de disponibilidade (slots livres) do agente.
+    Os eventos do dia são convertidos uma única vez em intervalos de minutos
+    inteiros (relativos à meia-noite), ordenados e mesclados. Sobre o
+    expediente monta-se uma soma de prefixos dos minutos ocupados: testar se
+    um horário de qualquer duração está livre vira uma subtração O(1), e a
+    mesma máscara do dia responde todas as durações de consulta.
+    A OcupacaoDia (intervalos brutos por evento) é o que vai para o cache.
+"""
+
+import math
+import json
+import base64
+import datetime as dt
+from array import array
+from itertools import accumulate
+from typing import Iterable, List, Optional, Tuple
+from app.core.database import TIMEZONE_BR, SLOT_CONSULTA
+
+MINUTOS_DIA = 24 * 60
+
+Intervalo = Tuple[int, int]
+
+
+def _para_datetime(valor: str, tz) -> dt.datetime:
+    momento = dt.datetime.fromisoformat(valor)
+    # Outlook devolve dateTime sem offset (já no fuso pedido no header Prefer)
+    if momento.tzinfo is None:
+        momento = momento.replace(tzinfo=tz)
+    return momento
+
+
+def mesclar_intervalos(intervalos: Iterable[Intervalo]) -> List[Intervalo]:
+    """
+    Ordena e une intervalos [inicio, fim) sobrepostos ou encostados.
+    """
+    mesclados: List[Intervalo] = []
+    for inicio, fim in sorted(intervalos):
+        if mesclados and inicio <= mesclados[-1][1]:
+            if fim > mesclados[-1][1]:
+                mesclados[-1] = (mesclados[-1][0], fim)
+        else:
+            mesclados.append((inicio, fim))
+    return mesclados
+
+
+class OcupacaoDia:
+    """
+    Ocupação bruta de um calendário em um dia: um intervalo de minutos por
+    evento (com o id) e os ids dos eventos de dia inteiro.
+    Não depende do paciente, da duração da consulta nem do horário atual,
+    por isso pode ser cacheada e compartilhada; esses filtros são aplicados
+    na leitura (intervalos()).
+    """
+    def __init__(self, eventos: List[Tuple[str, int, int]], dia_todo: List[str]):
+        self.eventos = eventos
+        self.dia_todo = dia_todo
+
+    @classmethod
+    def de_eventos(cls, eventos: list, data_base: dt.date, tz=TIMEZONE_BR) -> "OcupacaoDia":
+        """
+        Converte os eventos do calendário (formato Google/Outlook) uma única vez.
+        """
+        meia_noite = dt.datetime.combine(data_base, dt.time.min, tzinfo=tz)
+        intervalos = []
+        dia_todo = []
+
+        for e in eventos or []:
+            try:
+                # Bloqueia dias inteiros
+                if 'date' in e['start']:
+                    dia_todo.append(e.get('id') or '')
+                    continue
+
+                inicio_evt = _para_datetime(e['start'].get('dateTime'), tz)
+                fim_evt = _para_datetime(e['end'].get('dateTime'), tz)
+            except Exception:
+                continue
+
+            # Arredonda para fora: um evento 10:00:30 ocupa o minuto 10:00
+            inicio = math.floor((inicio_evt - meia_noite).total_seconds() / 60)
+            fim = math.ceil((fim_evt - meia_noite).total_seconds() / 60)
+            inicio, fim = max(inicio, 0), min(fim, MINUTOS_DIA)
+
+            if inicio < fim:
+                intervalos.append((e.get('id') or '', inicio, fim))
+
+        return cls(intervalos, dia_todo)
+
+    def intervalos(self, eventos_ignorar: Iterable[str] = ()) -> Optional[List[Intervalo]]:
+        """
+        Intervalos ocupados ordenados e mesclados, sem os eventos de
+        eventos_ignorar (consultas do próprio paciente).
+        Retorna None se algum evento de dia inteiro bloquear o dia.
+        """
+        ignorar = set(eventos_ignorar or ())
+
+        if any(event_id not in ignorar for event_id in self.dia_todo):
+            return None
+
+        return mesclar_intervalos(
+            (inicio, fim) for event_id, inicio, fim in self.eventos
+            if event_id not in ignorar
+        )
+
+    # --- Serialização compacta (cache) ---
+
+    def empacotar(self) -> str:
+        """
+        JSON com os minutos em uint16 (base64) e os ids na mesma ordem.
+        """
+        minutos = array('H')
+        for _, inicio, fim in self.eventos:
+            minutos.append(inicio)
+            minutos.append(fim)
+
+        return json.dumps({
+            "m": base64.b64encode(minutos.tobytes()).decode(),
+            "i": [event_id for event_id, _, _ in self.eventos],
+            "d": self.dia_todo,
+        }, separators=(",", ":"))
+
+    @classmethod
+    def desempacotar(cls, valor: str) -> "OcupacaoDia":
+        dados = json.loads(valor)
+        minutos = array('H')
+        minutos.frombytes(base64.b64decode(dados["m"]))
+
+        eventos = [
+            (event_id, minutos[2 * n], minutos[2 * n + 1])
+            for n, event_id in enumerate(dados["i"])
+        ]
+        return cls(eventos, dados["d"])
+
+
+def primeiro_inicio_hoje(data_base: dt.date, agora: dt.datetime, antecedencia_minutos: int = 60, passo: int = SLOT_CONSULTA) -> Optional[int]:
+    """
+    Para o dia de hoje, retorna o primeiro minuto agendável (agora + antecedência,
+    arredondado para o próximo múltiplo do passo). None para outros dias.
+    Ex: 14:12 com 1h de antecedência -> 15:15.
+    """
+    if data_base != agora.date():
+        return None
+
+    margem = agora + dt.timedelta(minutes=antecedencia_minutos)
+    meia_noite = dt.datetime.combine(data_base, dt.time.min, tzinfo=agora.tzinfo)
+    minuto = int((margem - meia_noite).total_seconds() // 60)
+    return -(-minuto // passo) * passo
+
+
+def dias_do_evento(e: dict, tz=TIMEZONE_BR) -> Tuple[dt.date, dt.date]:
+    """
+    Primeiro e último dia (inclusive, no fuso local) tocados por um evento.
+    """
+    if 'date' in e['start']:
+        primeiro = dt.date.fromisoformat(e['start']['date'])
+        # No Google a data final do evento de dia inteiro é exclusiva
+        ultimo = dt.date.fromisoformat(e['end']['date']) - dt.timedelta(days=1)
+    else:
+        inicio_evt = _para_datetime(e['start'].get('dateTime'), tz).astimezone(tz)
+        fim_evt = _para_datetime(e['end'].get('dateTime'), tz).astimezone(tz)
+        primeiro = inicio_evt.date()
+        ultimo = (fim_evt - dt.timedelta(microseconds=1)).date()
+    return primeiro, max(primeiro, ultimo)
+
+
+def eventos_por_dia(eventos: list, dias: Iterable[dt.date], tz=TIMEZONE_BR) -> dict:
+    """
+    Distribui os eventos de uma busca por período entre os dias que eles tocam.
+    Retorna {data: [eventos]} apenas para os dias pedidos, para que
+    OcupacaoDia.de_eventos() avalie cada dia isoladamente (um evento de dia
+    inteiro só bloqueia os próprios dias).
+    """
+    por_dia = {dia: [] for dia in dias}
+
+    for e in eventos or []:
+        try:
+            primeiro, ultimo = dias_do_evento(e, tz)
+        except Exception:
+            continue
+
+        dia = primeiro
+        while dia <= ultimo:
+            if dia in por_dia:
+                por_dia[dia].append(e)
+            dia += dt.timedelta(days=1)
+
+    return por_dia
+
+
+class MascaraDia:
+    """
+    Minutos ocupados do expediente [abertura, fechamento) em soma de prefixos.
+    Montada uma vez por calendário/dia; consultada para qualquer duração.
+    """
+    def __init__(self, abertura: int, fechamento: int, intervalos: List[Intervalo]):
+        self.abertura = abertura
+        self.fechamento = max(fechamento, abertura)
+
+        ocupado = bytearray(self.fechamento - self.abertura)
+        for inicio, fim in intervalos:
+            a = max(inicio, self.abertura) - self.abertura
+            b = min(fim, self.fechamento) - self.abertura
+            if a < b:
+                ocupado[a:b] = b"\x01" * (b - a)
+
+        self._prefixo = array('i', accumulate(ocupado, initial=0))
+
+    def livre(self, inicio: int, duracao: int) -> bool:
+        """
+        True se [inicio, inicio + duracao) está dentro do expediente e sem eventos.
+        """
+        a = inicio - self.abertura
+        b = a + duracao
+        if a < 0 or b > len(self._prefixo) - 1:
+            return False
+        return self._prefixo[b] == self._prefixo[a]
+
+    def inicios_livres(self, duracao: int, primeiro_inicio: Optional[int] = None, passo: int = SLOT_CONSULTA) -> List[int]:
+        """
+        Minutos de início (de passo em passo) onde cabe uma consulta de `duracao`.
+        A grade começa na abertura, ou em primeiro_inicio se ele for depois dela.
+        """
+        if duracao <= 0:
+            raise ValueError(f"duracao deve ser positiva (recebido {duracao})")
+        if passo <= 0:
+            raise ValueError(f"passo deve ser positivo (recebido {passo})")
+
+        inicio = self.abertura
+        if primeiro_inicio is not None and primeiro_inicio > inicio:
+            inicio = primeiro_inicio
+
+        p = self._prefixo
+        base = self.abertura
+        ultimo = self.fechamento - duracao
+
+        return [
+            m for m in range(inicio, ultimo + 1, passo)
+            if p[m - base + duracao] == p[m - base]
+        ]
+
+
+def calcular_slots_livres(
+    ocupacao: OcupacaoDia,
+    data_base: dt.date,
+    abertura: int,
+    fechamento: int,
+    duracao_minutos: int = 60,
+    eventos_ignorar: Iterable[str] = (),
+    agora: Optional[dt.datetime] = None,
+    tz=TIMEZONE_BR,
+) -> List[dt.datetime]:
+    """
+    Atalho para um único cálculo: ocupação do dia -> lista de datetimes livres
+    (slots de SLOT_CONSULTA minutos) no expediente [abertura, fechamento),
+    em minutos desde a meia-noite.
+    """
+    if duracao_minutos <= 0:
+        raise ValueError(f"duracao_minutos deve ser positiva (recebido {duracao_minutos})")
+
+    intervalos = ocupacao.intervalos(eventos_ignorar)
+    if intervalos is None:
+        return []
+
+    agora = agora or dt.datetime.now(tz)
+    mascara = MascaraDia(abertura, fechamento, intervalos)
+    inicios = mascara.inicios_livres(duracao_minutos, primeiro_inicio_hoje(data_base, agora))
+
+    return minutos_para_datetimes(data_base, inicios, tz)
+
+
+def minutos_para_datetimes(data_base: dt.date, minutos: List[int], tz=TIMEZONE_BR) -> List[dt.datetime]:
+    meia_noite = dt.datetime.combine(data_base, dt.time.min, tzinfo=tz)
+    return [meia_noite + dt.timedelta(minutes=m) for m in minutos]
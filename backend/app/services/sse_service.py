@@ -0,0 +1,182 @@
+"""
+    Broadcast de eventos SSE (painel de conversas) entre processos via Redis pub/sub.
+    API, worker e scheduler publicam no canal da clínica com broadcast();
+    cada processo da API assina o padrão uma única vez e distribui para as
+    conexões SSE locais.
+    Cada evento recebe um ID crescente por clínica e fica num backlog curto
+    no Redis, permitindo replay a partir do Last-Event-ID na reconexão.
+"""
+
+import os
+import json
+import asyncio
+import redis
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.getenv("CACHE_REDIS_URI")
+CHANNEL_PREFIX = "sse:clinic:"
+
+# Backlog por clínica (ring buffer) usado no replay
+SSE_BACKLOG_SIZE = int(os.getenv("SSE_BACKLOG_SIZE", "500"))
+SSE_BACKLOG_TTL = int(os.getenv("SSE_BACKLOG_TTL", "86400"))
+
+# Gera o ID, grava no backlog e publica numa única operação atômica.
+# O envelope publicado é {"id": <seq>, "data": <mensagem>}.
+PUBLISH_SCRIPT = """
+local id = redis.call('INCR', KEYS[1])
+local envelope = '{"id":' .. id .. ',"data":' .. ARGV[1] .. '}'
+redis.call('ZADD', KEYS[2], id, envelope)
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[2]) + 1))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('PUBLISH', ARGV[4], envelope)
+return id
+"""
+
+_sync_client = None
+
+def _channel(clinic_id: str) -> str:
+    return f"{CHANNEL_PREFIX}{clinic_id}"
+
+def _publish_args(clinic_id: str, message: dict) -> tuple:
+    return (
+        PUBLISH_SCRIPT,
+        2,
+        f"sse:seq:{clinic_id}",
+        f"sse:backlog:{clinic_id}",
+        json.dumps(message),
+        SSE_BACKLOG_SIZE,
+        SSE_BACKLOG_TTL,
+        _channel(clinic_id),
+    )
+
+def _get_sync_client():
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = redis.from_url(REDIS_URL, decode_responses=True)
+    return _sync_client
+
+def broadcast(clinic_id: str, message: dict):
+    """
+    Publica um evento para todos os painéis conectados da clínica (síncrono).
+    Usado pelo worker do Celery e pelo scheduler.
+    """
+    try:
+        _get_sync_client().eval(*_publish_args(clinic_id, message))
+    except Exception as e:
+        print(f"⚠️ [SSE] Erro ao publicar evento: {e}")
+
+class SseManager:
+    """
+    Mantém as filas das conexões SSE deste processo e um único listener
+    do Redis que faz o fan-out local.
+    """
+    def __init__(self):
+        self._subscribers = {}
+        self._redis = None
+        self._listener_task = None
+
+    def _get_redis(self):
+        if self._redis is None:
+            self._redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+        return self._redis
+
+    def _ensure_listener(self):
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        """
+        Assina sse:clinic:* e reconecta automaticamente se o Redis cair.
+        """
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._get_redis().pubsub()
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                print("📡 [SSE] Listener Redis conectado.")
+
+                async for item in pubsub.listen():
+                    if item.get("type") != "pmessage":
+                        continue
+                    clinic_id = item["channel"][len(CHANNEL_PREFIX):]
+                    try:
+                        envelope = json.loads(item["data"])
+                    except Exception:
+                        continue
+                    self._fan_out(clinic_id, (envelope["id"], envelope["data"]))
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ [SSE] Listener Redis caiu: {e}. Reconectando...")
+                await asyncio.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+    def _fan_out(self, clinic_id: str, event: tuple):
+        for queue in list(self._subscribers.get(clinic_id, set())):
+            try:
+                queue.put_nowait(event)
+            except Exception:
+                self.unsubscribe(clinic_id, queue)
+
+    def subscribe(self, clinic_id: str) -> asyncio.Queue:
+        self._ensure_listener()
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(clinic_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, clinic_id: str, queue: asyncio.Queue):
+        if clinic_id in self._subscribers:
+            self._subscribers[clinic_id].discard(queue)
+            if not self._subscribers[clinic_id]:
+                del self._subscribers[clinic_id]
+
+    async def replay(self, clinic_id: str, last_event_id: int) -> tuple:
+        """
+        Retorna ([(id, mensagem), ...], completo, seq_atual) com os eventos
+        publicados depois de last_event_id.
+        Se completo for False, eventos se perderam (backlog cortado ou
+        sequência expirada) e o cliente precisa recarregar o histórico.
+        """
+        backlog_key = f"sse:backlog:{clinic_id}"
+        redis_client = self._get_redis()
+
+        pipe = redis_client.pipeline()
+        pipe.get(f"sse:seq:{clinic_id}")
+        pipe.zrange(backlog_key, 0, 0, withscores=True)
+        seq_raw, primeiro = await pipe.execute()
+        seq_atual = int(seq_raw or 0)
+
+        if last_event_id > seq_atual:
+            # Sequência reiniciou (TTL expirou): o ID do cliente não vale mais
+            inicio, completo = 0, False
+        else:
+            inicio = last_event_id
+            completo = not primeiro or int(primeiro[0][1]) <= last_event_id + 1
+
+        itens = await redis_client.zrangebyscore(backlog_key, f"({inicio}", "+inf")
+        eventos = []
+        for item in itens:
+            envelope = json.loads(item)
+            eventos.append((envelope["id"], envelope["data"]))
+        return eventos, completo, seq_atual
+
+    async def broadcast(self, clinic_id: str, message: dict):
+        """
+        Versão async de broadcast() para as rotas da API.
+        """
+        try:
+            await self._get_redis().eval(*_publish_args(clinic_id, message))
+        except Exception as e:
+            print(f"⚠️ [SSE] Erro ao publicar evento: {e}")
+
+sse_manager = SseManager()
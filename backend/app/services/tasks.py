@@ -1,48 +1,79 @@
 import os
+import time
 import requests
 from app.core.celery_app import celery_app
+from app.core.executor import run_parallel
 from app.core.database import get_supabase
-from app.services.agente_service import AgenteClinica
+from app.services.clinic_cache_service import clinic_cache
+from app.services.agente_service import AgenteClinica, identificar_paciente, buscar_consultas_paciente
+from app.services.clinic_context_service import clinic_context
 from app.services.history_service import HistoryService, mensagens_contexto
+from app.services.audio_service import AudioService
+from app.services.image_service import ImageService
+from app.services.buffer_service import BufferService
 from app.utils.whatsapp_utils import enviar_mensagem_whatsapp
+from app.services.sse_service import broadcast
+from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 supabase = get_supabase()
+buffer_service = BufferService()
+
+def _buscar_status_lead(clinic_id: str, telefone_cliente: str):
+    """
+    Retorna o status_ia do lead (None se o lead não existe).
+    """
+    lead_resp = supabase.table('leads')\
+        .select('status_ia')\
+        .eq('clinic_id', clinic_id)\
+        .eq('telefone', telefone_cliente)\
+        .limit(1)\
+        .execute()
+    return lead_resp.data[0].get('status_ia') if lead_resp.data else None
 
 @celery_app.task(name="processar_mensagem_ia", acks_late=True)
 def processar_mensagem_ia(clinic_id: str, telefone_cliente: str, texto_usuario: str, token_instancia: str, lid: str):
     print(f"⚙️ [Worker] Processando para {telefone_cliente}...")
     
     try:
-        # 0. Verificar se IA global e IA do lead estão ativas
-        clinica_resp = supabase.table('clinicas')\
-            .select('ia_ativa')\
-            .eq('id', clinic_id)\
-            .single()\
-            .execute()
-        if clinica_resp.data and clinica_resp.data.get('ia_ativa') is False:
+        # 0. Busca em paralelo tudo que o agente precisa antes do LLM
+        #    (status da IA, histórico, contexto da clínica e dados do paciente)
+        history_service = HistoryService(clinic_id=clinic_id, session_id=telefone_cliente)
+        inicio = time.perf_counter()
+        dados = run_parallel({
+            "clinica": (clinic_cache.get_by_id, clinic_id),
+            "lead": (_buscar_status_lead, clinic_id, telefone_cliente),
+            "historico": (history_service.get_langchain_history, mensagens_contexto),
+            "contexto": (clinic_context.get, clinic_id),
+            "paciente": (identificar_paciente, clinic_id, telefone_cliente),
+            "consultas": (buscar_consultas_paciente, clinic_id, telefone_cliente),
+        }, etapa="Worker bootstrap")
+
+        # 1. Verificar se IA global e IA do lead estão ativas
+        clinica = dados["clinica"]
+        if clinica and clinica.get('ia_ativa') is False:
             print("🛑 [Worker] IA global desativada. Abortando.")
             return "IA global desativada"
 
-        lead_resp = supabase.table('leads')\
-            .select('status_ia')\
-            .eq('clinic_id', clinic_id)\
-            .eq('telefone', telefone_cliente)\
-            .limit(1)\
-            .execute()
-        if lead_resp.data and lead_resp.data[0].get('status_ia') is False:
+        if dados["lead"] is False:
             print("🛑 [Worker] IA desativada para o lead. Abortando.")
             return "IA do lead desativada"
 
-        # 1. Histórico
-        history_service = HistoryService(clinic_id=clinic_id, session_id=telefone_cliente)
-        historico = history_service.get_langchain_history(limit=mensagens_contexto)
-        
         # 2. Agente
+        agente = AgenteClinica(
+            clinic_id=clinic_id,
+            session_id=telefone_cliente,
+            lid=lid,
+            contexto=dados["contexto"],
+            dados_paciente=dados["paciente"],
+            consultas_paciente=dados["consultas"],
+        )
+        fim_bootstrap = time.perf_counter()
+
         print(f"🤖 [Worker] IA Pensando...")
-        agente = AgenteClinica(clinic_id=clinic_id, session_id=telefone_cliente, lid=lid)
-        resposta_ia = agente.executar(texto_usuario, historico)
+        resposta_ia = agente.executar(texto_usuario, dados["historico"])
+        fim_llm = time.perf_counter()
         
         # 3. Salvar e Enviar
         history_service.add_ai_message(resposta_ia)
@@ -51,10 +82,105 @@ def processar_mensagem_ia(clinic_id: str, telefone_cliente: str, texto_usuario:
             numero_telefone=telefone_cliente, 
             text=resposta_ia
         )
+        broadcast(clinic_id, {
+            "type": "message",
+            "message": {
+                "id": f"ai-{datetime.utcnow().timestamp()}",
+                "session_id": telefone_cliente,
+                "quem_enviou": "ai",
+                "conteudo": resposta_ia,
+                "created_at": datetime.utcnow().isoformat() + "Z",
+            }
+        })
         
+        fim_envio = time.perf_counter()
+        print(
+            f"⏱️ [Worker] bootstrap={(fim_bootstrap - inicio) * 1000:.0f}ms"
+            f" | agente={(fim_llm - fim_bootstrap) * 1000:.0f}ms"
+            f" | envio={(fim_envio - fim_llm) * 1000:.0f}ms"
+        )
         print(f"✅ [Worker] Sucesso.")
         return "Sucesso"
 
     except Exception as e:
         print(f"❌ [Worker] Erro: {e}")
         return str(e)
+
+@celery_app.task(name="transcrever_audio", acks_late=True)
+def transcrever_audio(clinic_id: str, telefone_cliente: str, token_instancia: str, message_id: str, chat_message_id, lid: str, alimentar_ia: bool):
+    """
+    Transcreve um áudio recebido pelo webhook, grava a transcrição no histórico
+    e, se a IA estiver liberada para a conversa, alimenta o buffer (debounce).
+    """
+    print(f"🎧 [Worker] Transcrevendo áudio {message_id} de {telefone_cliente}...")
+
+    try:
+        texto_transcrito = AudioService().transcrever_audio_uazapi(token_instancia, message_id)
+
+        if not texto_transcrito:
+            if alimentar_ia:
+                enviar_mensagem_whatsapp(
+                    token_instancia=token_instancia,
+                    numero_telefone=telefone_cliente,
+                    text="Não consegui entender o áudio. Pode escrever, por favor?"
+                )
+            return "Falha na transcrição"
+
+        print(f"🎯 [Worker] Áudio transcrito: {texto_transcrito}")
+
+        history_service = HistoryService(clinic_id=clinic_id, session_id=telefone_cliente)
+        if chat_message_id:
+            try:
+                history_service.set_media_fields(chat_message_id, transcript=texto_transcrito)
+            except Exception as e:
+                print(f"⚠️ [Worker] Erro ao salvar transcrição no histórico: {e}")
+
+        broadcast(clinic_id, {
+            "type": "message_update",
+            "message": {
+                "id": message_id,
+                "session_id": telefone_cliente,
+                "transcript": texto_transcrito,
+            }
+        })
+
+        if alimentar_ia:
+            buffer_service.add_message(clinic_id, telefone_cliente, texto_transcrito)
+            buffer_service.schedule_flush(clinic_id, telefone_cliente, token_instancia, lid)
+
+        return "Sucesso"
+
+    except Exception as e:
+        print(f"❌ [Worker] Erro na transcrição: {e}")
+        return str(e)
+
+@celery_app.task(name="analisar_imagem", acks_late=True)
+def analisar_imagem(clinic_id: str, telefone_cliente: str, token_instancia: str, message_id: str, chat_message_id, lid: str):
+    """
+    Analisa uma imagem recebida pelo webhook (com cache por hash) e, se for
+    relevante para a clínica, grava a análise no histórico e alimenta o buffer.
+    """
+    print(f"🖼️ [Worker] Analisando imagem {message_id} de {telefone_cliente}...")
+
+    try:
+        analise_imagem = ImageService().analisar_imagem_uazapi(token_instancia, message_id)
+
+        if not analise_imagem:
+            print("🚫 [Worker] Imagem fora do contexto de clínicas - ignorando")
+            return "Imagem ignorada"
+
+        if chat_message_id:
+            try:
+                HistoryService(clinic_id=clinic_id, session_id=telefone_cliente)\
+                    .set_media_fields(chat_message_id, analysis=analise_imagem)
+            except Exception as e:
+                print(f"⚠️ [Worker] Erro ao salvar análise no histórico: {e}")
+
+        buffer_service.add_message(clinic_id, telefone_cliente, f"Análise da imagem: {analise_imagem}")
+        buffer_service.schedule_flush(clinic_id, telefone_cliente, token_instancia, lid)
+
+        return "Sucesso"
+
+    except Exception as e:
+        print(f"❌ [Worker] Erro na análise da imagem: {e}")
+        return str(e)
@@ -0,0 +1,202 @@
+"""
+    Ledger de tokens da IA.
+    No caminho quente (fim de cada interação) o consumo só é acumulado no
+    Redis: um pipeline com HINCRBY/HINCRBYFLOAT por clínica + o registro da
+    interação. O scheduler aplica os deltas no Postgres periodicamente via
+    RPC aplicar_consumo_tokens (UPDATE atômico, sem read-modify-write) e grava
+    o histórico append-only em uso_tokens.
+    Cada flush move os acumuladores para um lote com flush_id; o lote só sai
+    do Redis depois de aplicado, e a RPC registra (flush_id, clínica) para
+    que a repetição de um lote não debite duas vezes.
+    SQL: frontend/scripts/05_token_ledger.sql
+"""
+
+import json
+import time
+import uuid
+from dotenv import load_dotenv
+from app.core.database import get_supabase
+from app.services.buffer_service import BufferService
+from app.services.clinic_cache_service import clinic_cache
+
+load_dotenv()
+
+TOKENS_PENDENTES_KEY = "ledger:tokens:pendente"   # hash {clinic_id: tokens}
+CUSTO_PENDENTE_KEY = "ledger:custo:pendente"      # hash {clinic_id: custo_usd}
+USO_PENDENTE_KEY = "ledger:uso:pendente"          # lista de interações (JSON)
+LOTES_KEY = "ledger:lotes"                        # set de flush_ids retirados e ainda não concluídos
+
+# Move os acumuladores para as chaves do lote (KEYS[4..6]) e registra o
+# flush_id em LOTES_KEY. Retorna 1 se havia algo pendente.
+RETIRAR_SCRIPT = """
+local movido = 0
+for i = 1, 3 do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('RENAME', KEYS[i], KEYS[i + 3])
+        movido = 1
+    end
+end
+if movido == 1 then
+    redis.call('SADD', KEYS[7], ARGV[1])
+end
+return movido
+"""
+
+# Tamanho do lote de inserts em uso_tokens
+USO_BATCH_SIZE = 500
+
+class TokenLedgerService:
+    def __init__(self):
+        self.redis = BufferService().client
+        self.supabase = get_supabase()
+        self._retirar_script = self.redis.register_script(RETIRAR_SCRIPT)
+
+    def registrar_consumo(self, clinic_id: str, tokens: int, custo_usd: float, telefone: str = None):
+        """
+        Acumula o consumo da interação no Redis (uma ida ao Redis, sem banco).
+        """
+        registro = json.dumps({
+            "clinic_id": clinic_id,
+            "tokens": tokens,
+            "custo_usd": round(custo_usd, 6),
+            "telefone": telefone,
+            "criado_em": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        })
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hincrby(TOKENS_PENDENTES_KEY, clinic_id, tokens)
+        pipe.hincrbyfloat(CUSTO_PENDENTE_KEY, clinic_id, custo_usd)
+        pipe.rpush(USO_PENDENTE_KEY, registro)
+        pipe.execute()
+
+    def tokens_pendentes(self, clinic_id: str) -> int:
+        """
+        Tokens consumidos que ainda não foram aplicados no banco
+        (acumulados + lotes retirados e ainda não confirmados).
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hget(TOKENS_PENDENTES_KEY, clinic_id)
+        for flush_id in self.redis.smembers(LOTES_KEY):
+            pipe.hget(self._lote_keys(flush_id)[0], clinic_id)
+        return sum(int(v or 0) for v in pipe.execute())
+
+    def _lote_keys(self, flush_id: str) -> tuple:
+        return (
+            f"ledger:lote:{flush_id}:tokens",
+            f"ledger:lote:{flush_id}:custo",
+            f"ledger:lote:{flush_id}:uso",
+        )
+
+    def _retirar_pendentes(self) -> str:
+        """
+        Move os acumuladores para as chaves de um lote novo (RENAME atômico):
+        o que chegar depois entra no próximo flush. O lote só é apagado depois
+        de aplicado; se o processo cair antes, o próximo flush o retoma.
+        Retorna o flush_id, ou None se não havia nada pendente.
+        """
+        flush_id = uuid.uuid4().hex
+        movido = self._retirar_script(
+            keys=[TOKENS_PENDENTES_KEY, CUSTO_PENDENTE_KEY, USO_PENDENTE_KEY, *self._lote_keys(flush_id), LOTES_KEY],
+            args=[flush_id]
+        )
+        return flush_id if movido else None
+
+    def flush(self):
+        """
+        Aplica os lotes no Postgres (uma RPC por clínica) e grava o histórico.
+        Lotes que ficaram de um flush anterior (erro ou queda) são retomados
+        primeiro, com o mesmo flush_id: a RPC ignora (flush_id, clínica) já
+        aplicado, então repetir um lote nunca debita duas vezes.
+        Deve ser rodado periodicamente pelo scheduler.
+        """
+        try:
+            lotes = sorted(self.redis.smembers(LOTES_KEY))
+            flush_id = self._retirar_pendentes()
+        except Exception as e:
+            print(f"❌ [Ledger] Erro ao ler consumo pendente: {e}")
+            return
+
+        if flush_id:
+            lotes.append(flush_id)
+
+        for lote in lotes:
+            try:
+                self._aplicar_lote(lote)
+            except Exception as e:
+                print(f"❌ [Ledger] Erro ao aplicar lote {lote}: {e}. Fica para o próximo flush.")
+
+    def _aplicar_lote(self, flush_id: str):
+        tokens_key, custo_key, uso_key = self._lote_keys(flush_id)
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(tokens_key)
+        pipe.hgetall(custo_key)
+        tokens, custos = pipe.execute()
+
+        for clinic_id, delta in tokens.items():
+            delta_tokens = int(delta)
+            delta_custo = float(custos.get(clinic_id) or 0)
+            try:
+                resp = self.supabase.rpc('aplicar_consumo_tokens', {
+                    'p_clinic_id': clinic_id,
+                    'p_tokens': delta_tokens,
+                    'p_custo_usd': delta_custo,
+                    'p_flush_id': flush_id,
+                }).execute()
+            except Exception as e:
+                print(f"❌ [Ledger] Erro ao debitar {clinic_id}: {e}. Fica no lote {flush_id}.")
+                continue
+
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hdel(tokens_key, clinic_id)
+            pipe.hdel(custo_key, clinic_id)
+            pipe.execute()
+            clinic_cache.invalidate(clinic_id)
+            print(f"📉 [Ledger] Tokens debitados: {clinic_id} -{delta_tokens} | Saldo: {resp.data}")
+
+        self._gravar_historico(uso_key)
+
+        # Só encerra o lote quando todas as clínicas e o histórico foram gravados
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hlen(tokens_key)
+        pipe.llen(uso_key)
+        restantes, usos_restantes = pipe.execute()
+        if not restantes and not usos_restantes:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(tokens_key, custo_key, uso_key)
+            pipe.srem(LOTES_KEY, flush_id)
+            pipe.execute()
+
+    def _gravar_historico(self, uso_key: str):
+        """
+        Insere as interações do lote em uso_tokens em lotes de USO_BATCH_SIZE.
+        Cada lote inserido sai da lista; em caso de erro o restante fica para
+        o próximo flush.
+        """
+        while True:
+            usos = self.redis.lrange(uso_key, 0, USO_BATCH_SIZE - 1)
+            if not usos:
+                return
+
+            lote = [json.loads(u) for u in usos]
+            try:
+                self.supabase.table('uso_tokens').insert(lote).execute()
+            except Exception as e:
+                print(f"⚠️ [Ledger] Erro ao gravar histórico ({len(lote)} registros): {e}. Fica para o próximo flush.")
+                return
+            self.redis.ltrim(uso_key, len(usos), -1)
+
+    def creditar_tokens_comprados(self, clinic_id: str, tokens: int):
+        """
+        Soma tokens comprados ao saldo da clínica e reativa a IA (atômico no banco).
+        """
+        resp = self.supabase.rpc('creditar_tokens_comprados', {
+            'p_clinic_id': clinic_id,
+            'p_tokens': tokens,
+        }).execute()
+        clinic_cache.invalidate(clinic_id)
+        return resp.data
+
+
+# Instância global
+token_ledger = TokenLedgerService()
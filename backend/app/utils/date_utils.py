@@ -1,4 +1,5 @@
 import datetime as dt
+import holidays
 
 def formatar_hora(iso_string):
     """Converte string ISO 8601 para formato HH:MM."""
@@ -11,4 +12,152 @@ def formatar_hora(iso_string):
         return data_obj.strftime('%H:%M')
     except ValueError:
         return iso_string # Retorna a string original se falhar na conversão
+
+def parse_clinica_fechada(dias_fechados_raw):
+    """
+    Retorna a lista dos dias que a clínica está fechada.
+    O campo clinica_fechada é um JSONB que pode conter:
+    - Nova estrutura: [{"date": "2024-12-25", "description": "Feriado de Natal"}]
+    - Estrutura antiga: ["2024-12-25", "2024-01-01"] (retrocompatível)
+    """
+    if not dias_fechados_raw:
+        return []
+    
+    dias_fechados = []
+    try:
+        if isinstance(dias_fechados_raw, list):
+            for item in dias_fechados_raw:
+                # Nova estrutura: objeto com date e description
+                if isinstance(item, dict):
+                    date_str = item.get('date')
+                    description = item.get('description', '')
+                    
+                    if not date_str:
+                        continue
+                    
+                    try:
+                        # Tenta parsear no formato ISO (YYYY-MM-DD)
+                        data_obj = dt.datetime.strptime(date_str, "%Y-%m-%d").date()
+                        dias_fechados.append({
+                            'date': data_obj,
+                            'description': description
+                        })
+                    except ValueError:
+                        try:
+                            # Tenta parsear no formato brasileiro (DD/MM/YYYY)
+                            data_obj = dt.datetime.strptime(date_str, "%d/%m/%Y").date()
+                            dias_fechados.append({
+                                'date': data_obj,
+                                'description': description
+                            })
+                        except ValueError:
+                            print(f"⚠️ Data inválida em clinica_fechada: {date_str}")
+                            continue
+                
+                # Estrutura antiga: apenas string (retrocompatibilidade)
+                elif isinstance(item, str):
+                    try:
+                        # Tenta parsear no formato ISO (YYYY-MM-DD)
+                        data_obj = dt.datetime.strptime(item, "%Y-%m-%d").date()
+                        dias_fechados.append({
+                            'date': data_obj,
+                            'description': ''
+                        })
+                    except ValueError:
+                        try:
+                            # Tenta parsear no formato brasileiro (DD/MM/YYYY)
+                            data_obj = dt.datetime.strptime(item, "%d/%m/%Y").date()
+                            dias_fechados.append({
+                                'date': data_obj,
+                                'description': ''
+                            })
+                        except ValueError:
+                            print(f"⚠️ Data inválida em clinica_fechada: {item}")
+                            continue
+    except Exception as e:
+        print(f"❌ Erro ao processar clinica_fechada: {e}")
+        return []
     
+    return dias_fechados
+
+
+# Mapeamento de dias da semana (0=Segunda, 6=Domingo) para os nomes no JSON
+DIAS_SEMANA = {
+    0: "Segunda-feira",
+    1: "Terça-feira",
+    2: "Quarta-feira",
+    3: "Quinta-feira",
+    4: "Sexta-feira",
+    5: "Sábado",
+    6: "Domingo"
+}
+
+def horario_expediente(horario_funcionamento, data_base: dt.date):
+    """
+    Retorna (abertura, fechamento) em minutos desde a meia-noite para o dia
+    da semana de data_base, conforme o JSON horario_funcionamento da clínica.
+    Padrão 08:00 às 18:00. Retorna None se o dia não estiver ativo.
+    """
+    dia_atual_nome = DIAS_SEMANA.get(data_base.weekday())
+
+    # Valores padrão
+    hora_abertura = 8
+    minuto_abertura = 0
+    hora_fechamento = 18
+    minuto_fechamento = 0
+
+    # Busca configuração do dia
+    config_dia = next((h for h in horario_funcionamento or [] if h.get('dia') == dia_atual_nome), None)
+
+    if config_dia:
+        if not config_dia.get('ativo', True):
+            return None
+
+        abertura_str = config_dia.get('abertura', '08:00')
+        fechamento_str = config_dia.get('fechamento', '18:00')
+
+        try:
+            hora_abertura, minuto_abertura = map(int, abertura_str.split(':'))
+            hora_fechamento, minuto_fechamento = map(int, fechamento_str.split(':'))
+        except ValueError:
+            pass # Mantém padrão se der erro no parse
+
+    return hora_abertura * 60 + minuto_abertura, hora_fechamento * 60 + minuto_fechamento
+
+def dia_bloqueado(data_base: dt.date, feriados, clinica_fechada):
+    """
+    Motivo pelo qual a clínica não atende em data_base (fim de semana,
+    feriado ou dia fechado), ou None se o dia é agendável.
+    clinica_fechada deve vir já parseada (parse_clinica_fechada).
+    """
+    if data_base.weekday() >= 5:
+        return "fim de semana"
+
+    if data_base in feriados:
+        return f"feriado ({feriados.get(data_base)})"
+
+    for closed_day in clinica_fechada or []:
+        if data_base == closed_day['date']:
+            return f"clínica fechada ({closed_day['description']})" if closed_day['description'] else "clínica fechada"
+
+    return None
+
+def proximos_dias_atendimento(clinica: dict, clinica_fechada, data_inicio: dt.date, quantidade: int, limite_dias: int = 30):
+    """
+    Retorna [(data, (abertura, fechamento))] dos próximos `quantidade` dias de
+    atendimento a partir de data_inicio (inclusive), olhando no máximo
+    `limite_dias` dias corridos.
+    """
+    estado_uf = clinica.get('uf') or 'MG'
+    feriados = holidays.BR(state=estado_uf, years=[data_inicio.year, data_inicio.year + 1])
+
+    dias = []
+    dia = data_inicio
+    limite = data_inicio + dt.timedelta(days=limite_dias)
+    while len(dias) < quantidade and dia <= limite:
+        expediente = horario_expediente(clinica.get('horario_funcionamento'), dia)
+        if expediente and not dia_bloqueado(dia, feriados, clinica_fechada):
+            dias.append((dia, expediente))
+        dia += dt.timedelta(days=1)
+
+    return dias
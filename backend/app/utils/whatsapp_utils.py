@@ -1,24 +1,10 @@
-import os
-import requests
-from dotenv import load_dotenv
-
-load_dotenv()
-
-UAZAPI_URL = os.getenv("UAZAPI_URL")
-
-def get_headers(token_instancia):
-    return {
-        "Content-Type": "application/json",
-        "token": token_instancia
-    }
+from app.core.uazapi_client import uazapi_client
 
 def enviar_mensagem_whatsapp(token_instancia, numero_telefone, text):
     """
     Função centralizada para envio de mensagens com uazapi.
     Usada tanto pelo Webhook (erros) quanto pelo Celery (IA).
     """
-    url = f"{UAZAPI_URL}/send/text"
-    
     body = {
         "number": numero_telefone,
         "text": text,
@@ -29,7 +15,7 @@ def enviar_mensagem_whatsapp(token_instancia, numero_telefone, text):
     }
     
     try:
-        response = requests.post(url, json=body, headers=get_headers(token_instancia))
+        response = uazapi_client.post("/send/text", json=body, token=token_instancia)
         
         if response.status_code not in [200, 201]:
             print(f"⚠️ Erro envio Whats: {response.text}")
@@ -1,8 +1,14 @@
+import os
 import time
+import threading
 import schedule
 from app.services.reminder_service import processar_lembretes
-from app.services.cleanup_service import limpar_checkouts_antigos
+from app.services.cleanup_service import limpar_checkouts_antigos, limpar_lotes_ledger_antigos
 from app.services.renew_token_service import renovar_tokens_diario
+from app.services.debounce_service import processar_buffers_vencidos
+from app.services.availability_warmer import aquecer_disponibilidade
+from app.services.token_ledger_service import token_ledger
+from app.services.calendar_sync import sincronizar_espelhos
 
 print("--- INICIANDO SERVIÇO DE AGENDAMENTO (SCHEDULER) ---", flush=True)
 
@@ -21,11 +27,39 @@ schedule.every(10).minutes.do(processar_lembretes)
 # Limpeza: Roda todo dia às 04:00 da manhã
 # Limpa checkouts pendentes há mais de 7 dias ou vencidos
 schedule.every().day.at("04:00").do(limpar_checkouts_antigos)
+# Limpa os registros de idempotência do ledger de tokens com mais de 7 dias
+schedule.every().day.at("04:05").do(limpar_lotes_ledger_antigos)
 
 # Renovação de Tokens: Roda todo dia às 00:10 da manhã
 # Garante que clínicas com plano anual recebam tokens mensais
 schedule.every().day.at("00:10").do(renovar_tokens_diario)
 
+# Aquecimento da agenda: Roda a cada 4 minutos (antes do TTL de 5 min do cache vencer)
+# Mantém a ocupação dos próximos dias em cache para as clínicas com conversas recentes
+schedule.every(int(os.getenv("WARMER_INTERVALO_MINUTOS", "4"))).minutes.do(aquecer_disponibilidade)
+
+# Ledger de tokens: Roda a cada 10 segundos
+# Aplica no banco (RPC atômica) o consumo de tokens acumulado no Redis pelo worker
+schedule.every(int(os.getenv("TOKEN_LEDGER_FLUSH_SEGUNDOS", "10"))).seconds.do(token_ledger.flush)
+
+# Espelho dos calendários Google: Roda a cada 5 minutos
+# Sincronização incremental (sync token) e renovação dos canais de push; fallback quando o push não chega
+schedule.every(int(os.getenv("ESPELHO_INTERVALO_MINUTOS", "5"))).minutes.do(sincronizar_espelhos)
+
+# Buffer de mensagens: Roda a cada segundo, em thread própria
+# (lembretes podem demorar e não podem atrasar o disparo das conversas)
+# Dispara a IA para conversas cujo deadline de debounce já venceu (estado fica no Redis)
+def loop_buffer():
+    while True:
+        try:
+            processar_buffers_vencidos()
+        except Exception as e:
+            print(f"❌ Erro no loop do buffer: {e}", flush=True)
+        
+        time.sleep(1)
+
+threading.Thread(target=loop_buffer, name="buffer-poller", daemon=True).start()
+
 print("✅ Scheduler ativo e aguardando horários...", flush=True)
 
 # --- 3. LOOP INFINITO ---
@@ -0,0 +1,143 @@
+"""
+Micro-benchmark da montagem do agente por mensagem: o jeito antigo
+(ChatOpenAI + 7 StructuredTools ligadas à instância + ChatPromptTemplate
+com o prompt_ia embutido + AgentExecutor, tudo recriado em cada
+executar()) contra o executor compilado uma vez por processo
+(_get_agent_executor + PROMPT_AGENTE com variáveis).
+
+Nenhuma chamada à OpenAI é feita: só a montagem é medida. A primeira
+chamada de _get_agent_executor (compilação) aparece em separado.
+
+Uso (na pasta backend, com as dependências instaladas):
+    python -m tests.bench_agente_setup
+    python -m tests.bench_agente_setup --repeticoes 50
+"""
+
+import os
+import argparse
+import timeit
+
+import tests.conftest  # noqa: F401  (variáveis mínimas para importar os serviços)
+
+from langchain_openai import ChatOpenAI
+from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.tools import StructuredTool
+
+import app.services.agente_service as agente_service
+from app.services.agente_service import (
+    PROMPT_AGENTE,
+    CancelarAgendamentoInput,
+    ListarMinhasConsultasInput,
+    ReagendarInput,
+    RealizaAgendamento,
+    SalvarNomeClienteInput,
+    VerificaConsultasExistentes,
+    VerificaDisponibilidade,
+)
+from tests.test_agente_uso import _agente
+
+PROMPT_IA = "Seja cordial. Atenda de segunda a sexta, das 8h às 18h. " * 40
+CONTEXTO = "HOJE: terça-feira, 10/03/2026 10:00\nPROFISSIONAIS HOJE: Dra. Ana (Clínico geral)"
+PACIENTE = "Paciente novo: pergunte o nome antes de agendar."
+MENSAGEM = "Oi, queria marcar uma consulta"
+
+
+def executor_antigo(agente) -> list:
+    """
+    Reprodução da montagem anterior, feita dentro de cada executar().
+    """
+    llm = ChatOpenAI(model=agente_service.MODELO_IA, temperature=0, api_key=os.getenv("OPENAI_API_KEY"))
+    tools = [
+        StructuredTool.from_function(
+            func=agente._logic_verificar_disponibilidade, name="verificar_disponibilidade",
+            description="Verifica se existem horários livres na agenda para uma data.",
+            args_schema=VerificaDisponibilidade
+        ),
+        StructuredTool.from_function(
+            func=agente._logic_realizar_agendamento, name="realizar_agendamento",
+            description="Realiza o agendamento final da consulta no calendário com duração específica.",
+            args_schema=RealizaAgendamento
+        ),
+        StructuredTool.from_function(
+            func=agente._logic_verificar_consultas_existentes, name="verificar_consultas_existentes",
+            description="Verifica se o paciente já tem consultas agendadas para uma data específica.",
+            args_schema=VerificaConsultasExistentes
+        ),
+        StructuredTool.from_function(
+            func=agente._logic_listar_consultas_futuras, name="listar_minhas_consultas",
+            description="Lista todas as consultas futuras agendadas para o paciente.",
+            args_schema=ListarMinhasConsultasInput
+        ),
+        StructuredTool.from_function(
+            func=agente._logic_cancelar_agendamento, name="cancelar_agendamento",
+            description="Cancela uma consulta específica baseada na data e hora fornecidas.",
+            args_schema=CancelarAgendamentoInput
+        ),
+        StructuredTool.from_function(
+            func=agente._logic_reagendar_agendamento, name="reagendar_agendamento",
+            description="Altera o horário de uma consulta existente.",
+            args_schema=ReagendarInput
+        ),
+        StructuredTool.from_function(
+            func=agente._logic_salvar_nome_cliente, name="salvar_nome_cliente",
+            description="Salva o nome do cliente no sistema.",
+            args_schema=SalvarNomeClienteInput
+        ),
+    ]
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Siga estritamente estas configurações operacionais:\n" + PROMPT_IA),
+        ("system", CONTEXTO),
+        ("system", f"INFORMAÇÕES DO PACIENTE (SIGA RIGOROSAMENTE):\n{PACIENTE}"),
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("user", "{input}"),
+        MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ])
+    mensagens = prompt.format_messages(input=MENSAGEM, chat_history=[], agent_scratchpad=[])
+    agent = create_tool_calling_agent(llm, tools, prompt)
+    AgentExecutor(agent=agent, tools=tools, verbose=True)
+    return mensagens
+
+
+def executor_compilado() -> list:
+    """
+    Montagem atual: executor do processo + variáveis do prompt.
+    """
+    agente_service._get_agent_executor()
+    return PROMPT_AGENTE.format_messages(
+        prompt_ia=PROMPT_IA, contexto_tempo_real=CONTEXTO, bloco_paciente=PACIENTE,
+        input=MENSAGEM, chat_history=[], agent_scratchpad=[],
+    )
+
+
+def _medir(funcao, repeticoes: int) -> float:
+    """
+    Melhor tempo médio por chamada (ms) em 5 rodadas.
+    """
+    return min(timeit.repeat(funcao, number=repeticoes, repeat=5)) / repeticoes * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da montagem do agente por mensagem")
+    parser.add_argument("--repeticoes", type=int, default=20, help="chamadas por medição")
+    args = parser.parse_args()
+
+    agente = _agente()
+    antigo = [m.content for m in executor_antigo(agente)]
+    assert antigo == [m.content for m in executor_compilado()], "prompt montado diferente"
+
+    agente_service._agent_executor = None
+    t_compilar = timeit.timeit(agente_service._get_agent_executor, number=1) * 1000
+
+    t_antigo = _medir(lambda: executor_antigo(agente), args.repeticoes)
+    t_compilado = _medir(executor_compilado, args.repeticoes)
+
+    print(f"{'montagem':>22} {'ms/mensagem':>12}")
+    print(f"{'antigo (por mensagem)':>22} {t_antigo:>12.2f}")
+    print(f"{'compilado':>22} {t_compilado:>12.3f}")
+    print(f"{'compilação (1x)':>22} {t_compilar:>12.2f}")
+    print(f"ganho por mensagem: {t_antigo / t_compilado:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Micro-benchmark do cálculo de slots livres: loop antigo (cursor de 5 em 5
+minutos x todos os eventos) contra o slot_engine (intervalos mesclados +
+soma de prefixos), em dias com muitos eventos.
+
+O tempo do slot_engine é medido em duas partes: montar a ocupação a partir
+dos eventos (feito uma vez por dia e cacheado) e responder os slots para
+uma duração a partir da ocupação (o que roda a cada pergunta do agente).
+
+Uso (na pasta backend, com as dependências instaladas):
+    python -m tests.bench_slot_engine
+    python -m tests.bench_slot_engine --eventos 100,200,500 --repeticoes 50
+"""
+
+import random
+import argparse
+import timeit
+import datetime as dt
+
+from app.core.database import TIMEZONE_BR
+from app.services.slot_engine import OcupacaoDia, calcular_slots_livres
+from tests.test_slot_engine import DIA, evento, slots_loop_antigo
+
+ABERTURA = 7 * 60
+FECHAMENTO = 21 * 60
+AGORA = dt.datetime.combine(DIA - dt.timedelta(days=1), dt.time(12), tzinfo=TIMEZONE_BR)
+
+
+def _eventos(quantidade: int, rnd: random.Random) -> list:
+    eventos = []
+    for n in range(quantidade):
+        inicio = rnd.randint(ABERTURA, FECHAMENTO - 30)
+        fim = inicio + rnd.choice([5, 10, 15, 30, 45, 60])
+        eventos.append(evento(f"e{n}", f"{inicio // 60:02d}:{inicio % 60:02d}", f"{fim // 60:02d}:{fim % 60:02d}"))
+    return eventos
+
+
+def _medir(funcao, repeticoes: int) -> float:
+    """
+    Melhor tempo médio por chamada (ms) em 5 rodadas.
+    """
+    return min(timeit.repeat(funcao, number=repeticoes, repeat=5)) / repeticoes * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do cálculo de slots livres")
+    parser.add_argument("--eventos", default="10,100,200,500", help="eventos por dia em cada rodada")
+    parser.add_argument("--duracao", type=int, default=60, help="duração da consulta em minutos")
+    parser.add_argument("--repeticoes", type=int, default=20, help="chamadas por medição")
+    args = parser.parse_args()
+
+    rnd = random.Random(7)
+    print(f"{'eventos':>8} {'loop ms':>10} {'ocupação ms':>12} {'slots ms':>10} {'ganho':>8}")
+    for quantidade in [int(n) for n in args.eventos.split(",")]:
+        eventos = _eventos(quantidade, rnd)
+        ocupacao = OcupacaoDia.de_eventos(eventos, DIA)
+
+        antigo = slots_loop_antigo(eventos, DIA, ABERTURA, FECHAMENTO, args.duracao, agora=AGORA)
+        novo = calcular_slots_livres(ocupacao, DIA, ABERTURA, FECHAMENTO, args.duracao, agora=AGORA)
+        assert antigo == novo, f"resultado diferente com {quantidade} eventos"
+
+        t_loop = _medir(lambda: slots_loop_antigo(eventos, DIA, ABERTURA, FECHAMENTO, args.duracao, agora=AGORA), args.repeticoes)
+        t_ocupacao = _medir(lambda: OcupacaoDia.de_eventos(eventos, DIA), args.repeticoes)
+        t_slots = _medir(lambda: calcular_slots_livres(ocupacao, DIA, ABERTURA, FECHAMENTO, args.duracao, agora=AGORA), args.repeticoes)
+
+        print(f"{quantidade:>8} {t_loop:>10.2f} {t_ocupacao:>12.2f} {t_slots:>10.3f} {t_loop / t_slots:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
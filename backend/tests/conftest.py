@@ -0,0 +1,14 @@
+"""
+Variáveis mínimas para importar os serviços sem Supabase/Redis/OpenAI reais.
+Os testes trocam os clientes por fakes; nenhuma conexão é aberta no import.
+"""
+
+import os
+
+os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "fake.fake.fake")
+os.environ.setdefault("CACHE_REDIS_URI", "redis://redis.invalid:6379/0")
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+if not os.getenv("ENCRYPTION_KEY"):
+    from cryptography.fernet import Fernet
+    os.environ["ENCRYPTION_KEY"] = Fernet.generate_key().decode()
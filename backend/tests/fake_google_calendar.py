@@ -0,0 +1,109 @@
+"""
+Google Calendar falso para os testes do espelho (calendar_mirror).
+Implementa a parte do GoogleCalendarService que o espelho usa
+(sincronizar_eventos, observar_calendario, parar_canal) com a mesma
+semântica do events.list com singleEvents=True:
+- carga completa (sem sync token) devolve só os eventos ativos;
+- incremental devolve o estado atual de tudo que mudou desde o token,
+  inclusive eventos e instâncias canceladas (status 'cancelled');
+- expirar_tokens() faz os tokens antigos responderem como o HTTP 410.
+"""
+
+import datetime as dt
+from app.core.database import TIMEZONE_BR
+from app.services.google_calendar_service import SyncTokenExpirado
+
+
+def evento(event_id: str, dia: dt.date, inicio: str, fim: str, **extra) -> dict:
+    """
+    Evento com horário no fuso da clínica (inicio/fim em 'HH:MM').
+    """
+    def _iso(hora):
+        return dt.datetime.combine(dia, dt.time.fromisoformat(hora), tzinfo=TIMEZONE_BR).isoformat()
+    return {'id': event_id, 'status': 'confirmed', 'start': {'dateTime': _iso(inicio)}, 'end': {'dateTime': _iso(fim)}, **extra}
+
+
+def evento_dia_todo(event_id: str, dia: dt.date, **extra) -> dict:
+    return {
+        'id': event_id,
+        'status': 'confirmed',
+        'start': {'date': dia.isoformat()},
+        'end': {'date': (dia + dt.timedelta(days=1)).isoformat()},
+        **extra,
+    }
+
+
+class FakeGoogleCalendar:
+    def __init__(self):
+        self._eventos = {}      # {calendar_id: {event_id: evento}}
+        self._alteracoes = {}   # {calendar_id: [(seq, event_id)]}
+        self._seq = 0
+        self._geracao = 0       # tokens de gerações anteriores estão expirados
+        self.chamadas = []      # [(calendar_id, sync_token)]
+        self.canais = {}        # {canal_id: {...}}
+        self.ao_sincronizar = None  # gancho chamado logo após montar cada resposta
+
+    # --- Mudanças feitas "no Google" ---
+
+    def salvar(self, calendar_id: str, evento: dict):
+        self._seq += 1
+        self._eventos.setdefault(calendar_id, {})[evento['id']] = dict(evento)
+        self._alteracoes.setdefault(calendar_id, []).append((self._seq, evento['id']))
+
+    def cancelar(self, calendar_id: str, event_id: str):
+        atual = self._eventos[calendar_id][event_id]
+        cancelado = {'id': event_id, 'status': 'cancelled'}
+        if 'recurringEventId' in atual:
+            cancelado['recurringEventId'] = atual['recurringEventId']
+            cancelado['originalStartTime'] = atual['start']
+        self.salvar(calendar_id, cancelado)
+
+    def remover_sem_registro(self, calendar_id: str, event_id: str):
+        """
+        Remove sem deixar rastro no incremental (o que o Google faz com o
+        histórico antigo; só uma carga completa percebe).
+        """
+        self._eventos[calendar_id].pop(event_id, None)
+
+    def expirar_tokens(self):
+        self._geracao += 1
+
+    # --- API usada pelo espelho ---
+
+    def sincronizar_eventos(self, calendar_id: str, sync_token: str = None, time_min: dt.datetime = None):
+        self.chamadas.append((calendar_id, sync_token))
+        eventos = self._eventos.get(calendar_id, {})
+
+        if sync_token:
+            geracao, desde = (int(v) for v in sync_token.rsplit(':', 2)[1:])
+            if geracao != self._geracao:
+                raise SyncTokenExpirado(f"Sync token expirado para o calendário {calendar_id}")
+            alterados = dict.fromkeys(
+                event_id for seq, event_id in self._alteracoes.get(calendar_id, []) if seq > desde
+            )
+            itens = [dict(eventos[event_id]) for event_id in alterados if event_id in eventos]
+        else:
+            itens = [dict(e) for e in eventos.values() if e.get('status') != 'cancelled' and self._termina_depois(e, time_min)]
+
+        proximo_token = f"{calendar_id}:{self._geracao}:{self._seq}"
+        # Mudanças/notificações que chegam depois da resposta, durante o processamento
+        if self.ao_sincronizar:
+            self.ao_sincronizar(calendar_id, sync_token)
+        return itens, proximo_token
+
+    def observar_calendario(self, calendar_id: str, canal_id: str, endereco: str, token: str, ttl_segundos: int):
+        resource_id = f"res-{calendar_id}"
+        self.canais[canal_id] = {'calendar_id': calendar_id, 'token': token, 'resourceId': resource_id}
+        expiracao = (dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=ttl_segundos)).timestamp()
+        return {'id': canal_id, 'resourceId': resource_id, 'expiration': str(int(expiracao * 1000))}
+
+    def parar_canal(self, canal_id: str, resource_id: str):
+        self.canais.pop(canal_id, None)
+
+    @staticmethod
+    def _termina_depois(evento: dict, time_min: dt.datetime) -> bool:
+        if time_min is None:
+            return True
+        if 'date' in evento['end']:
+            return dt.date.fromisoformat(evento['end']['date']) > time_min.date()
+        return dt.datetime.fromisoformat(evento['end']['dateTime']) > time_min
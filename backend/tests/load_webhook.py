@@ -0,0 +1,153 @@
+"""
+Teste de carga do POST /webhook/uazapi (latência com N remetentes simultâneos).
+
+Roda o router do webhook em processo (httpx + ASGITransport), com Supabase,
+Redis, Celery e SSE trocados por fakes que só esperam LATENCIA_MS (simulando
+a ida ao banco/Redis). Cada remetente manda uma mensagem a cada INTERVALO
+segundos (ritmo de conversa), e a rodada mede p50/p99 do webhook e o atraso
+do event loop para 1..500 remetentes.
+
+Se alguma chamada bloqueante voltar para dentro do handler, o atraso do loop
+e o p99 crescem com o número de remetentes; com o ingest não bloqueante eles
+ficam estáveis enquanto o pool (BLOCKING_POOL_SIZE) der conta da vazão.
+
+Uso (na pasta backend, com as dependências instaladas):
+    python -m tests.load_webhook
+    python -m tests.load_webhook --niveis 1,50,500 --latencia-ms 20 --duracao 15
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import statistics
+import contextlib
+
+# Variáveis mínimas para importar os módulos da API sem serviços reais
+os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "fake.fake.fake")
+os.environ.setdefault("CACHE_REDIS_URI", "redis://redis.invalid:6379/0")
+if not os.getenv("ENCRYPTION_KEY"):
+    from cryptography.fernet import Fernet
+    os.environ["ENCRYPTION_KEY"] = Fernet.generate_key().decode()
+
+import httpx
+from fastapi import FastAPI
+import app.api.webhook as webhook
+
+LATENCIA = 0.005
+
+def _io_fake(retorno=None):
+    """
+    Função bloqueante que simula uma ida ao Supabase/Redis.
+    """
+    def _fake(*args, **kwargs):
+        time.sleep(LATENCIA)
+        return retorno
+    return _fake
+
+class _HistoryFake:
+    def __init__(self, clinic_id: str, session_id: str):
+        pass
+
+    add_user_message = staticmethod(_io_fake("msg-id"))
+
+class _SseFake:
+    async def broadcast(self, clinic_id: str, message: dict):
+        await asyncio.sleep(LATENCIA)
+
+def _instalar_fakes():
+    clinica = {"id": "clinica-carga", "ia_ativa": True, "saldo_tokens": 10_000, "tokens_comprados": 0}
+
+    webhook._registrar_entrega = _io_fake(True)
+    webhook._liberar_entrega = _io_fake()
+    webhook._buscar_lead = _io_fake((True, False))
+    webhook._verificar_rate_limit = _io_fake(None)
+    webhook._adicionar_ao_buffer = _io_fake(False)
+    webhook.clinic_cache.get_by_token = _io_fake(clinica)
+    webhook.HistoryService = _HistoryFake
+    webhook.sse_manager = _SseFake()
+    webhook.celery_app.send_task = _io_fake()
+    webhook.token_ledger.tokens_pendentes = _io_fake(0)
+
+def _payload(remetente: int, sequencia: int) -> dict:
+    return {
+        "token": "token-carga",
+        "message": {
+            "messageid": f"carga-{remetente}-{sequencia}-{time.monotonic_ns()}",
+            "chatid": f"5511{remetente:09d}@s.whatsapp.net",
+            "messageType": "conversation",
+            "text": "Oi, queria marcar uma consulta",
+            "fromMe": False,
+        },
+    }
+
+async def _remetente(client, remetente: int, fim: float, intervalo: float, latencias: list):
+    sequencia = 0
+    # Espalha o início para não sincronizar todos os remetentes
+    await asyncio.sleep((remetente % 100) / 100 * intervalo)
+    while time.monotonic() < fim:
+        inicio = time.perf_counter()
+        resp = await client.post("/webhook/uazapi", json=_payload(remetente, sequencia))
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        if resp.status_code != 200:
+            print(f"⚠️ HTTP {resp.status_code}: {resp.text[:200]}")
+        sequencia += 1
+        await asyncio.sleep(max(0.0, intervalo - (time.perf_counter() - inicio)))
+
+async def _monitor_loop(fim: float, atrasos: list):
+    """
+    Mede quanto o event loop demora para acordar um sleep de 10ms.
+    """
+    while time.monotonic() < fim:
+        inicio = time.perf_counter()
+        await asyncio.sleep(0.01)
+        atrasos.append((time.perf_counter() - inicio - 0.01) * 1000)
+
+def _p(valores: list, percentil: float) -> float:
+    if len(valores) < 2:
+        return valores[0] if valores else 0.0
+    return statistics.quantiles(valores, n=100, method="inclusive")[int(percentil) - 1]
+
+async def _rodada(app: FastAPI, remetentes: int, duracao: float, intervalo: float) -> dict:
+    latencias, atrasos = [], []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://carga") as client:
+        fim = time.monotonic() + duracao
+        await asyncio.gather(
+            _monitor_loop(fim, atrasos),
+            *[_remetente(client, r, fim, intervalo, latencias) for r in range(remetentes)],
+        )
+    return {
+        "remetentes": remetentes,
+        "requisicoes": len(latencias),
+        "p50": _p(latencias, 50),
+        "p99": _p(latencias, 99),
+        "loop_p99": _p(atrasos, 99),
+    }
+
+async def main():
+    global LATENCIA
+
+    parser = argparse.ArgumentParser(description="Carga no POST /webhook/uazapi")
+    parser.add_argument("--niveis", default="1,10,50,100,250,500", help="remetentes simultâneos por rodada")
+    parser.add_argument("--latencia-ms", type=float, default=5, help="latência simulada de cada chamada ao banco/Redis")
+    parser.add_argument("--intervalo", type=float, default=1.0, help="segundos entre mensagens de um remetente")
+    parser.add_argument("--duracao", type=float, default=10, help="segundos por rodada")
+    args = parser.parse_args()
+
+    LATENCIA = args.latencia_ms / 1000
+    _instalar_fakes()
+
+    app = FastAPI()
+    app.include_router(webhook.router)
+
+    print(f"{'remetentes':>10} {'reqs':>7} {'p50 ms':>9} {'p99 ms':>9} {'loop p99 ms':>12}")
+    for nivel in [int(n) for n in args.niveis.split(",")]:
+        # Os logs do webhook (print por mensagem) ficam fora da saída
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            r = await _rodada(app, nivel, args.duracao, args.intervalo)
+        print(f"{r['remetentes']:>10} {r['requisicoes']:>7} {r['p50']:>9.1f} {r['p99']:>9.1f} {r['loop_p99']:>12.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+O uso reportado pela OpenAI (usage) precisa chegar ao ledger de tokens.
+
+O modelo falso se comporta como o ChatOpenAI: a resposta completa traz
+token_usage no llm_output, e o streaming não traz usage nenhum. Se o
+AgentExecutor voltar a fazer streaming, o get_openai_callback fica zerado
+e o débito cai na estimativa do tiktoken, o que este teste pega.
+
+Uso (na pasta backend, com as dependências instaladas):
+    python -m pytest tests/test_agente_uso.py -q
+"""
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import app.services.agente_service as agente_service
+
+USO = {"prompt_tokens": 1200, "completion_tokens": 80, "total_tokens": 1280}
+
+
+class _ChatComUso(BaseChatModel):
+    @property
+    def _llm_type(self) -> str:
+        return "fake-openai"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content="Olá! Como posso ajudar?"))],
+            llm_output={"token_usage": dict(USO), "model_name": "gpt-4o-mini"},
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Como a OpenAI sem stream_options: nenhum usage nos chunks
+        yield ChatGenerationChunk(message=AIMessageChunk(content="Olá! Como posso ajudar?"))
+
+
+@pytest.fixture
+def consumo(monkeypatch):
+    registrado = []
+    monkeypatch.setattr(agente_service, "ChatOpenAI", lambda **kwargs: _ChatComUso())
+    monkeypatch.setattr(agente_service, "_agent_executor", None)
+    monkeypatch.setattr(
+        agente_service.token_ledger, "registrar_consumo",
+        lambda clinic_id, tokens, custo_usd, telefone=None: registrado.append((clinic_id, tokens, custo_usd))
+    )
+    return registrado
+
+
+def _agente():
+    contexto = {
+        "clinica": {"id": "clinica-teste", "nome": "Clínica Teste", "prompt_ia": "Seja cordial."},
+        "profissionais": [{"id": "p1", "nome": "Dra. Ana", "especialidade": "Clínico geral"}],
+        "clinica_fechada": [],
+        "tipo_calendario": "google",
+    }
+    return agente_service.AgenteClinica(
+        "clinica-teste", "5511999999999", "lid-teste",
+        contexto=contexto, dados_paciente=None, consultas_paciente=[],
+    )
+
+
+def test_executor_nao_faz_streaming(consumo):
+    assert agente_service._get_agent_executor().agent.stream_runnable is False
+
+
+def test_usage_reportado_chega_ao_ledger(consumo):
+    resposta = _agente().executar("Oi, queria marcar uma consulta", [])
+
+    assert resposta == "Olá! Como posso ajudar?"
+    assert len(consumo) == 1
+    clinic_id, tokens, custo_usd = consumo[0]
+    assert clinic_id == "clinica-teste"
+    # Exatamente o usage informado (a estimativa do tiktoken teria margem de 15%)
+    assert tokens == USO["total_tokens"]
+    assert custo_usd == pytest.approx(
+        USO["prompt_tokens"] * 0.4 / 1_000_000 + USO["completion_tokens"] * 1.6 / 1_000_000
+    )
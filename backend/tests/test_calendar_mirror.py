@@ -0,0 +1,323 @@
+"""
+Espelho dos calendários Google (calendar_mirror + calendar_sync + webhook),
+contra o FakeGoogleCalendar e um Redis em memória (fakeredis).
+
+Uso (na pasta backend, com as dependências instaladas e `pip install fakeredis`):
+    python -m pytest tests/test_calendar_mirror.py -q
+"""
+
+import datetime as dt
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.database import TIMEZONE_BR
+import app.services.calendar_mirror_service as mirror_service
+import app.services.calendar_sync as calendar_sync
+import app.api.webhook_calendar as webhook_calendar
+from app.services.calendar_mirror_service import calendar_mirror
+from tests.fake_google_calendar import FakeGoogleCalendar, evento, evento_dia_todo
+
+CLINICA = "clinica-teste"
+CAL = "dra-ana@group.calendar.google.com"
+TOKEN = "token-webhook"
+
+HOJE = dt.datetime.now(TIMEZONE_BR).date()
+AMANHA = HOJE + dt.timedelta(days=1)
+DEPOIS = HOJE + dt.timedelta(days=2)
+
+
+class _CacheFake:
+    """
+    Registra o que o calendar_sync descartou do availability_cache.
+    """
+    def __init__(self):
+        self.descartes = []
+
+    def descartar(self, clinic_id, calendar_id, dias):
+        self.descartes.append(("dias", calendar_id, list(dias)))
+
+    def descartar_calendario(self, clinic_id, calendar_id):
+        self.descartes.append(("calendario", calendar_id))
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    cliente = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(calendar_mirror, "redis", cliente)
+    monkeypatch.setattr(calendar_sync, "redis_client", cliente)
+    return cliente
+
+
+@pytest.fixture
+def google():
+    return FakeGoogleCalendar()
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    fake = _CacheFake()
+    monkeypatch.setattr(calendar_sync, "availability_cache", fake)
+    return fake
+
+
+def _ler(*dias):
+    inicio = dt.datetime.combine(min(dias), dt.time.min, tzinfo=TIMEZONE_BR)
+    fim = dt.datetime.combine(max(dias) + dt.timedelta(days=1), dt.time.min, tzinfo=TIMEZONE_BR)
+    return calendar_mirror.ler_periodo(CLINICA, [CAL], inicio, fim)
+
+
+def _ids(*dias):
+    lidos = _ler(*dias)
+    return None if CAL not in lidos else sorted(e['id'] for e in lidos[CAL])
+
+
+# ---------------- Sincronização ----------------
+
+def test_carga_completa_e_incremental(redis, google):
+    google.salvar(CAL, evento("a", AMANHA, "09:00", "10:00"))
+
+    completa, alterados = calendar_mirror.sincronizar(CLINICA, google, CAL)
+    assert completa is True
+    assert alterados == [AMANHA]
+    assert _ids(AMANHA) == ["a"]
+
+    google.salvar(CAL, evento("b", DEPOIS, "14:00", "15:00"))
+    completa, alterados = calendar_mirror.sincronizar(CLINICA, google, CAL)
+    assert completa is False
+    assert alterados == [DEPOIS]
+    assert google.chamadas[-1][1] is not None  # usou o sync token
+    assert _ids(AMANHA, DEPOIS) == ["a", "b"]
+
+
+def test_evento_movido_sai_do_dia_antigo(redis, google):
+    google.salvar(CAL, evento("a", AMANHA, "09:00", "10:00"))
+    calendar_mirror.sincronizar(CLINICA, google, CAL)
+
+    google.salvar(CAL, evento("a", DEPOIS, "11:00", "12:00"))
+    _, alterados = calendar_mirror.sincronizar(CLINICA, google, CAL)
+
+    assert alterados == [AMANHA, DEPOIS]
+    assert _ids(AMANHA) == []
+    assert _ids(DEPOIS) == ["a"]
+
+
+def test_sync_token_410_refaz_carga_completa(redis, google):
+    google.salvar(CAL, evento("a", AMANHA, "09:00", "10:00"))
+    google.salvar(CAL, evento("b", AMANHA, "11:00", "12:00"))
+    calendar_mirror.sincronizar(CLINICA, google, CAL)
+
+    # Mudança que o incremental não enxerga + token invalidado (HTTP 410)
+    google.remover_sem_registro(CAL, "b")
+    google.salvar(CAL, evento("c", DEPOIS, "08:00", "09:00"))
+    google.expirar_tokens()
+
+    completa, _ = calendar_mirror.sincronizar(CLINICA, google, CAL)
+
+    assert completa is True
+    # Tentou o incremental, levou 410 e refez a carga sem token
+    assert google.chamadas[-2][1] is not None
+    assert google.chamadas[-1][1] is None
+    # A carga completa descarta o espelho anterior: "b" não sobrevive
+    assert _ids(AMANHA, DEPOIS) == ["a", "c"]
+
+    # O token novo volta a funcionar no incremental
+    completa, _ = calendar_mirror.sincronizar(CLINICA, google, CAL)
+    assert completa is False
+
+
+def test_evento_cancelado_sai_do_espelho(redis, google):
+    google.salvar(CAL, evento("a", AMANHA, "09:00", "10:00"))
+    google.salvar(CAL, evento_dia_todo("ferias", DEPOIS))
+    calendar_mirror.sincronizar(CLINICA, google, CAL)
+
+    google.cancelar(CAL, "a")
+    google.cancelar(CAL, "ferias")
+    _, alterados = calendar_mirror.sincronizar(CLINICA, google, CAL)
+
+    assert alterados == [AMANHA, DEPOIS]
+    assert _ids(AMANHA, DEPOIS) == []
+    assert redis.hgetall(calendar_mirror._indice_key(CLINICA, CAL)) == {}
+
+
+def test_instancia_cancelada_de_evento_recorrente(redis, google):
+    # singleEvents=True: cada ocorrência vem como um evento com recurringEventId
+    for dia in (AMANHA, DEPOIS):
+        instancia = f"semanal_{dia.strftime('%Y%m%d')}T120000Z"
+        google.salvar(CAL, evento(instancia, dia, "09:00", "10:00", recurringEventId="semanal"))
+    calendar_mirror.sincronizar(CLINICA, google, CAL)
+    assert len(_ids(AMANHA, DEPOIS)) == 2
+
+    cancelada = f"semanal_{AMANHA.strftime('%Y%m%d')}T120000Z"
+    google.cancelar(CAL, cancelada)
+    _, alterados = calendar_mirror.sincronizar(CLINICA, google, CAL)
+
+    assert alterados == [AMANHA]
+    assert _ids(AMANHA) == []
+    assert _ids(DEPOIS) == [f"semanal_{DEPOIS.strftime('%Y%m%d')}T120000Z"]
+
+
+# ---------------- Staleness ----------------
+
+def test_escrita_da_aplicacao_desativa_espelho_ate_sincronizar(redis, google):
+    google.salvar(CAL, evento("a", AMANHA, "09:00", "10:00"))
+    calendar_mirror.sincronizar(CLINICA, google, CAL)
+    assert _ids(AMANHA) == ["a"]
+
+    # O agente criou um evento: a versão sobe e o espelho deixa de ser lido
+    calendar_mirror.marcar_desatualizado(CLINICA, CAL)
+    assert _ids(AMANHA) is None
+
+    google.salvar(CAL, evento("novo", AMANHA, "15:00", "16:00"))
+    calendar_mirror.sincronizar(CLINICA, google, CAL)
+    assert _ids(AMANHA) == ["a", "novo"]
+
+
+def test_escrita_durante_a_sincronizacao_mantem_espelho_desatualizado(redis, google):
+    google.salvar(CAL, evento("a", AMANHA, "09:00", "10:00"))
+    calendar_mirror.sincronizar(CLINICA, google, CAL)
+
+    # A versão é lida antes da chamada ao Google; uma escrita no meio não é coberta
+    google.ao_sincronizar = lambda *_: calendar_mirror.marcar_desatualizado(CLINICA, CAL)
+    calendar_mirror.sincronizar(CLINICA, google, CAL)
+    assert _ids(AMANHA) is None
+
+    google.ao_sincronizar = None
+    calendar_mirror.sincronizar(CLINICA, google, CAL)
+    assert _ids(AMANHA) == ["a"]
+
+
+def test_espelho_atrasado_ou_fora_da_cobertura_nao_e_lido(redis, google, monkeypatch):
+    google.salvar(CAL, evento("a", AMANHA, "09:00", "10:00"))
+    calendar_mirror.sincronizar(CLINICA, google, CAL)
+
+    fora = HOJE + dt.timedelta(days=mirror_service.ESPELHO_DIAS + 5)
+    assert _ids(fora) is None
+
+    estado_key = calendar_mirror._estado_key(CLINICA, CAL)
+    sincronizado_em = float(redis.hget(estado_key, 'sincronizado_em'))
+    redis.hset(estado_key, 'sincronizado_em', sincronizado_em - mirror_service.ESPELHO_MAX_ATRASO - 1)
+    assert _ids(AMANHA) is None
+
+
+# ---------------- Single-flight (calendar_sync) ----------------
+
+def test_sincronizacao_em_andamento_agenda_nova_rodada(redis, google, cache):
+    google.salvar(CAL, evento("a", AMANHA, "09:00", "10:00"))
+    resultados_concorrentes = []
+
+    def _notificacao_durante_sync(calendar_id, sync_token):
+        # Uma segunda notificação chega enquanto a primeira sincroniza
+        if len(google.chamadas) == 1:
+            google.salvar(CAL, evento("b", DEPOIS, "10:00", "11:00"))
+            resultados_concorrentes.append(calendar_sync.sincronizar_calendario(CLINICA, CAL, google))
+
+    google.ao_sincronizar = _notificacao_durante_sync
+    resultado = calendar_sync.sincronizar_calendario(CLINICA, CAL, google)
+
+    # A concorrente não sincronizou: só pediu uma nova rodada à que tinha o lock
+    assert resultados_concorrentes == ["agendada"]
+    assert len(google.chamadas) == 2
+    assert resultado == "1 dias alterados"
+    assert _ids(AMANHA, DEPOIS) == ["a", "b"]
+    assert cache.descartes == [("calendario", CAL), ("dias", CAL, [DEPOIS])]
+
+    # Lock e pendência liberados ao final
+    assert redis.get(f"espelho:lock:{CLINICA}:{CAL}") is None
+    assert redis.get(f"espelho:pendente:{CLINICA}:{CAL}") is None
+
+
+def test_lock_ocupado_nao_chama_o_google(redis, google, cache):
+    redis.set(f"espelho:lock:{CLINICA}:{CAL}", "1")
+
+    assert calendar_sync.sincronizar_calendario(CLINICA, CAL, google) == "agendada"
+    assert google.chamadas == []
+    assert redis.get(f"espelho:pendente:{CLINICA}:{CAL}") == "1"
+
+
+def test_erro_na_sincronizacao_libera_o_lock(redis, google, cache):
+    def _falha(*_):
+        raise RuntimeError("quota")
+
+    google.ao_sincronizar = _falha
+    assert calendar_sync.sincronizar_calendario(CLINICA, CAL, google).startswith("erro")
+    assert redis.get(f"espelho:lock:{CLINICA}:{CAL}") is None
+
+
+# ---------------- Webhook de push ----------------
+
+@pytest.fixture
+def canal(redis, google, monkeypatch):
+    monkeypatch.setattr(mirror_service, "GOOGLE_CALENDAR_WEBHOOK_URL", "https://api.exemplo/webhook/google-calendar")
+    monkeypatch.setattr(mirror_service, "GOOGLE_CALENDAR_WEBHOOK_TOKEN", TOKEN)
+    calendar_mirror.garantir_canal(CLINICA, google, CAL)
+    canal_id, info = next(iter(google.canais.items()))
+    return canal_id, info['resourceId']
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    agendadas = []
+    monkeypatch.setattr(webhook_calendar, "GOOGLE_CALENDAR_WEBHOOK_TOKEN", TOKEN)
+    monkeypatch.setattr(webhook_calendar, "sincronizar_calendario", lambda *args: agendadas.append(args))
+    app = FastAPI()
+    app.include_router(webhook_calendar.router)
+    client = TestClient(app)
+    client.agendadas = agendadas
+    return client
+
+
+def _notificar(cliente, canal_id, resource_id, token=TOKEN, estado="exists"):
+    return cliente.post("/webhook/google-calendar", headers={
+        "X-Goog-Channel-ID": canal_id,
+        "X-Goog-Channel-Token": token,
+        "X-Goog-Resource-ID": resource_id,
+        "X-Goog-Resource-State": estado,
+    })
+
+
+def test_webhook_valido_agenda_sincronizacao(cliente, canal):
+    canal_id, resource_id = canal
+    resp = _notificar(cliente, canal_id, resource_id)
+    assert resp.json() == {"status": "ok"}
+    assert cliente.agendadas == [(CLINICA, CAL)]
+
+
+def test_webhook_sem_token_configurado_recusa(cliente, canal, monkeypatch):
+    monkeypatch.setattr(webhook_calendar, "GOOGLE_CALENDAR_WEBHOOK_TOKEN", None)
+    canal_id, resource_id = canal
+    assert _notificar(cliente, canal_id, resource_id).status_code == 401
+    assert cliente.agendadas == []
+
+
+def test_webhook_token_invalido_recusa(cliente, canal):
+    canal_id, resource_id = canal
+    assert _notificar(cliente, canal_id, resource_id, token="outro").status_code == 401
+    assert cliente.agendadas == []
+
+
+def test_webhook_resource_id_diferente_e_ignorado(cliente, canal):
+    canal_id, _ = canal
+    resp = _notificar(cliente, canal_id, "res-de-outro-calendario")
+    assert resp.json() == {"status": "ignored_unknown_channel"}
+    assert cliente.agendadas == []
+
+
+def test_webhook_canal_substituido_e_ignorado(cliente, canal, redis, google):
+    canal_id, resource_id = canal
+    # Renovação: o canal antigo deixa de valer
+    redis.hset(calendar_mirror._estado_key(CLINICA, CAL), 'canal_expira_em', 0)
+    calendar_mirror.garantir_canal(CLINICA, google, CAL)
+
+    assert _notificar(cliente, canal_id, resource_id).json() == {"status": "ignored_unknown_channel"}
+    assert cliente.agendadas == []
+
+
+def test_canal_nao_e_registrado_sem_token(redis, google, monkeypatch):
+    monkeypatch.setattr(mirror_service, "GOOGLE_CALENDAR_WEBHOOK_URL", "https://api.exemplo/webhook/google-calendar")
+    monkeypatch.setattr(mirror_service, "GOOGLE_CALENDAR_WEBHOOK_TOKEN", None)
+    calendar_mirror.garantir_canal(CLINICA, google, CAL)
+    assert google.canais == {}
@@ -0,0 +1,47 @@
+"""
+run_parallel_parcial: resposta parcial sem tomar o pool do run_blocking.
+
+Uso (na pasta backend, com as dependências instaladas):
+    python -m pytest tests/test_executor.py -q
+"""
+
+import time
+import asyncio
+import threading
+
+from app.core import executor
+from app.core.executor import run_blocking, run_parallel_parcial
+
+
+def test_falhas_e_atrasadas_ficam_de_fora():
+    liberar = threading.Event()
+
+    def _falha():
+        raise RuntimeError("HTTP 500")
+
+    resultados = run_parallel_parcial({
+        "ok": (lambda: ["evento"],),
+        "erro": (_falha,),
+        "lenta": (liberar.wait, 5),
+    }, timeout=0.2, etapa="Teste")
+    liberar.set()
+
+    assert resultados == {"ok": ["evento"]}
+
+
+def test_atrasadas_nao_ocupam_o_pool_do_webhook():
+    liberar = threading.Event()
+    tarefas = {f"cal{i}": (liberar.wait, 5) for i in range(executor.CALENDAR_FETCH_POOL_SIZE * 2)}
+
+    try:
+        assert run_parallel_parcial(tarefas, timeout=0.1, etapa="Teste") == {}
+
+        # Com o pool parcial lotado, o run_blocking continua respondendo na hora
+        async def _webhook():
+            inicio = time.perf_counter()
+            await asyncio.gather(*[run_blocking(lambda: None) for _ in range(executor.BLOCKING_POOL_SIZE)])
+            return time.perf_counter() - inicio
+
+        assert asyncio.run(_webhook()) < 1
+    finally:
+        liberar.set()
@@ -0,0 +1,178 @@
+"""
+Equivalência do slot_engine com o loop antigo de _calcular_slots_livres
+(cursor de 5 em 5 minutos testando colisão com cada evento).
+
+Uso (na pasta backend, com as dependências instaladas):
+    python -m pytest tests/test_slot_engine.py -q
+"""
+
+import random
+import datetime as dt
+import pytest
+
+from app.core.database import TIMEZONE_BR, SLOT_CONSULTA
+from app.services.slot_engine import (
+    MascaraDia,
+    OcupacaoDia,
+    calcular_slots_livres,
+    mesclar_intervalos,
+)
+
+DIA = dt.date(2026, 3, 10)  # terça-feira
+UTC = dt.timezone.utc
+
+
+def slots_loop_antigo(eventos, data_base, abertura, fechamento, duracao, eventos_ignorar=(), agora=None):
+    """
+    Reprodução do loop anterior ao slot_engine (mesma regra de "hoje":
+    agora + 1h arredondado para o próximo múltiplo de SLOT_CONSULTA).
+    """
+    tz = TIMEZONE_BR
+    meia_noite = dt.datetime.combine(data_base, dt.time.min, tzinfo=tz)
+    inicio_expediente = meia_noite + dt.timedelta(minutes=abertura)
+    fim_expediente = meia_noite + dt.timedelta(minutes=fechamento)
+    duracao_consulta = dt.timedelta(minutes=duracao)
+    cursor = inicio_expediente
+
+    agora = agora or dt.datetime.now(tz)
+    if data_base == agora.date():
+        margem = agora + dt.timedelta(hours=1)
+        if margem > cursor:
+            cursor = margem
+            resto = cursor.minute % SLOT_CONSULTA
+            if resto > 0:
+                cursor += dt.timedelta(minutes=SLOT_CONSULTA - resto)
+            cursor = cursor.replace(second=0, microsecond=0)
+
+    livres = []
+    while cursor + duracao_consulta <= fim_expediente:
+        slot_inicio, slot_fim = cursor, cursor + duracao_consulta
+        esta_livre = True
+        for e in eventos:
+            if e.get('id') in eventos_ignorar:
+                continue
+            if 'date' in e['start']:
+                esta_livre = False
+                break
+            start_evt = dt.datetime.fromisoformat(e['start']['dateTime'])
+            end_evt = dt.datetime.fromisoformat(e['end']['dateTime'])
+            if slot_inicio < end_evt and slot_fim > start_evt:
+                esta_livre = False
+                break
+        if esta_livre:
+            livres.append(slot_inicio)
+        cursor += dt.timedelta(minutes=SLOT_CONSULTA)
+    return livres
+
+
+def evento(id, inicio, fim, tz=TIMEZONE_BR, dia=DIA):
+    """
+    Evento com horário (inicio/fim em 'HH:MM' ou 'HH:MM:SS' no dia).
+    """
+    def _iso(hora):
+        return dt.datetime.combine(dia, dt.time.fromisoformat(hora), tzinfo=TIMEZONE_BR).astimezone(tz).isoformat()
+    return {'id': id, 'start': {'dateTime': _iso(inicio)}, 'end': {'dateTime': _iso(fim)}}
+
+
+def evento_dia_todo(id, dia=DIA):
+    return {'id': id, 'start': {'date': dia.isoformat()}, 'end': {'date': (dia + dt.timedelta(days=1)).isoformat()}}
+
+
+def novo(eventos, data_base, abertura, fechamento, duracao, eventos_ignorar=(), agora=None):
+    ocupacao = OcupacaoDia.de_eventos(eventos, data_base)
+    return calcular_slots_livres(
+        ocupacao, data_base, abertura, fechamento,
+        duracao_minutos=duracao, eventos_ignorar=eventos_ignorar,
+        agora=agora or dt.datetime.combine(DIA - dt.timedelta(days=1), dt.time(12), tzinfo=TIMEZONE_BR),
+    )
+
+
+def antigo(eventos, data_base, abertura, fechamento, duracao, eventos_ignorar=(), agora=None):
+    return slots_loop_antigo(
+        eventos, data_base, abertura, fechamento, duracao, eventos_ignorar,
+        agora=agora or dt.datetime.combine(DIA - dt.timedelta(days=1), dt.time(12), tzinfo=TIMEZONE_BR),
+    )
+
+
+CASOS = {
+    "dia_livre": [],
+    "um_evento": [evento("a", "10:00", "11:00")],
+    "sobrepostos": [evento("a", "09:00", "10:30"), evento("b", "10:00", "11:00"), evento("c", "10:15", "10:45")],
+    "encostados": [evento("a", "09:00", "10:00"), evento("b", "10:00", "11:00")],
+    "segundos_quebrados": [evento("a", "10:00:30", "10:59:30"), evento("b", "14:02:10", "14:07:50")],
+    "fora_do_expediente": [evento("a", "06:00", "08:10"), evento("b", "17:50", "20:00")],
+    "outro_fuso": [evento("a", "13:00", "14:00", tz=UTC)],
+    "atravessa_meia_noite": [evento("a", "23:00", "23:59", dia=DIA - dt.timedelta(days=1)) | {
+        'end': {'dateTime': dt.datetime.combine(DIA, dt.time(9, 30), tzinfo=TIMEZONE_BR).isoformat()}
+    }],
+    "dia_todo": [evento_dia_todo("feriado"), evento("a", "10:00", "11:00")],
+}
+
+
+@pytest.mark.parametrize("nome", sorted(CASOS))
+@pytest.mark.parametrize("duracao", [5, 15, 30, 60, 90])
+def test_equivale_ao_loop_antigo(nome, duracao):
+    eventos = CASOS[nome]
+    assert novo(eventos, DIA, 8 * 60, 18 * 60, duracao) == antigo(eventos, DIA, 8 * 60, 18 * 60, duracao)
+
+
+def test_dia_todo_bloqueia_e_pode_ser_ignorado():
+    eventos = [evento_dia_todo("consulta-paciente")]
+    assert novo(eventos, DIA, 8 * 60, 18 * 60, 60) == []
+    assert novo(eventos, DIA, 8 * 60, 18 * 60, 60, eventos_ignorar=["consulta-paciente"]) == \
+        antigo(eventos, DIA, 8 * 60, 18 * 60, 60, eventos_ignorar=["consulta-paciente"])
+
+
+def test_eventos_do_paciente_sao_ignorados():
+    eventos = [evento("meu", "10:00", "11:00"), evento("outro", "14:00", "15:00")]
+    assert novo(eventos, DIA, 8 * 60, 18 * 60, 60, eventos_ignorar=["meu"]) == \
+        antigo(eventos, DIA, 8 * 60, 18 * 60, 60, eventos_ignorar=["meu"])
+
+
+@pytest.mark.parametrize("hora_agora", ["06:00", "07:05", "08:00", "09:12:40", "10:15:30", "13:00", "17:30", "19:00"])
+def test_arredondamento_de_hoje(hora_agora):
+    agora = dt.datetime.combine(DIA, dt.time.fromisoformat(hora_agora), tzinfo=TIMEZONE_BR)
+    eventos = CASOS["sobrepostos"]
+    assert novo(eventos, DIA, 8 * 60, 18 * 60, 30, agora=agora) == \
+        antigo(eventos, DIA, 8 * 60, 18 * 60, 30, agora=agora)
+
+
+def test_expediente_fora_da_grade():
+    # Abertura 08:03: a grade segue a abertura em dias futuros
+    eventos = CASOS["um_evento"]
+    assert novo(eventos, DIA, 8 * 60 + 3, 17 * 60 + 58, 30) == antigo(eventos, DIA, 8 * 60 + 3, 17 * 60 + 58, 30)
+
+
+def test_aleatorio_muitos_eventos():
+    rnd = random.Random(42)
+    for _ in range(50):
+        eventos = []
+        for n in range(rnd.randint(0, 120)):
+            inicio = rnd.randint(6 * 60, 19 * 60)
+            fim = inicio + rnd.randint(1, 120)
+            h = lambda m: f"{min(m, 23 * 60 + 59) // 60:02d}:{min(m, 23 * 60 + 59) % 60:02d}:{rnd.randint(0, 59):02d}"
+            eventos.append(evento(f"e{n}", h(inicio), h(fim)))
+        ignorar = [e['id'] for e in eventos if rnd.random() < 0.1]
+        duracao = rnd.choice([5, 10, 30, 45, 60, 120])
+        assert novo(eventos, DIA, 8 * 60, 18 * 60, duracao, ignorar) == \
+            antigo(eventos, DIA, 8 * 60, 18 * 60, duracao, ignorar)
+
+
+def test_ocupacao_sobrevive_ao_cache():
+    ocupacao = OcupacaoDia.de_eventos(CASOS["sobrepostos"] + CASOS["dia_todo"], DIA)
+    copia = OcupacaoDia.desempacotar(ocupacao.empacotar())
+    assert copia.eventos == ocupacao.eventos
+    assert copia.dia_todo == ocupacao.dia_todo
+
+
+def test_mesclar_intervalos():
+    assert mesclar_intervalos([(60, 90), (0, 30), (30, 45), (80, 120)]) == [(0, 45), (60, 120)]
+
+
+@pytest.mark.parametrize("duracao", [0, -30])
+def test_duracao_invalida(duracao):
+    mascara = MascaraDia(8 * 60, 18 * 60, [])
+    with pytest.raises(ValueError):
+        mascara.inicios_livres(duracao)
+    with pytest.raises(ValueError):
+        calcular_slots_livres(OcupacaoDia([], []), DIA, 8 * 60, 18 * 60, duracao_minutos=duracao)
@@ -3,6 +3,7 @@
 import { useEffect, useState } from "react"
 import { useRouter } from "next/navigation"
 import { getSupabaseBrowserClient } from "@/lib/supabase-client"
+import { serverFetch } from "@/actions/api-proxy"
 import { Button } from "@/components/ui/button"
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card"
 import {
@@ -210,6 +211,10 @@ export default function ClinicsManagementPage() {
         throw new Error(data.error || 'Erro ao criar clínica')
       }
 
+      if (data.clinic?.id) {
+        await invalidarCacheClinica(data.clinic.id)
+      }
+
       setSuccess("Clínica e usuário criados com sucesso!")
       setIsDialogOpen(false)
       resetForm()
@@ -220,6 +225,14 @@ export default function ClinicsManagementPage() {
     }
   }
 
+  // As escritas vão direto para o Supabase: avisa o backend para descartar a clínica e o contexto da IA em cache
+  const invalidarCacheClinica = async (clinicId: string) => {
+    const res = await serverFetch(`${process.env.NEXT_PUBLIC_API_URL || ""}/clinics/${clinicId}/context/invalidate`, { method: 'POST' })
+    if (!res.ok) {
+      logger.error('Erro ao invalidar cache da clínica:', res.error)
+    }
+  }
+
   const handleUpdate = async () => {
     if (!currentClinic) return
 
@@ -248,6 +261,9 @@ export default function ClinicsManagementPage() {
 
       if (error) throw error
 
+      // ia_ativa, prompt_ia e tipo_calendario são lidos do cache pelo backend (webhook/IA)
+      await invalidarCacheClinica(currentClinic.id)
+
       setSuccess("Clínica atualizada com sucesso!")
       setIsDialogOpen(false)
       resetForm()
@@ -274,6 +290,8 @@ export default function ClinicsManagementPage() {
 
       if (error) throw error
 
+      await invalidarCacheClinica(clinic.id)
+
       setSuccess("Clínica excluída com sucesso!")
       loadClinics()
     } catch (error: any) {
@@ -460,6 +460,10 @@ export default function ClinicDashboard() {
 
       if (updateError) throw updateError
 
+      // A escrita vai direto para o Supabase: avisa o backend para descartar a clínica em cache
+      // (webhook e worker leem ia_ativa do cache; sem isso a IA seguiria respondendo até o TTL)
+      await serverFetch(`${process.env.NEXT_PUBLIC_API_URL}/clinics/${clinicData.id}/context/invalidate`, { method: 'POST' })
+
       setClinicData({ ...clinicData, ia_ativa: newIAStatus })
       setSuccess(newIAStatus ? "IA ativada com sucesso!" : "IA desativada com sucesso!")
 
@@ -812,6 +816,9 @@ Prontinho! Remarquei para amanhã às 9h. Até lá!`
 
       if (error) throw error
 
+      // Prompt e horários mudaram direto no Supabase: descarta o contexto da IA em cache
+      await serverFetch(`${process.env.NEXT_PUBLIC_API_URL}/clinics/${clinicData.id}/context/invalidate`, { method: 'POST' })
+
       setClinicData({
         ...clinicData,
         prompt_ia: generatedPrompt,
@@ -313,6 +313,13 @@ export default function SettingsPage() {
     }
   }
 
+  // As escritas vão direto para o Supabase: avisa o backend para descartar o contexto da IA em cache
+  const invalidarContextoIA = async () => {
+    if (!clinicData?.id) return
+    const apiUrl = process.env.NEXT_PUBLIC_API_URL
+    await serverFetch(`${apiUrl}/clinics/${clinicData.id}/context/invalidate`, { method: 'POST' })
+  }
+
   const handleAddProfissional = async () => {
     if (!clinicData || !profissionalForm.nome || !profissionalForm.especialidade || !profissionalForm.genero) {
       setProfissionalError("Preencha todos os campos obrigatórios")
@@ -351,6 +358,7 @@ export default function SettingsPage() {
       }
 
       setProfissionais([...profissionais, newProfissional])
+      await invalidarContextoIA()
       setIsAddProfissionalOpen(false)
       setProfissionalForm({ nome: '', especialidade: '', genero: '', external_calendar_id: 'primary' })
       setProfissionalSuccess('Profissional adicionado com sucesso!')
@@ -400,6 +408,7 @@ export default function SettingsPage() {
         throw new Error('Nenhum dado retornado após atualização')
       }
 
+      await invalidarContextoIA()
       setProfissionais(profissionais.map(p =>
         p.id === editingProfissionalId ? updatedProfissional : p
       ))
@@ -451,6 +460,7 @@ export default function SettingsPage() {
         .eq('id', deletingProfissionalId)
 
       if (deleteError) throw deleteError
+      await invalidarContextoIA()
 
       setProfissionais(profissionais.filter(p => p.id !== deletingProfissionalId))
       setIsDeleteProfissionalOpen(false)
@@ -531,6 +541,7 @@ export default function SettingsPage() {
         .eq('id', clinicData.id)
 
       if (updateError) throw updateError
+      await invalidarContextoIA()
 
       // Atualizar estado com telefone sem formatação
       const updatedData = { ...clinicData, ...formData, telefone: telefoneClean }
@@ -588,6 +599,7 @@ export default function SettingsPage() {
         .eq('id', clinicData.id)
 
       if (updateError) throw updateError
+      await invalidarContextoIA()
 
       setClosedDays(updatedDays)
       setNewClosedDay('')
@@ -624,6 +636,7 @@ export default function SettingsPage() {
         .eq('id', clinicData.id)
 
       if (updateError) throw updateError
+      await invalidarContextoIA()
 
       setClosedDays(updatedDays)
       setSuccess('Dia fechado removido com sucesso')
@@ -681,6 +694,7 @@ export default function SettingsPage() {
         .eq('id', clinicData.id)
 
       if (updateError) throw updateError
+      await invalidarContextoIA()
 
       setClosedDays(updatedDays)
       setSuccess('Dia fechado atualizado com sucesso')
@@ -732,6 +746,7 @@ export default function SettingsPage() {
         })
         .eq('id', clinicData.id)
       if (updateError) throw updateError
+      await invalidarContextoIA()
       setConvenios(filteredConvenios)
       setClinicData({ ...clinicData, convenios: filteredConvenios, prompt_ia: currentPrompt })
       setFormData(prev => ({ ...prev, prompt_ia: currentPrompt }))
@@ -119,6 +119,8 @@ export function SubscriptionGuard({ children }: { children: React.ReactNode }) {
               .eq('id', profile.clinic_id)
               .then(() => {
                 logger.log(`🔒 IA desativada para clínica ${profile.clinic_id} (data_fim passou)`)
+                // Descarta a clínica em cache no backend para a IA parar de responder na hora
+                return serverFetch(`${process.env.NEXT_PUBLIC_API_URL || ""}/clinics/${profile.clinic_id}/context/invalidate`, { method: 'POST' })
               })
               .catch((error: any) => {
                 logger.error('Erro ao desativar IA:', error)
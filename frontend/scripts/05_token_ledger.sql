@@ -0,0 +1,102 @@
+-- Ledger de tokens da IA
+-- O backend acumula o consumo no Redis e aplica os deltas periodicamente
+-- com aplicar_consumo_tokens (um UPDATE atômico por clínica, sem read-modify-write),
+-- identificados por flush_id para que um lote reenviado não debite duas vezes.
+-- Cada interação fica registrada em uso_tokens (append-only, para auditoria).
+
+-- 1. Histórico de consumo (append-only)
+CREATE TABLE IF NOT EXISTS uso_tokens (
+  id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  clinic_id uuid NOT NULL REFERENCES clinicas(id) ON DELETE CASCADE,
+  tokens INTEGER NOT NULL,
+  custo_usd NUMERIC(12,6) NOT NULL DEFAULT 0,
+  telefone TEXT,
+  criado_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_uso_tokens_clinic_criado ON uso_tokens (clinic_id, criado_em DESC);
+
+-- Escrita apenas pelo backend (service role); a clínica só lê o próprio consumo
+ALTER TABLE public.uso_tokens ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "super_admin_select_uso_tokens" ON public.uso_tokens;
+DROP POLICY IF EXISTS "clinic_admin_select_own_uso_tokens" ON public.uso_tokens;
+
+CREATE POLICY "super_admin_select_uso_tokens"
+    ON public.uso_tokens
+    FOR SELECT
+    TO authenticated
+    USING (public.get_user_role(auth.uid()) = 'super_admin');
+
+CREATE POLICY "clinic_admin_select_own_uso_tokens"
+    ON public.uso_tokens
+    FOR SELECT
+    TO authenticated
+    USING (
+        clinic_id = (SELECT clinic_id FROM public.profiles WHERE id = auth.uid())
+    );
+
+-- 2. Lotes já aplicados (idempotência do flush)
+-- O backend reenvia o mesmo flush_id quando não sabe se a RPC foi aplicada
+-- (erro na resposta, queda do scheduler); a chave primária impede o débito duplicado.
+CREATE TABLE IF NOT EXISTS ledger_lotes_aplicados (
+  flush_id TEXT NOT NULL,
+  clinic_id uuid NOT NULL REFERENCES clinicas(id) ON DELETE CASCADE,
+  aplicado_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (flush_id, clinic_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ledger_lotes_aplicado_em ON ledger_lotes_aplicados (aplicado_em);
+
+-- Uso interno do backend (service role), sem policies
+ALTER TABLE public.ledger_lotes_aplicados ENABLE ROW LEVEL SECURITY;
+
+-- 3. Débito atômico: consome saldo_tokens (plano) primeiro e o restante de tokens_comprados.
+-- Se (p_flush_id, p_clinic_id) já foi aplicado, só devolve o saldo atual.
+DROP FUNCTION IF EXISTS aplicar_consumo_tokens(uuid, BIGINT, NUMERIC);
+
+CREATE OR REPLACE FUNCTION aplicar_consumo_tokens(p_clinic_id uuid, p_tokens BIGINT, p_custo_usd NUMERIC, p_flush_id TEXT)
+RETURNS JSON
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  resultado JSON;
+BEGIN
+  INSERT INTO ledger_lotes_aplicados (flush_id, clinic_id)
+  VALUES (p_flush_id, p_clinic_id)
+  ON CONFLICT DO NOTHING;
+
+  IF NOT FOUND THEN
+    SELECT json_build_object('saldo_tokens', c.saldo_tokens, 'tokens_comprados', c.tokens_comprados)
+    INTO resultado
+    FROM clinicas c
+    WHERE c.id = p_clinic_id;
+    RETURN resultado;
+  END IF;
+
+  UPDATE clinicas c SET
+    saldo_tokens = GREATEST(0, COALESCE(c.saldo_tokens, 0) - p_tokens),
+    tokens_comprados = GREATEST(
+      0,
+      COALESCE(c.tokens_comprados, 0) - GREATEST(0, p_tokens - GREATEST(COALESCE(c.saldo_tokens, 0), 0))
+    ),
+    custo_usd = COALESCE(c.custo_usd, 0) + p_custo_usd
+  WHERE c.id = p_clinic_id
+  RETURNING json_build_object('saldo_tokens', c.saldo_tokens, 'tokens_comprados', c.tokens_comprados)
+  INTO resultado;
+
+  RETURN resultado;
+END;
+$$;
+
+-- 4. Crédito atômico de tokens comprados (pagamento confirmado no Asaas)
+CREATE OR REPLACE FUNCTION creditar_tokens_comprados(p_clinic_id uuid, p_tokens BIGINT)
+RETURNS JSON
+LANGUAGE sql
+AS $$
+  UPDATE clinicas c SET
+    tokens_comprados = COALESCE(c.tokens_comprados, 0) + p_tokens,
+    ia_ativa = true
+  WHERE c.id = p_clinic_id
+  RETURNING json_build_object('tokens_comprados', c.tokens_comprados);
+$$;